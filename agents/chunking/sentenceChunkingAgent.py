@@ -2,6 +2,9 @@ import re
 
 class SentenceChunkingAgent:
 
+    ## Holds no unpicklable state, so it can be sent to chunking worker processes
+    picklable = True
+
     def __init__(self):
         self.name = 'FL_Sentence'
 
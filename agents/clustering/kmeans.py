@@ -1,19 +1,26 @@
 from sklearn.cluster import KMeans
-from typing import List
+import numpy as np
 from ...helpers.embeddings import Embeddings
+from ...helpers.utils.segments import segment_one_hot
 
 class KMeansClusteringAgent:
-    def __init__(self, topic_count: int):
+    ndarray_native = True
+
+    def __init__(self, topic_count: int, sample_size: int = None):
         """
         Initializes the KMeansClusteringAgent.
 
         Args:
             name (str): The name of the agent.
             topic_count (int): The number of clusters (topics) to learn.
+            sample_size (int): Train on a person-balanced sample of this many embeddings (see Embeddings.getBalancedSample)
+                               instead of every embedding. Sampled agents get their own name, and so their own results.
         """
-        self.name = f'KMEANSx{topic_count}'
+        self.name = f'KMEANSx{topic_count}' if sample_size is None else f'KMEANSx{topic_count}s{sample_size}'
         self.topic_count = topic_count
+        self.sample_size = sample_size
         self._kmeans = KMeans(n_clusters=topic_count, random_state=42)
+        self._centers = None
         self._is_trained = False
         self._embeddings = None
 
@@ -33,38 +40,74 @@ class KMeansClusteringAgent:
         if self._embeddings is None:
             raise Exception("Embeddings must be passed before training.")
 
-        # Retrieve all embeddings from the Embeddings object
-        all_embeddings = self._embeddings.getAllEmbeddings()
+        # Retrieve all embeddings (or a person-balanced sample) from the Embeddings object
+        all_embeddings = self._embeddings.getAllEmbeddings() if self.sample_size is None else self._embeddings.getBalancedSample(self.sample_size)
 
-        if not all_embeddings:
+        if len(all_embeddings) == 0:
             raise Exception("No embeddings found for training.")
 
         # Fit the KMeans model
         self._kmeans.fit(all_embeddings)
+        self._centers = self._kmeans.cluster_centers_.astype(np.float32)
+        self._is_trained = True
+
+    def get_centers(self) -> np.ndarray:
+        """
+        Returns the (topic_count, dim) learned centers, or None before training.
+        """
+        return self._centers
+
+    def get_center_weights(self) -> np.ndarray:
+        return None
+
+    def load_centers(self, centers: np.ndarray, weights: np.ndarray = None):
+        """
+        Restores centers persisted by an earlier run, so results can be generated without refitting.
+        """
+        assert len(centers) == self.topic_count, "Incompatible topic_count being loaded"
+        self._centers = np.array(centers, dtype=np.float32)
+
+    def finish_training(self):
+        if self._centers is None:
+            raise Exception("Centers must be learned or loaded before finishing training.")
         self._is_trained = True
 
-    def generate_result(self, person_embeddings: List[List[int]]) -> List[int]:
+    def generate_result(self, person_embeddings: np.ndarray) -> np.ndarray:
         """
         Generates a binary topic membership vector for a set of person embeddings.
 
         Args:
-            person_embeddings (List[List[int]]): A list of embeddings for a person.
+            person_embeddings (np.ndarray): A (n, dim) float32 matrix of a person's embeddings.
 
         Returns:
-            List[int]: A binary vector indicating the topics (clusters) the person belongs to.
+            np.ndarray: A binary uint8 vector indicating the topics (clusters) the person belongs to.
         """
         if not self._is_trained:
             raise Exception("Train must be called before generating results.")
 
-        # Predict the clusters for each embedding
-        cluster_assignments = self._kmeans.predict(person_embeddings)
+        return self.generate_results_batch(person_embeddings, np.array([0, len(person_embeddings)]))[0]
+
+    def generate_results_batch(self, embeddings: np.ndarray, offsets: np.ndarray) -> np.ndarray:
+        """
+        Generates the binary topic membership vectors of many persons in one pass.
+
+        Args:
+            embeddings (np.ndarray): The (n, dim) float32 embeddings of several persons, stacked.
+            offsets (np.ndarray): Person i owns rows offsets[i]:offsets[i + 1] (so offsets[0] == 0 and offsets[-1] == n).
+
+        Returns:
+            np.ndarray: A (len(offsets) - 1, topic_count) binary uint8 matrix, one row per person.
+        """
+        if not self._is_trained:
+            raise Exception("Train must be called before generating results.")
 
-        # Generate a binary vector indicating topic membership
-        result_vector = [0] * self.topic_count
-        for cluster in cluster_assignments:
-            result_vector[cluster] = 1
+        # Assign each embedding to its nearest center, as KMeans.predict does: argmin ||c||^2 - 2 x.c
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        distances = np.sum(self._centers ** 2, axis=1) - 2 * embeddings @ self._centers.T
+        cluster_assignments = np.argmin(distances, axis=1)
 
-        return result_vector
+        # Generate a binary vector per person indicating topic membership
+        return segment_one_hot(cluster_assignments, offsets, self.topic_count)
 
     def is_finished_training(self) -> bool:
         """
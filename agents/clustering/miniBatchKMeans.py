@@ -0,0 +1,132 @@
+from sklearn.cluster import kmeans_plusplus
+import numpy as np
+from ...helpers.embeddings import Embeddings
+from ...helpers.utils.segments import segment_one_hot
+
+class MiniBatchKMeansClusteringAgent:
+    """
+    Streaming k-means (Sculley's mini-batch update, as in sklearn's MiniBatchKMeans.partial_fit) over
+    person-balanced epoch batches: epoch e takes each person's embedding `e % total_embeddings`,
+    so every person weighs the same regardless of how many chunks they have. Only one batch is
+    in memory at a time.
+
+    The whole training state is the centers plus how many embeddings each has absorbed, so the
+    ResearchRunner checkpoints it after every batch and resumes mid-epoch after a crash.
+    """
+    ndarray_native = True
+    streaming = True
+
+    def __init__(self, topic_count: int, epochs: int = 10, batch_size: int = 1024, random_state: int = 42):
+        """
+        Args:
+            topic_count (int): The number of clusters (topics) to learn.
+            epochs (int): Passes over the persons, each with a different embedding per person.
+            batch_size (int): Embeddings per mini-batch update. Must be at least topic_count.
+            random_state (int): Seeds the k-means++ initialization on the first batch.
+        """
+        assert batch_size >= topic_count, "batch_size must be at least topic_count"
+
+        self.name = f'MBKMEANSx{topic_count}'
+        self.topic_count = topic_count
+        self.epochs = epochs
+        self.batch_size = batch_size
+        self.random_state = random_state
+        self._centers = None
+        self._weights = None
+        self._is_trained = False
+        self._embeddings = None
+
+    def pass_embeddings(self, embeddings: Embeddings):
+        self._embeddings = embeddings
+
+    def train(self):
+        """
+        Runs every epoch in one go, without checkpoints (the ResearchRunner drives partial_fit itself).
+        """
+        if self._embeddings is None:
+            raise Exception("Embeddings must be passed before training.")
+
+        for epoch in range(self.epochs):
+            start_row = 0
+            while True:
+                last_id, batch = self._embeddings.getEmbeddingBatch(start_row, self.batch_size, epoch)
+                if len(batch) == 0:
+                    break
+                self.partial_fit(batch)
+                start_row = last_id + 1
+
+        if self._centers is None:
+            raise Exception("No embeddings found for training.")
+        self.finish_training()
+
+    def partial_fit(self, batch: np.ndarray):
+        """
+        Updates the centers with one (n, dim) batch: each center moves towards the mean of its assigned
+        embeddings with a learning rate of 1 / (embeddings it has absorbed so far).
+        """
+        batch = np.asarray(batch, dtype=np.float32)
+        if self._centers is None:
+            if len(batch) < self.topic_count:
+                raise Exception(f"The first batch needs at least {self.topic_count} embeddings to initialize the centers.")
+            self._centers, _ = kmeans_plusplus(batch, self.topic_count, random_state=self.random_state)
+            self._centers = self._centers.astype(np.float32)
+            self._weights = np.zeros(self.topic_count, dtype=np.float64)
+
+        labels = self._assign(batch)
+        counts = np.bincount(labels, minlength=self.topic_count)
+        sums = np.zeros_like(self._centers, dtype=np.float64)
+        np.add.at(sums, labels, batch)
+
+        updated = counts > 0
+        self._weights[updated] += counts[updated]
+        step = (sums[updated] - counts[updated, None] * self._centers[updated]) / self._weights[updated, None]
+        self._centers[updated] += step.astype(np.float32)
+
+    def get_centers(self) -> np.ndarray:
+        return self._centers
+
+    def get_center_weights(self) -> np.ndarray:
+        return self._weights
+
+    def load_centers(self, centers: np.ndarray, weights: np.ndarray):
+        """
+        Restores a checkpoint taken with get_centers / get_center_weights.
+        """
+        assert len(centers) == self.topic_count, "Incompatible topic_count being loaded"
+        self._centers = np.array(centers, dtype=np.float32)
+        self._weights = np.array(weights, dtype=np.float64)
+
+    def finish_training(self):
+        if self._centers is None:
+            raise Exception("Centers must be learned or loaded before finishing training.")
+        self._is_trained = True
+
+    def generate_result(self, person_embeddings: np.ndarray) -> np.ndarray:
+        """
+        Generates a binary topic membership vector for a set of person embeddings.
+
+        Args:
+            person_embeddings (np.ndarray): A (n, dim) float32 matrix of a person's embeddings.
+
+        Returns:
+            np.ndarray: A binary uint8 vector indicating the topics (clusters) the person belongs to.
+        """
+        return self.generate_results_batch(person_embeddings, np.array([0, len(person_embeddings)]))[0]
+
+    def generate_results_batch(self, embeddings: np.ndarray, offsets: np.ndarray) -> np.ndarray:
+        """
+        Binary topic membership vectors of many persons, whose embeddings are stacked in `embeddings`
+        with person i owning rows offsets[i]:offsets[i + 1]. Returns a (persons, topic_count) uint8 matrix.
+        """
+        if not self._is_trained:
+            raise Exception("Train must be called before generating results.")
+
+        return segment_one_hot(self._assign(np.asarray(embeddings, dtype=np.float32)), offsets, self.topic_count)
+
+    def is_finished_training(self) -> bool:
+        return self._is_trained
+
+    def _assign(self, embeddings: np.ndarray) -> np.ndarray:
+        # argmin ||x - c||^2 = argmin ||c||^2 - 2 x.c, one GEMM per batch
+        distances = np.sum(self._centers ** 2, axis=1) - 2 * embeddings @ self._centers.T
+        return np.argmin(distances, axis=1)
@@ -1,7 +1,10 @@
-from typing import List
+import numpy as np
 from ...helpers.embeddings import Embeddings
+from ...helpers.utils.segments import segment_one_hot
 
 class MockClusteringAgent:
+    ndarray_native = True
+
     def __init__(self, name: str = "MockClusteringAgent", topic_count: int = 3):
         self.name = name
         self.topic_count = topic_count
@@ -26,31 +29,36 @@ class MockClusteringAgent:
             raise Exception("Embeddings must be passed before training.")
         self._is_trained = True
 
-    def generate_result(self, person_embeddings: List[List[int]]) -> List[int]:
+    def generate_result(self, person_embeddings: np.ndarray) -> np.ndarray:
         """
         Generates a mock result vector for a set of person embeddings.
         Each result is a simple deterministic calculation based on the sum of embeddings.
         
         Args:
-            person_embeddings (List[int]): A list of embeddings for a person.
+            person_embeddings (np.ndarray): A (n, dim) matrix of embeddings for a person.
 
         Returns:
-            List[int]: A mock binary vector indicating topic membership.
+            np.ndarray: A mock binary vector indicating topic membership.
         """
         if not self._is_trained:
             raise Exception("Train must be called before generating results.")
 
         # Mock logic: Assign a binary topic vector based on the sum of embeddings
-        result = [0 for _ in range(self.topic_count)]
-        for i in range(len(person_embeddings)): 
-            bucket = int(sum(person_embeddings[i]) * 100) % self.topic_count
-            if 0 <= bucket < self.topic_count:
-                result[bucket] = 1
-            else:
-                raise ValueError(f"Bucket value {bucket} is out of range for topic count {self.topic_count}.")
-
+        result = np.zeros(self.topic_count, dtype=np.uint8)
+        buckets = (np.asarray(person_embeddings).sum(axis=1) * 100).astype(np.int64) % self.topic_count
+        result[buckets] = 1
 
         return result
+
+    def generate_results_batch(self, embeddings: np.ndarray, offsets: np.ndarray) -> np.ndarray:
+        """
+        Mock result vectors for many persons at once, stacked in `embeddings` with person i owning rows offsets[i]:offsets[i + 1].
+        """
+        if not self._is_trained:
+            raise Exception("Train must be called before generating results.")
+
+        buckets = (np.asarray(embeddings).sum(axis=1) * 100).astype(np.int64) % self.topic_count
+        return segment_one_hot(buckets, offsets, self.topic_count)
         
     def is_finished_training(self) -> bool:
         """
@@ -0,0 +1,148 @@
+from sklearn.cluster import kmeans_plusplus
+import numpy as np
+from ...helpers.embeddings import Embeddings
+from ...helpers.utils.segments import segment_one_hot
+
+## Rows assigned per GEMM, bounding the (rows, topic_count) similarity matrix kept in memory
+ASSIGN_BLOCK_SIZE = 65536
+
+class SphericalKMeansClusteringAgent:
+    """
+    Spherical k-means: embeddings are L2-normalized at ingest and clustered by cosine similarity,
+    the metric sentence embeddings are trained for. Centers are kept unit length, so assigning an
+    embedding is a single float32 GEMM plus argmax (no squared-norm terms), in training and in results.
+    """
+    ndarray_native = True
+
+    def __init__(self, topic_count: int, max_iter: int = 100, tol: float = 1e-6, random_state: int = 42, sample_size: int = None):
+        """
+        Args:
+            topic_count (int): The number of clusters (topics) to learn.
+            max_iter (int): Maximum number of assignment / update rounds.
+            tol (float): Training stops once the mean cosine similarity to the assigned centers improves by less than this.
+            random_state (int): Seeds the k-means++ initialization.
+            sample_size (int): Train on a person-balanced sample of this many embeddings (see Embeddings.getBalancedSample)
+                               instead of every embedding. Sampled agents get their own name, and so their own results.
+        """
+        self.name = f'SPHKMEANSx{topic_count}' if sample_size is None else f'SPHKMEANSx{topic_count}s{sample_size}'
+        self.topic_count = topic_count
+        self.sample_size = sample_size
+        self.max_iter = max_iter
+        self.tol = tol
+        self.random_state = random_state
+        self._centers = None
+        self._weights = None
+        self._is_trained = False
+        self._embeddings = None
+
+    def pass_embeddings(self, embeddings: Embeddings):
+        self._embeddings = embeddings
+
+    def train(self):
+        """
+        Trains spherical k-means on every passed embedding.
+        """
+        if self._embeddings is None:
+            raise Exception("Embeddings must be passed before training.")
+
+        data = normalize(self._embeddings.getAllEmbeddings() if self.sample_size is None else self._embeddings.getBalancedSample(self.sample_size, self.random_state))
+        if len(data) < self.topic_count:
+            raise Exception(f"At least {self.topic_count} embeddings are needed for training.")
+
+        # k-means++ on the unit sphere, where squared distance is 2 - 2 * cosine
+        self._centers, _ = kmeans_plusplus(data, self.topic_count, random_state=self.random_state)
+        self._centers = normalize(self._centers)
+
+        objective = -np.inf
+        for _ in range(self.max_iter):
+            labels, similarities = self._assign(data)
+            self._centers, self._weights = self.__update_centers(data, labels, similarities)
+
+            previous, objective = objective, float(np.mean(similarities))
+            if objective - previous < self.tol:
+                break
+
+        self._is_trained = True
+
+    def get_centers(self) -> np.ndarray:
+        return self._centers
+
+    def get_center_weights(self) -> np.ndarray:
+        """
+        The number of embeddings assigned to each center in the last training round.
+        """
+        return self._weights
+
+    def load_centers(self, centers: np.ndarray, weights: np.ndarray = None):
+        assert len(centers) == self.topic_count, "Incompatible topic_count being loaded"
+        self._centers = normalize(centers)
+        self._weights = None if weights is None else np.array(weights, dtype=np.float64)
+
+    def finish_training(self):
+        if self._centers is None:
+            raise Exception("Centers must be learned or loaded before finishing training.")
+        self._is_trained = True
+
+    def generate_result(self, person_embeddings: np.ndarray) -> np.ndarray:
+        """
+        Generates a binary topic membership vector for a set of person embeddings.
+
+        Args:
+            person_embeddings (np.ndarray): A (n, dim) float32 matrix of a person's embeddings.
+
+        Returns:
+            np.ndarray: A binary uint8 vector indicating the topics (clusters) the person belongs to.
+        """
+        return self.generate_results_batch(person_embeddings, np.array([0, len(person_embeddings)]))[0]
+
+    def generate_results_batch(self, embeddings: np.ndarray, offsets: np.ndarray) -> np.ndarray:
+        """
+        Binary topic membership vectors of many persons, whose embeddings are stacked in `embeddings`
+        with person i owning rows offsets[i]:offsets[i + 1]. Returns a (persons, topic_count) uint8 matrix.
+        """
+        if not self._is_trained:
+            raise Exception("Train must be called before generating results.")
+
+        labels, _ = self._assign(normalize(embeddings))
+        return segment_one_hot(labels, offsets, self.topic_count)
+
+    def is_finished_training(self) -> bool:
+        return self._is_trained
+
+    def _assign(self, data: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Nearest center of each unit-length row, with its cosine similarity.
+        """
+        labels = np.empty(len(data), dtype=np.int64)
+        similarities = np.empty(len(data), dtype=np.float32)
+        centers_t = np.ascontiguousarray(self._centers.T)
+        for start in range(0, len(data), ASSIGN_BLOCK_SIZE):
+            block = data[start:start + ASSIGN_BLOCK_SIZE] @ centers_t
+            labels[start:start + len(block)] = np.argmax(block, axis=1)
+            similarities[start:start + len(block)] = block[np.arange(len(block)), labels[start:start + len(block)]]
+        return labels, similarities
+
+    def __update_centers(self, data: np.ndarray, labels: np.ndarray, similarities: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        # each center becomes the normalized sum of its members (sorted into contiguous runs, then reduced)
+        order = np.argsort(labels, kind='stable')
+        sorted_labels = labels[order]
+        starts = np.flatnonzero(np.r_[True, sorted_labels[1:] != sorted_labels[:-1]])
+        sums = np.zeros_like(self._centers)
+        sums[sorted_labels[starts]] = np.add.reduceat(data[order], starts, axis=0)
+        counts = np.bincount(labels, minlength=self.topic_count).astype(np.float64)
+
+        # empty clusters restart at the embeddings furthest from their centers
+        empty = np.flatnonzero(counts == 0)
+        if len(empty) > 0:
+            sums[empty] = data[np.argsort(similarities)[:len(empty)]]
+
+        return normalize(sums), counts
+
+
+def normalize(matrix: np.ndarray) -> np.ndarray:
+    """
+    L2-normalizes the rows of a matrix into a new float32 array (zero rows stay zero).
+    """
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return np.divide(matrix, norms, out=np.zeros_like(matrix), where=norms > 0)
@@ -0,0 +1,182 @@
+from sklearn.cluster import KMeans
+import numpy as np
+from ...helpers.embeddings import Embeddings
+from ...helpers.utils.segments import segment_one_hot
+
+class TreeKMeansClusteringAgent:
+    """
+    Hierarchical (recursive) k-means for very large topic counts: the embeddings are split into
+    `branching` clusters, each of those into `branching` more, and so on for `depth` levels.
+    The branching ** depth leaves are the topics, so topic ids work unchanged in results and indexes.
+
+    Assigning a chunk walks down the tree, comparing it to `branching` children per level:
+    branching * depth distance computations instead of topic_count.
+
+    The model is stored as the leaf centers and their sizes. Every inner center is the size-weighted
+    mean of the leaves under it (i.e. the mean of its subtree's embeddings), so a tree loaded from the
+    centers table routes exactly like the trained one.
+    """
+    ndarray_native = True
+
+    def __init__(self, branching: int, depth: int, random_state: int = 42, sample_size: int = None):
+        """
+        Args:
+            branching (int): Children per node (at least 2).
+            depth (int): Levels below the root. The agent learns branching ** depth topics.
+            random_state (int): Seeds every node's k-means.
+            sample_size (int): Train on a person-balanced sample of this many embeddings (see Embeddings.getBalancedSample)
+                               instead of every embedding. Sampled agents get their own name, and so their own results.
+        """
+        assert branching >= 2, "branching must be at least 2"
+        assert depth >= 1, "depth must be at least 1"
+
+        self.name = f'TREEKMEANSb{branching}d{depth}' if sample_size is None else f'TREEKMEANSb{branching}d{depth}s{sample_size}'
+        self.branching = branching
+        self.depth = depth
+        self.topic_count = branching ** depth
+        self.random_state = random_state
+        self.sample_size = sample_size
+        self._levels = None  # _levels[l] holds the (branching ** (l + 1), dim) centers of level l + 1
+        self._weights = None
+        self._is_trained = False
+        self._embeddings = None
+
+    def pass_embeddings(self, embeddings: Embeddings):
+        self._embeddings = embeddings
+
+    def train(self):
+        """
+        Splits the passed embeddings level by level, running a `branching`-means on the embeddings of every node.
+        """
+        if self._embeddings is None:
+            raise Exception("Embeddings must be passed before training.")
+
+        data = self._embeddings.getAllEmbeddings() if self.sample_size is None else self._embeddings.getBalancedSample(self.sample_size, self.random_state)
+        data = np.asarray(data, dtype=np.float32)
+        if len(data) == 0:
+            raise Exception("No embeddings found for training.")
+
+        # nodes[i] is the node of row i on the current level (the root is node 0 of level 0)
+        nodes = np.zeros(len(data), dtype=np.int64)
+        parents = data.mean(axis=0, keepdims=True)
+        for level in range(self.depth):
+            children = np.empty((len(parents) * self.branching, data.shape[1]), dtype=np.float32)
+            next_nodes = np.empty_like(nodes)
+            # group rows by node once per level, rather than scanning every row for every node
+            order = np.argsort(nodes, kind='stable')
+            bounds = np.searchsorted(nodes[order], np.arange(len(parents) + 1))
+            for node in range(len(parents)):
+                rows = order[bounds[node]:bounds[node + 1]]
+                centers, labels = self.__split(data[rows], parents[node])
+                children[node * self.branching:(node + 1) * self.branching] = centers
+                next_nodes[rows] = node * self.branching + labels
+            parents, nodes = children, next_nodes
+
+        # leaves are the means of their embeddings; inner centers follow from them
+        counts = np.bincount(nodes, minlength=self.topic_count).astype(np.float64)
+        sums = np.zeros((self.topic_count, data.shape[1]), dtype=np.float64)
+        np.add.at(sums, nodes, data)
+        filled = counts > 0
+        parents[filled] = (sums[filled] / counts[filled, None]).astype(np.float32)
+
+        self.load_centers(parents, counts)
+        self._is_trained = True
+
+    def get_centers(self) -> np.ndarray:
+        """
+        The (topic_count, dim) leaf centers, or None before training.
+        """
+        return None if self._levels is None else self._levels[-1]
+
+    def get_center_weights(self) -> np.ndarray:
+        """
+        The number of training embeddings in each leaf.
+        """
+        return self._weights
+
+    def load_centers(self, centers: np.ndarray, weights: np.ndarray = None):
+        """
+        Rebuilds the tree from its leaf centers and sizes (missing sizes weigh every leaf equally).
+        """
+        assert len(centers) == self.topic_count, "Incompatible topic_count being loaded"
+        weights = np.ones(self.topic_count) if weights is None else np.asarray(weights, dtype=np.float64)
+
+        levels = [np.array(centers, dtype=np.float32)]
+        level_weights = weights
+        for _ in range(self.depth - 1):
+            grouped = levels[0].reshape(-1, self.branching, levels[0].shape[1]).astype(np.float64)
+            grouped_weights = level_weights.reshape(-1, self.branching)
+            totals = grouped_weights.sum(axis=1)
+            # an empty subtree still needs a center to route by, the plain mean of its leaves
+            grouped_weights = np.where(totals[:, None] > 0, grouped_weights, 1)
+            parents = np.einsum('nb,nbd->nd', grouped_weights, grouped) / grouped_weights.sum(axis=1, keepdims=True)
+            levels.insert(0, parents.astype(np.float32))
+            level_weights = totals
+
+        self._levels = levels
+        self._weights = weights
+
+    def finish_training(self):
+        if self._levels is None:
+            raise Exception("Centers must be learned or loaded before finishing training.")
+        self._is_trained = True
+
+    def generate_result(self, person_embeddings: np.ndarray) -> np.ndarray:
+        """
+        Generates a binary topic membership vector for a set of person embeddings.
+
+        Args:
+            person_embeddings (np.ndarray): A (n, dim) float32 matrix of a person's embeddings.
+
+        Returns:
+            np.ndarray: A binary uint8 vector indicating the topics (leaves) the person belongs to.
+        """
+        return self.generate_results_batch(person_embeddings, np.array([0, len(person_embeddings)]))[0]
+
+    def generate_results_batch(self, embeddings: np.ndarray, offsets: np.ndarray) -> np.ndarray:
+        """
+        Binary topic membership vectors of many persons, whose embeddings are stacked in `embeddings`
+        with person i owning rows offsets[i]:offsets[i + 1]. Returns a (persons, topic_count) uint8 matrix.
+        """
+        if not self._is_trained:
+            raise Exception("Train must be called before generating results.")
+
+        return segment_one_hot(self._assign(np.asarray(embeddings, dtype=np.float32)), offsets, self.topic_count)
+
+    def is_finished_training(self) -> bool:
+        return self._is_trained
+
+    def _assign(self, embeddings: np.ndarray) -> np.ndarray:
+        """
+        Leaf of each embedding, found by descending to the nearest of `branching` children on every level.
+        """
+        nodes = np.zeros(len(embeddings), dtype=np.int64)
+        for centers in self._levels:
+            children = centers.reshape(-1, self.branching, centers.shape[1])
+            squared_norms = np.sum(children ** 2, axis=2)
+            next_nodes = np.empty_like(nodes)
+
+            # rows sharing a node are compared to its children with one small GEMM
+            order = np.argsort(nodes, kind='stable')
+            bounds = np.searchsorted(nodes[order], np.arange(len(children) + 1))
+            for node in np.flatnonzero(np.diff(bounds)):
+                rows = order[bounds[node]:bounds[node + 1]]
+                # argmin ||x - c||^2 = argmin ||c||^2 - 2 x.c
+                distances = squared_norms[node] - 2 * embeddings[rows] @ children[node].T
+                next_nodes[rows] = node * self.branching + np.argmin(distances, axis=1)
+            nodes = next_nodes
+        return nodes
+
+    def __split(self, data: np.ndarray, parent: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Splits one node's embeddings into `branching` clusters. Returns the child centers and each row's child.
+        """
+        distinct, labels = np.unique(data, axis=0, return_inverse=True)
+        if len(distinct) < self.branching:
+            # too few distinct embeddings to split: one child each, spare children copy the parent and stay empty
+            centers = np.repeat(parent[None], self.branching, axis=0)
+            centers[:len(distinct)] = distinct
+            return centers, labels.reshape(-1)
+
+        kmeans = KMeans(n_clusters=self.branching, n_init=1, random_state=self.random_state).fit(data)
+        return kmeans.cluster_centers_.astype(np.float32), kmeans.labels_
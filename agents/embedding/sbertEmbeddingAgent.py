@@ -1,24 +1,112 @@
 from sentence_transformers import SentenceTransformer
-from typing import List
+import numpy as np
+import torch
+import time
+from ...helpers.utils.lengthBuckets import length_buckets, padded_token_count
 
 class SBERTEmbeddingAgent:
-    def __init__(self, model_name: str = "all-MiniLM-L6-v2", device: str = 'cuda'):
+    ndarray_native = True
+
+    def __init__(self, model_name: str = "all-MiniLM-L6-v2", device: str = None, token_budget: int = 16384, quantize: bool = False, threads: int = None):
         """
         Initialize the SBERT embedding agent with a specified model.
 
         Args:
             model_name (str): The name of the SBERT model to use. 
                               Defaults to 'all-MiniLM-L6-v2'.
+            device (str): Torch device to run on. Defaults to 'cuda' when available, otherwise 'cpu'.
+            token_budget (int): Maximum padded tokens (batch size * longest chunk) encoded per model batch.
+                                Chunks are sorted by token length and bucketed under this budget.
+            quantize (bool): Apply dynamic int8 quantization to the model's linear layers (CPU only).
+                             Outputs differ slightly from the fp32 model, so the agent gets a distinct name.
+            threads (int): Caps the torch intra-op threads of this process, so several CPU workers
+                           on one node don't oversubscribe the cores. Defaults to torch's own choice.
         """
-        self.name = f"SBERT"
+        self.device = device if device is not None else detect_device()
+        if quantize and self.device != 'cpu':
+            raise ValueError(f"Dynamic int8 quantization only runs on the CPU, not on '{self.device}'")
+        self.threads = None
+        if threads is not None:
+            self.set_threads(threads)
+
+        ## The name keys the embeddings table, so numerically different outputs must not share it
+        self.name = "SBERT-int8" if quantize else "SBERT"
         self.model_name = model_name
-        self.device = device
-        self.model = SentenceTransformer(model_name, device = device)
+        self.quantize = quantize
+        self.token_budget = token_budget
+        self.model = SentenceTransformer(model_name, device = self.device)
+        if quantize:
+            self.model = torch.quantization.quantize_dynamic(self.model, {torch.nn.Linear}, dtype=torch.qint8)
+        self.model.eval()
+
+        # get_sentence_embedding_dimension was renamed in newer sentence-transformers releases
+        get_dimension = getattr(self.model, 'get_embedding_dimension', None) or self.model.get_sentence_embedding_dimension
+        self.dim = get_dimension()
+
+        # Throughput counters, see throughput_report
+        self._chunks = 0
+        self._seconds = 0.0
+        self._tokens = 0
+        self._padded_tokens = 0
+
+
+    def __setstate__(self, state):
+        # the thread cap belongs to the process, so a copy unpickled in a worker process applies it again
+        self.__dict__.update(state)
+        if self.threads is not None:
+            torch.set_num_threads(self.threads)
+
+    def set_threads(self, threads: int):
+        """
+        Caps the torch intra-op threads of this process (see `threads` in __init__).
+        """
+        self.threads = threads
+        torch.set_num_threads(threads)
 
+    def embed(self, texts: list[str]) -> np.ndarray:      
+        """
+        Generate embeddings for the given batch of text, as a (len(texts), dim) float32 matrix.
 
-    def embed(self, texts: list[str]) -> list[list[float]]:      
+        Texts are encoded in length buckets (see length_buckets) and returned in their original order.
         """
-        Generate an embedding for the given batch of text.
+        start = time.perf_counter()
+        embeddings = np.empty((len(texts), self.dim), dtype=np.float32)
+        if len(texts) == 0:
+            return embeddings
+
+        lengths = self._token_lengths(texts)
+        buckets = length_buckets(lengths, self.token_budget)
+        with torch.inference_mode():
+            for bucket in buckets:
+                embeddings[bucket] = self.model.encode([texts[i] for i in bucket], batch_size=len(bucket), convert_to_numpy=True, show_progress_bar=False)
+
+        self._chunks += len(texts)
+        self._seconds += time.perf_counter() - start
+        self._tokens += int(np.sum(lengths))
+        self._padded_tokens += padded_token_count(lengths, buckets)
+        return embeddings
 
+    def throughput_report(self) -> dict:
         """
-        return self.model.encode(texts, convert_to_tensor=True, show_progress_bar=False).cpu().tolist()
\ No newline at end of file
+        Chunks embedded per second and the fraction of padded tokens over every `embed` call so far.
+        """
+        return {
+            'chunks': self._chunks,
+            'chunks_per_sec': self._chunks / self._seconds if self._seconds > 0 else 0.0,
+            'padding_ratio': 1 - self._tokens / self._padded_tokens if self._padded_tokens > 0 else 0.0,
+        }
+
+    def _token_lengths(self, texts: list[str]) -> list[int]:
+        tokenized = self.model.tokenizer(texts, add_special_tokens=True, truncation=True, max_length=self.model.max_seq_length)
+        return [len(ids) for ids in tokenized['input_ids']]
+
+
+def detect_device() -> str:
+    """
+    The best available torch device: 'cuda', then Apple's 'mps', then 'cpu'.
+    """
+    if torch.cuda.is_available():
+        return 'cuda'
+    if hasattr(torch.backends, 'mps') and torch.backends.mps.is_available():
+        return 'mps'
+    return 'cpu'
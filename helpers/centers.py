@@ -1,5 +1,18 @@
 import sqlite3
-import pickle
+import numpy as np
+
+"""
+CREATE TABLE IF NOT EXISTS centers (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, 
+    center BLOB NOT NULL,
+    weight REAL NOT NULL DEFAULT 0
+)
+"""
+
+# Trained topic centers, one row per topic in topic order. Centers are raw little-endian float32 
+# like embeddings (see EmbeddingCodec). `weight` is the number of embeddings a streaming trainer 
+# has assigned to the center so far, which sets its learning rate when training resumes.
+# The caller commits, so centers can be checkpointed together with the training cursor.
 
 class Centers:
     def __init__(self, conn: sqlite3.Connection, table_name: str, topic_count: int): 
@@ -7,63 +20,36 @@ class Centers:
         self.__table_name = table_name
         self.__topic_count = topic_count
 
-    def update_centers(self, new_centers: list[list[int]]): 
+    def update_centers(self, new_centers: np.ndarray, weights: np.ndarray = None): 
+        """
+        Replaces the stored centers with a (topic_count, dim) matrix and optional per-center weights.
+        """
+        new_centers = np.asarray(new_centers, dtype='<f4')
         assert len(new_centers) == self.__topic_count, "Incompatible topic_count being inserted"
+        weights = np.zeros(len(new_centers)) if weights is None else np.asarray(weights, dtype=np.float64)
+        assert len(weights) == len(new_centers), "Expected one weight per center"
 
         cursor = self.__conn.cursor()
 
         cursor.execute(f"DELETE FROM {self.__table_name}")
-        for center in new_centers: 
-            center_blob = pickle.dumps(center)
-            cursor.execute(f"INSERT INTO {self.__table_name} (center) VALUES (?)", [center_blob])
+        cursor.executemany(f"INSERT INTO {self.__table_name} (id, center, weight) VALUES (?, ?, ?)", 
+                           [(i + 1, new_centers[i].tobytes(), float(weights[i])) for i in range(len(new_centers))])
 
-    def get_centers(self) -> list[list[int]]: 
+    def get_centers(self) -> np.ndarray: 
+        """
+        Returns the (topic_count, dim) float32 centers, or None if none are stored.
+        """
         cursor = self.__conn.cursor()
 
-        cursor.execute(f"SELECT center FROM {self.__table_name}")
+        cursor.execute(f"SELECT center FROM {self.__table_name} ORDER BY id ASC")
         blobs = cursor.fetchall()
+        if len(blobs) == 0:
+            return None
 
-        return [pickle.loads(blob[0]) for blob in blobs]
-    
-
-""" 
-def __train_clusters(self): 
-    if self.__current_stage != Stage.CLUSTERING.value: 
-        return 
-    
-    num_epochs = 30
-    batch_size = 1000
+        return np.frombuffer(b''.join(blob[0] for blob in blobs), dtype='<f4').astype(np.float32).reshape(len(blobs), -1)
 
-    curr_epoch = self.__current_epoch
-    curr_index = self.__current_index
-    while curr_epoch < num_epochs:
-        while(True):
-            last_id, embedding_batch = self.embeddings.getEmbeddingBatch(curr_index, batch_size, curr_epoch)
-            if len(embedding_batch) == 0:
-                break
-
-            self.__clustering_agent.batch_train(embedding_batch)
-
-            curr_index = last_id + 1
-            self.metadata.update_current_index(curr_index)
-            self.__current_index = curr_index
-            self.conn.commit()
-        
-        print(f"Finished epoch {curr_epoch}.")
+    def get_weights(self) -> np.ndarray:
+        cursor = self.__conn.cursor()
 
-        curr_epoch += 1
-        curr_index = 0
-        self.metadata.update_current_epoch(curr_epoch)
-        self.metadata.update_current_index(curr_index)
-        self.__current_epoch = curr_epoch
-        self.__current_index = curr_index
-        self.conn.commit()
-    
-    self.metadata.update_current_stage(self.__current_stage + 1)
-    self.metadata.update_current_index(0)
-    self.metadata.update_current_epoch(0)
-    self.__current_stage += 1
-    self.__current_index = 0
-    self.__current_epoch = 0
-    self.conn.commit()
-"""
\ No newline at end of file
+        cursor.execute(f"SELECT weight FROM {self.__table_name} ORDER BY id ASC")
+        return np.array([row[0] for row in cursor.fetchall()], dtype=np.float64)
@@ -0,0 +1,141 @@
+import sqlite3
+import hashlib
+import threading
+import numpy as np
+from .embeddingCodec import EmbeddingCodec
+from .prototypes import EmbeddingAgent
+
+# Generated descriptions repeat many sentences, and every trial with a new chunking or clustering agent 
+# re-embeds chunks we have already embedded with the same model. The cache sits in front of 
+# EmbeddingAgent.embed, keyed by (agent name, model name, sha256 of the chunk), so only misses reach the model.
+# Entries are evicted least-recently-used first once the cache holds more than `max_entries`.
+
+class EmbeddingCache:
+    def __init__(self, conn: sqlite3.Connection, table_name: str, max_entries: int):
+        assert max_entries > 0, "max_entries must be positive"
+
+        self.conn = conn
+        self.table_name = table_name
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        # entries returned by `lookup` that may not be committed yet, so lookups ahead of the writer still hit them
+        self.__unstored = {}
+        self.__last_stored = []
+        self.__lock = threading.Lock()
+
+        cursor = self.conn.cursor()
+        cursor.execute(f"SELECT COALESCE(MAX(last_used), 0), COUNT(*) FROM {table_name}")
+        self.__clock, self.__size = cursor.fetchone()
+
+    def embed(self, embedding_agent: EmbeddingAgent, chunks: list[str]) -> np.ndarray:
+        """
+        Returns the same (len(chunks), dim) float32 matrix as `embedding_agent.embed(chunks)`, 
+        embedding only the chunks that aren't cached yet. The caller is responsible for committing.
+        """
+        embeddings, pending = self.lookup(embedding_agent, chunks)
+        self.store(pending)
+        return embeddings
+
+    def lookup(self, embedding_agent: EmbeddingAgent, chunks: list[str]) -> tuple[np.ndarray, dict]:
+        """
+        Like `embed`, but only reads from the cache. The hits to touch and the new entries to insert are 
+        returned as a pending update for `store`, so they can be written through another connection.
+        """
+        self.__clock += 1
+        agent_name = embedding_agent.name
+        model_name = getattr(embedding_agent, 'model_name', '')
+        pending = {'agent_name': agent_name, 'model_name': model_name, 'clock': self.__clock, 'hits': [], 'entries': []}
+
+        if len(chunks) == 0:
+            return np.empty((0, getattr(embedding_agent, 'dim', 0)), dtype=np.float32), pending
+
+        # Duplicate chunks within the batch are looked up (and embedded) once
+        hashes = [hashlib.sha256(chunk.encode('utf-8')).digest() for chunk in chunks]
+        unique = dict.fromkeys(hashes)
+        cached = self.__lookup(agent_name, model_name, list(unique))
+        pending['hits'] = list(cached)
+        with self.__lock:
+            cached.update({h: self.__unstored[(agent_name, model_name, h)] for h in unique 
+                           if h not in cached and (agent_name, model_name, h) in self.__unstored})
+
+        missing = [h for h in unique if h not in cached]
+        if missing:
+            first_chunk = {}
+            for h, chunk in zip(hashes, chunks):
+                first_chunk.setdefault(h, chunk)
+
+            vectors = np.asarray(embedding_agent.embed([first_chunk[h] for h in missing]), dtype=np.float32)
+            pending['entries'] = list(zip(missing, EmbeddingCodec().encode(vectors)))
+            cached.update(zip(missing, vectors))
+            with self.__lock:
+                for h, vector in zip(missing, vectors):
+                    self.__unstored[(agent_name, model_name, h)] = vector
+
+        self.hits += len(chunks) - len(missing)
+        self.misses += len(missing)
+
+        return np.stack([cached[h] for h in hashes]), pending
+
+    def store(self, pending: dict, conn: sqlite3.Connection = None):
+        """
+        Writes a pending update from `lookup` through `conn` (this cache's connection by default) 
+        and evicts the least recently used entries. The caller is responsible for committing, 
+        before storing the next update.
+        """
+        conn = conn if conn is not None else self.conn
+        cursor = conn.cursor()
+        agent_name, model_name, clock = pending['agent_name'], pending['model_name'], pending['clock']
+
+        cursor.executemany(f"""UPDATE {self.table_name} SET last_used = ? 
+                           WHERE agent_name = ? AND model_name = ? AND chunk_hash = ?""", [(clock, agent_name, model_name, h) for h in pending['hits']])
+        cursor.executemany(f"""
+            INSERT OR REPLACE INTO {self.table_name} (agent_name, model_name, chunk_hash, embedding, last_used) 
+            VALUES (?, ?, ?, ?, ?)
+        """, [(agent_name, model_name, h, blob, clock) for h, blob in pending['entries']])
+        self.__size += len(pending['entries'])
+        self.__evict(cursor)
+
+        # the previous update has been committed by now, so its entries are visible to lookups
+        with self.__lock:
+            for key in self.__last_stored:
+                del self.__unstored[key]
+        self.__last_stored = [(agent_name, model_name, h) for h, _ in pending['entries']]
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total > 0 else 0.0,
+            'entries': self.__size,
+        }
+
+    def __lookup(self, agent_name: str, model_name: str, hashes: list[bytes]) -> dict[bytes, np.ndarray]:
+        cursor = self.conn.cursor()
+        found = {}
+        codec = EmbeddingCodec()
+
+        # stay under SQLite's bound parameter limit
+        for i in range(0, len(hashes), 500):
+            part = hashes[i:i + 500]
+            placeholders = ", ".join("?" for _ in part)
+            cursor.execute(f"""SELECT chunk_hash, embedding FROM {self.table_name} 
+                           WHERE agent_name = ? AND model_name = ? AND chunk_hash IN ({placeholders})""", [agent_name, model_name] + part)
+            rows = cursor.fetchall()
+            if not rows:
+                continue
+
+            vectors = codec.decode([row[1] for row in rows])
+            found.update(zip([row[0] for row in rows], vectors))
+
+        return found
+
+    def __evict(self, cursor: sqlite3.Cursor):
+        excess = self.__size - self.max_entries
+        if excess <= 0:
+            return
+
+        cursor.execute(f"""DELETE FROM {self.table_name} WHERE rowid IN 
+                       (SELECT rowid FROM {self.table_name} ORDER BY last_used ASC LIMIT ?)""", (excess, ))
+        self.__size -= cursor.rowcount
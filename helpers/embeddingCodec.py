@@ -0,0 +1,120 @@
+import numpy as np
+
+## Bump whenever the on-disk embedding layout changes
+EMBEDDING_FORMAT_VERSION = 1
+
+## Stored embeddings are little-endian so databases stay portable across machines.
+## float16 halves and int8 quarters embedding I/O, at the cost of some precision (see quantizationReport)
+STORAGE_DTYPES = {
+    'float32': np.dtype('<f4'),
+    'float16': np.dtype('<f2'),
+    'int8': np.dtype('i1'),
+}
+
+class EmbeddingCodec:
+    """
+    Converts embedding matrices to and from the binary rows stored in an embeddings table.
+
+    Each embedding is stored as `dim` contiguous little-endian values of the storage dtype.
+    The dimension is learned from the first encoded (or decoded) batch when not known up front.
+
+    int8 values are `round(x / scale)` with a per-dimension scale, calibrated (see calibrate) so the largest
+    magnitude of a sample in each dimension maps to 127. Values beyond the sample's range are clipped to ±127;
+    `clipped_values` out of `encoded_values` counts them, so a poorly calibrated scale shows up in the logs.
+    """
+    def __init__(self, dtype: str = 'float32', dim: int = 0, scale: np.ndarray = None):
+        if dtype not in STORAGE_DTYPES:
+            raise ValueError(f"Unsupported embedding dtype '{dtype}'. Expected one of {list(STORAGE_DTYPES)}")
+
+        self.dtype = dtype
+        self.dim = dim
+        self.storage_dtype = STORAGE_DTYPES[dtype]
+        self.scale = None if scale is None else np.asarray(scale, dtype=np.float32)
+        self.clipped_values = 0
+        self.encoded_values = 0
+
+    @property
+    def row_bytes(self) -> int:
+        return self.dim * self.storage_dtype.itemsize
+
+    def encode(self, embeddings) -> list[bytes]:
+        """
+        Encodes a batch of embeddings (2-D array or list of vectors) into one blob per row.
+        """
+        matrix = np.asarray(embeddings, dtype=np.float32)
+        if matrix.size == 0:
+            return []
+
+        return [row.tobytes() for row in self.to_stored(matrix)]
+
+    def decode(self, blobs: list[bytes]) -> np.ndarray:
+        """
+        Decodes blobs into a (len(blobs), dim) float32 matrix.
+        """
+        if len(blobs) == 0:
+            return np.empty((0, self.dim), dtype=np.float32)
+        if self.dim == 0:
+            self.__check_dim(len(blobs[0]) // self.storage_dtype.itemsize)
+
+        buffer = blobs[0] if len(blobs) == 1 else b''.join(blobs)
+        if len(buffer) != len(blobs) * self.row_bytes:
+            raise ValueError(f"Embedding blobs do not match dimension {self.dim} ({self.dtype})")
+
+        # frombuffer gives a read-only view; no per-value Python objects are created
+        return self.from_stored(np.frombuffer(buffer, dtype=self.storage_dtype).reshape(len(blobs), self.dim))
+
+    def to_stored(self, embeddings) -> np.ndarray:
+        """
+        Converts a 2-D batch of embeddings into a contiguous matrix of the storage dtype.
+        """
+        matrix = np.asarray(embeddings, dtype=np.float32)
+        if matrix.ndim != 2:
+            raise ValueError(f"Expected a 2-D batch of embeddings, received shape {matrix.shape}")
+        self.__check_dim(matrix.shape[1])
+
+        if self.dtype == 'int8':
+            if self.scale is None:
+                # uncalibrated: the first batch encoded sets the scale
+                self.calibrate(matrix)
+            quantized = np.rint(matrix / self.scale)
+            self.clipped_values += int(np.count_nonzero(np.abs(quantized) > 127))
+            self.encoded_values += quantized.size
+            return np.clip(quantized, -127, 127).astype(self.storage_dtype)
+
+        return np.ascontiguousarray(matrix, dtype=self.storage_dtype)
+
+    def calibrate(self, sample: np.ndarray) -> None:
+        """
+        Sets the int8 scale from a float32 sample, best one spread over the whole dataset. Does nothing for other dtypes
+        or once a scale is set (it is immutable, every stored row depends on it).
+        """
+        sample = np.asarray(sample, dtype=np.float32)
+        if self.dtype != 'int8' or self.scale is not None or len(sample) == 0:
+            return
+        self.__check_dim(sample.shape[1])
+        self.scale = np.maximum(np.abs(sample).max(axis=0), 1e-12).astype(np.float32) / 127
+
+    def from_stored(self, stored: np.ndarray) -> np.ndarray:
+        """
+        Converts a matrix of the storage dtype back to float32 (without copying when already float32).
+        """
+        if self.dtype == 'int8':
+            if self.scale is None:
+                raise ValueError("int8 embeddings can't be decoded without their scale")
+            return stored.astype(np.float32) * self.scale
+        return stored.astype(np.float32, copy=False)
+
+    def scale_bytes(self) -> bytes:
+        """
+        The int8 scale serialized for the metadata row (None for other dtypes or before calibration).
+        """
+        return None if self.scale is None else self.scale.astype('<f4').tobytes()
+
+    @staticmethod
+    def scale_from_bytes(blob: bytes) -> np.ndarray:
+        return None if blob is None else np.frombuffer(blob, dtype='<f4').astype(np.float32)
+
+    def __check_dim(self, dim: int):
+        if self.dim == 0:
+            self.dim = dim
+        assert dim == self.dim, f"Embedding dimension mismatch: expected {self.dim}, received {dim}"
@@ -1,5 +1,10 @@
 import sqlite3 
 import pickle
+import os
+import struct
+import numpy as np
+from .embeddingCodec import EmbeddingCodec
+from .utils.keysetCursor import KeysetCursor
 
 """
 CREATE TABLE IF NOT EXISTS embeddings (
@@ -15,88 +20,317 @@ CREATE TABLE IF NOT EXISTS embeddings (
 # to allow batching of inserts, reducing latency from multiple commits.
 # This approach optimizes performance for large-scale batch processing.
 
+# Embeddings are stored as raw little-endian bytes (see EmbeddingCodec) rather than 
+# pickled Python lists, so reads decode straight into numpy matrices.
+
+
+# Sidecar layout: at millions of chunks the BLOB column no longer fits through SQLite into RAM, 
+# so new tables keep only (person_id, embedding_id, total_embeddings, row_offset) in SQLite and 
+# append the vectors to a contiguous raw file next to the database. Readers np.memmap that file 
+# and slice it, so contiguous reads (training, a person's embeddings) never copy.
+# The file starts with a 16 byte header (magic, dim) followed by raw rows of the codec's storage dtype.
+SIDECAR_MAGIC = b'EMBRAW01'
+SIDECAR_HEADER_BYTES = 16
+
 
 ##Throws Errors
 class Embeddings(): 
-    def __init__(self, conn: sqlite3.Connection, table_name: str) -> None: 
+    def __init__(self, conn: sqlite3.Connection, table_name: str, codec: EmbeddingCodec = None, sidecar_path: str = None) -> None: 
         self.table_name = table_name
         self.conn = conn
+        self.codec = codec if codec is not None else EmbeddingCodec()
+        self.sidecar_path = sidecar_path
+
+        # Tables created with a row_offset column keep their vectors in the sidecar file 
+        cursor = self.conn.cursor()
+        cursor.execute(f"PRAGMA table_info({table_name})")
+        self.uses_sidecar = 'row_offset' in {row[1] for row in cursor.fetchall()}
+        self._vector_col = 'row_offset' if self.uses_sidecar else 'embedding'
 
-    import pickle
+        if self.uses_sidecar:
+            if sidecar_path is None:
+                raise Exception(f"{table_name} stores its embeddings in a sidecar file, but no sidecar_path was given.")
+            self.__recover_sidecar()
 
-    def insertEmbeddings(self, person_ids: list[int], sizes: list[int], embedding_ids: list[int], embeddings: list[list[float]]) -> None:
+    def insertEmbeddings(self, person_ids: list[int], sizes: list[int], embedding_ids: list[int], embeddings: np.ndarray) -> None:
         """
-        Inserts a batch of embeddings for a person into the database.
+        Inserts a batch of embeddings into the database. The caller is responsible for committing.
 
         Args:
-            person_index (int): ID of the person the embeddings belong to.
-            embeddings (list[list[int]]): List of embeddings to insert.
-            total_embeddings (int): Total number of embeddings for this person.
+            person_ids (list[int]): ID of the person each embedding belongs to.
+            sizes (list[int]): Total number of embeddings for the person of each row.
+            embedding_ids (list[int]): Index of each embedding within its person, in [0, size).
+            embeddings (np.ndarray): (len(person_ids), dim) matrix of embeddings to insert.
         """
         cursor = self.conn.cursor()
 
-        # Convert embeddings to blobs
+        # Convert embeddings to blobs (or sidecar row offsets)
+        vectors = self.__append_to_sidecar(embeddings) if self.uses_sidecar else self.codec.encode(embeddings)
         embedding_data = [
-            (person_ids[i], embedding_ids[i], sizes[i], pickle.dumps(embeddings[i]))
+            (person_ids[i], embedding_ids[i], sizes[i], vectors[i])
             for i in range(len(person_ids))
         ]
 
         # Use executemany() for batch insertion
         cursor.executemany(f"""
-            INSERT INTO {self.table_name} (person_id, embedding_id, total_embeddings, embedding) 
+            INSERT INTO {self.table_name} (person_id, embedding_id, total_embeddings, {self._vector_col}) 
             VALUES (?, ?, ?, ?)
         """, embedding_data)
 
-        self.conn.commit()  # Commit the transaction
-
     
-    def getEmbeddingBatch(self, start_row: int, batch_size: int, epoch: int) -> tuple[int, list[list[int]]]:
+    def getEmbeddingBatch(self, start_row: int, batch_size: int, epoch: int) -> tuple[int, np.ndarray]:
         cursor = self.conn.cursor()
 
-        cursor.execute(f"""SELECT id, embedding FROM {self.table_name} 
-                       WHERE id >= {start_row} AND embedding_id = {epoch} % total_embeddings LIMIT {batch_size}""")
+        cursor.execute(f"""SELECT id, {self._vector_col} FROM {self.table_name} 
+                       WHERE id >= {start_row} AND embedding_id = {epoch} % total_embeddings ORDER BY id ASC LIMIT {batch_size}""")
         
         blobbed_embeddings = cursor.fetchall()
 
-        embeddings = [pickle.loads(blob) for _, blob in blobbed_embeddings]
+        embeddings = self.__decode([blob for _, blob in blobbed_embeddings])
     
         last_id = blobbed_embeddings[-1][0] if len(blobbed_embeddings) > 0 else start_row
         
         return last_id, embeddings
     
-    def getPersonEmbeddingsBatch(self, start_id: int, batch_size: int) -> list[tuple[int, int, list[list[int]]]]:
+    def getEmbeddingCount(self) -> int:
+        cursor = self.conn.cursor()
+        cursor.execute(f"SELECT COUNT(*) FROM {self.table_name}")
+        return cursor.fetchone()[0]
+
+    def getBalancedSample(self, sample_size: int, seed: int = 0) -> np.ndarray:
+        """
+        Draws `sample_size` embeddings in which every person is equally represented, whatever their chunk count.
+
+        Walks the epochs of getEmbeddingBatch (epoch e holds each person's embedding `e % total_embeddings`)
+        and takes whole epochs, then a random subset of persons from the last one. Persons with fewer
+        chunks than epochs taken contribute repeats, exactly like epoch training would.
+
+        Args:
+            sample_size (int): Number of embeddings to draw.
+            seed (int): Seeds the choice of persons in the last, partial epoch.
+
+        Returns:
+            np.ndarray: A (min(sample_size, ...), dim) float32 matrix; fewer rows only if the table is empty.
+        """
+        assert sample_size > 0, "sample_size must be positive"
+        cursor = self.conn.cursor()
+        rng = np.random.default_rng(seed)
+
+        samples = []
+        remaining = sample_size
+        epoch = 0
+        while remaining > 0:
+            cursor.execute(f"SELECT {self._vector_col} FROM {self.table_name} WHERE embedding_id = ? % total_embeddings ORDER BY id ASC", (epoch, ))
+            values = [row[0] for row in cursor.fetchall()]
+            if len(values) == 0:
+                break
+
+            if len(values) > remaining:
+                chosen = np.sort(rng.choice(len(values), remaining, replace=False))
+                values = [values[i] for i in chosen]
+            samples.append(self.__decode(values))
+            remaining -= len(values)
+            epoch += 1
+
+        if len(samples) == 0:
+            return self.__decode([])
+        return np.concatenate(samples)
+
+    def getPersonEmbeddingsBatch(self, start_id: int, batch_size: int) -> list[tuple[int, int, np.ndarray]]:
         """
         Gets person embeddings tuples for people between [start_id, start_id + batch_size - 1]
         Tuple of form (person_id, total_embeddings, embeddings)
         """
+        person_ids, offsets, matrix = self.getPersonEmbeddingsBlock(start_id, batch_size)
+        return [[int(person_ids[i]), int(offsets[i + 1] - offsets[i]), matrix[offsets[i]:offsets[i + 1]]] for i in range(len(person_ids))]
+
+    def getPersonEmbeddingsBlock(self, start_id: int, batch_size: int) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Gets the embeddings of people between [start_id, start_id + batch_size - 1] as one stacked matrix.
+
+        Returns:
+            tuple[np.ndarray, np.ndarray, np.ndarray]: (person_ids, offsets, embeddings), where person_ids[i]
+            owns rows offsets[i]:offsets[i + 1] of the (n, dim) embeddings matrix.
+        """
         cursor = self.conn.cursor()
 
-        cursor.execute(f"""SELECT person_id, total_embeddings, embedding FROM {self.table_name} 
-                       WHERE person_id >= ? AND person_id < ? ORDER BY person_id ASC""", (start_id, start_id + batch_size))
+        cursor.execute(f"""SELECT person_id, total_embeddings, {self._vector_col} FROM {self.table_name} 
+                       WHERE person_id >= ? AND person_id < ? ORDER BY person_id ASC, embedding_id ASC""", (start_id, start_id + batch_size))
         
-        results = cursor.fetchall()
+        return self.__person_block(cursor.fetchall())
 
-        people_embeddings = []
-        
-        # group a person's embeddings
-        for res in results: 
-            if len(people_embeddings) == 0 or people_embeddings[-1][0] != res[0]:
-                people_embeddings.append([res[0], res[1], []])
-            
-            people_embeddings[-1][2].append(pickle.loads(res[2]))
+    def streamPersonEmbeddings(self, start_id: int) -> KeysetCursor:
+        """
+        Streams the embeddings of every person from `start_id` on, in person id order. Each `next_batch(n)` returns
+        the (person_ids, offsets, embeddings) block of the next n persons, like getPersonEmbeddingsBlock.
+        Checkpoint the cursor's `next_key` to resume after the last block read.
+        """
+        query = f"""SELECT person_id, total_embeddings, {self._vector_col} FROM {self.table_name} 
+                    WHERE person_id >= ? ORDER BY person_id ASC, embedding_id ASC"""
+        return KeysetCursor(self.conn, query, (start_id, ), start_id, transform=self.__person_block)
+
+    def getEmbeddingsOfPersons(self, person_ids: list[int]) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Gets the embeddings of the given persons (in any order, not necessarily contiguous) as one block,
+        like getPersonEmbeddingsBlock. Persons without embeddings are left out.
+        """
+        person_ids = sorted(set(int(person_id) for person_id in person_ids))
+        cursor = self.conn.cursor()
+
+        # stays below SQLite's limit on query parameters
+        results = []
+        for start in range(0, len(person_ids), 500):
+            chunk = person_ids[start:start + 500]
+            cursor.execute(f"""SELECT person_id, total_embeddings, {self._vector_col} FROM {self.table_name} 
+                           WHERE person_id IN ({', '.join('?' * len(chunk))}) ORDER BY person_id ASC, embedding_id ASC""", chunk)
+            results.extend(cursor.fetchall())
+
+        return self.__person_block(results)
+
+    def __person_block(self, results: list[tuple]) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Stacks (person_id, total_embeddings, vector) rows sorted by person into a (person_ids, offsets, embeddings) block.
+        """
+        matrix = self.__decode([res[2] for res in results])
+
+        # rows are sorted by person, so each person is a contiguous segment
+        row_person_ids = np.array([res[0] for res in results], dtype=np.int64)
+        starts = np.flatnonzero(np.r_[True, row_person_ids[1:] != row_person_ids[:-1]]) if len(results) > 0 else np.empty(0, dtype=np.int64)
+        offsets = np.append(starts, len(results))
 
         # assert lengths check out 
-        for etup in people_embeddings:
-            assert etup[1] == len(etup[2])    
-        
-        return people_embeddings
+        totals = np.array([results[i][1] for i in starts], dtype=np.int64)
+        assert np.array_equal(totals, np.diff(offsets)), "Stored total_embeddings don't match the embeddings found"
+
+        return row_person_ids[starts], offsets, matrix
     
 
-    def getAllEmbeddings(self) -> list[list[int]]:
+    def getAllEmbeddings(self) -> np.ndarray:
         cursor = self.conn.cursor()
 
-        cursor.execute(f'SELECT embedding FROM {self.table_name}')
+        if self.uses_sidecar:
+            # Committed rows normally fill the sidecar front to back, which lets us hand out the memmap itself
+            cursor.execute(f'SELECT COUNT(*), MAX(row_offset) FROM {self.table_name}')
+            count, max_offset = cursor.fetchone()
+            if count == 0 or count == max_offset + 1:
+                return self.codec.from_stored(self.__sidecar_matrix()[:count])
+
+        cursor.execute(f'SELECT {self._vector_col} FROM {self.table_name} ORDER BY id ASC')
+
+        return self.__decode([e[0] for e in cursor.fetchall()])
+
+    def __decode(self, values: list) -> np.ndarray:
+        if not self.uses_sidecar:
+            return self.codec.decode(values)
+
+        matrix = self.__sidecar_matrix()
+        if len(values) == 0:
+            return self.codec.from_stored(matrix[:0])
+
+        # A run of consecutive offsets is a view of the memmap, anything else is gathered
+        first, last = values[0], values[-1]
+        if last - first + 1 == len(values) and values == list(range(first, last + 1)):
+            return self.codec.from_stored(matrix[first:last + 1])
+        return self.codec.from_stored(matrix[np.asarray(values, dtype=np.int64)])
+
+    def __sidecar_matrix(self) -> np.ndarray:
+        size = os.path.getsize(self.sidecar_path) - SIDECAR_HEADER_BYTES if os.path.exists(self.sidecar_path) else 0
+        if size <= 0 or self.codec.dim == 0:
+            return np.empty((0, self.codec.dim), dtype=self.codec.storage_dtype)
+
+        # Re-map only when the file has grown since the last read
+        if self._memmap is None or self._memmap_size != size:
+            rows = size // self.codec.row_bytes
+            self._memmap = np.memmap(self.sidecar_path, dtype=self.codec.storage_dtype, mode='r', offset=SIDECAR_HEADER_BYTES, shape=(rows, self.codec.dim))
+            self._memmap_size = size
+        return self._memmap
+
+    def __append_to_sidecar(self, embeddings) -> list[int]:
+        if len(embeddings) == 0:
+            return []
+        stored = self.codec.to_stored(embeddings)
+
+        with open(self.sidecar_path, 'ab') as sidecar:
+            if sidecar.tell() == 0:
+                sidecar.write(SIDECAR_MAGIC + struct.pack('<II', self.codec.dim, 0))
+            offset = (sidecar.tell() - SIDECAR_HEADER_BYTES) // self.codec.row_bytes
+            sidecar.write(stored.tobytes())
+            sidecar.flush()
+            # vectors must be durable before the rows pointing at them are committed
+            os.fsync(sidecar.fileno())
+
+        return list(range(offset, offset + len(stored)))
+
+    def __recover_sidecar(self):
+        """
+        Reads the dimension from the sidecar header and drops vectors appended by a batch that was never committed.
+        """
+        self._memmap = None
+        self._memmap_size = 0
+
+        if not os.path.exists(self.sidecar_path) or os.path.getsize(self.sidecar_path) < SIDECAR_HEADER_BYTES:
+            open(self.sidecar_path, 'wb').close()
+            return
+
+        with open(self.sidecar_path, 'rb') as sidecar:
+            header = sidecar.read(SIDECAR_HEADER_BYTES)
+        if header[:len(SIDECAR_MAGIC)] != SIDECAR_MAGIC:
+            raise Exception(f"{self.sidecar_path} is not an embeddings sidecar file")
+        dim, _ = struct.unpack('<II', header[len(SIDECAR_MAGIC):])
+        if self.codec.dim == 0:
+            self.codec.dim = dim
+        assert dim == self.codec.dim, f"Embedding dimension mismatch: sidecar has {dim}, expected {self.codec.dim}"
+
+        cursor = self.conn.cursor()
+        cursor.execute(f'SELECT COUNT(*), MAX(row_offset) FROM {self.table_name}')
+        count, max_offset = cursor.fetchone()
+        committed_rows = 0 if count == 0 else max_offset + 1
+
+        size = os.path.getsize(self.sidecar_path)
+        committed_size = SIDECAR_HEADER_BYTES + committed_rows * self.codec.row_bytes
+        if size < committed_size:
+            raise Exception(f"{self.sidecar_path} is missing committed embeddings ({size} < {committed_size} bytes)")
+        if size > committed_size:
+            os.truncate(self.sidecar_path, committed_size)
+
+
+def migrate_pickled_embeddings(conn: sqlite3.Connection, table_name: str, codec: EmbeddingCodec, batch_size: int = 10000) -> int:
+    """
+    One-shot migration of an embeddings table written before the binary format, where
+    each embedding was a pickled list of floats. Rows already in the binary format are left untouched,
+    so the migration is safe to re-run. The caller is responsible for committing.
+
+    Returns:
+        int: The number of rows converted.
+    """
+    cursor = conn.cursor()
+    converted = 0
+    last_id = 0
+
+    while True:
+        cursor.execute(f"SELECT id, embedding FROM {table_name} WHERE id > ? ORDER BY id ASC LIMIT ?", (last_id, batch_size))
+        rows = cursor.fetchall()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+
+        updates = []
+        for row_id, blob in rows:
+            # a pickled list of d floats takes at least 9 bytes per value, so it never matches the binary row size
+            if codec.dim != 0 and len(blob) == codec.row_bytes:
+                continue
+            try:
+                vector = pickle.loads(blob)
+            except Exception:
+                vector = None
+
+            if not isinstance(vector, list):
+                # already binary, learn the dimension from it
+                codec.decode([blob])
+                continue
+            updates.append((codec.encode([vector])[0], row_id))
 
-        return [pickle.loads(e[0]) for e in cursor.fetchall()]
+        cursor.executemany(f"UPDATE {table_name} SET embedding = ? WHERE id = ?", updates)
+        converted += len(updates)
 
-           
\ No newline at end of file
+    return converted
@@ -1,16 +1,50 @@
 import sqlite3
+from collections import OrderedDict
+import numpy as np
+
+# Posting lists are stored per topic rather than as one row per (topic, person): each write appends one segment
+# per topic it touches, holding that topic's sorted person ids as a BLOB of deltas (one width byte, then the gaps
+# between consecutive ids in the narrowest unsigned dtype that fits them). Ids of popular topics are dense, so most
+# gaps fit one byte. Queries decode whole segments with a cumsum and combine topics with numpy set operations,
+# instead of streaming one SQLite row per match. Each person's feature count (number of topics) is kept once,
+# in the `{table_name}_documents` table.
+#
+# Removing a person doesn't rewrite segments: it records a tombstone (person_id, before_segment), and the person's
+# postings in segments with ids below `before_segment` are dropped whenever a topic is read. Postings written later
+# (the person re-indexed after an update) are live. compact() purges dead postings for good, merging each topic's
+# segments into one, and then drops the tombstones it resolved.
+DELTA_DTYPES = {1: np.uint8, 2: np.uint16, 4: np.uint32, 8: np.uint64}
+
+def encode_postings(person_ids: np.ndarray) -> tuple[int, bytes]:
+    """
+    Encodes a sorted array of distinct person ids as (first id, delta BLOB).
+    """
+    person_ids = np.asarray(person_ids, dtype=np.int64)
+    deltas = np.diff(person_ids)
+    width = next(width for width, dtype in DELTA_DTYPES.items() if len(deltas) == 0 or deltas.max() <= np.iinfo(dtype).max)
+    return int(person_ids[0]), bytes([width]) + deltas.astype(DELTA_DTYPES[width]).tobytes()
+
+def decode_postings(first_person_id: int, blob: bytes) -> np.ndarray:
+    deltas = np.frombuffer(blob, dtype=DELTA_DTYPES[blob[0]], offset=1).astype(np.int64)
+    return first_person_id + np.concatenate(([0], np.cumsum(deltas)))
 
 class InverseIndex:
-    def __init__(self, conn: sqlite3.Connection, table_name: str):
+    def __init__(self, conn: sqlite3.Connection, table_name: str, cache_topics: int = 1024):
         """
         Initializes the InverseIndex class.
 
         Args:
             conn (sqlite3.Connection): SQLite database connection.
             table_name (str): Name of the inverse index table.
+            cache_topics (int): Decoded posting lists kept in memory, least recently used evicted first.
         """
         self.conn = conn
         self.table_name = table_name
+        self.cache_topics = cache_topics
+        self.__cache: OrderedDict[int, np.ndarray] = OrderedDict()
+        self.__documents = None
+        self.__document_count = None
+        self.__tombstones = None
 
     def add_result_vector(self, topic_ids: list[int], person_id: int, feature_count: int) -> None:
         """
@@ -21,14 +55,141 @@ class InverseIndex:
             person_id (int): ID of the person associated with the result vector.
             feature_count (int): Total number of features (1s) in the result vector.
         """
+        self._add_postings({topic_id: np.array([person_id]) for topic_id in topic_ids}, [(person_id, feature_count)])
+        self.conn.commit()
+
+    def add_results(self, person_ids: list[int], results: np.ndarray) -> None:
+        """
+        Adds the postings of a batch of result vectors, one segment per topic. The caller is responsible for committing,
+        so the postings can share a transaction with the results they come from.
+
+        Args:
+            person_ids (list[int]): ID of the person of each row of `results`.
+            results (np.ndarray): (len(person_ids), topic_count) binary result matrix.
+        """
+        results = np.asarray(results)
+        person_ids = np.asarray(person_ids, dtype=np.int64)
+        order = np.argsort(person_ids, kind='stable')
+        person_ids, results = person_ids[order], results[order]
+
+        # transposed, each topic's persons come out sorted and contiguous
+        topic_ids, rows = np.nonzero(results.T)
+        starts = np.flatnonzero(np.r_[True, topic_ids[1:] != topic_ids[:-1]]) if len(topic_ids) > 0 else np.empty(0, dtype=np.int64)
+        bounds = np.append(starts, len(topic_ids))
+        postings = {int(topic_ids[start]): person_ids[rows[start:end]] for start, end in zip(bounds[:-1], bounds[1:])}
+
+        feature_counts = np.count_nonzero(results, axis=1)
+        self._add_postings(postings, zip(person_ids.tolist(), feature_counts.tolist()))
+
+    def remove_persons(self, person_ids: list[int]) -> None:
+        """
+        Tombstones every posting written so far for the persons, and forgets their feature counts.
+        They can be indexed again later (e.g. after their description changed). The caller is responsible for committing.
+        """
         cursor = self.conn.cursor()
-        query = f"""
-        INSERT INTO {self.table_name} (topic_id, person_id, feature_count)
-        VALUES (?, ?, ?)
+        cursor.execute(f"SELECT COALESCE(MAX(id), 0) + 1 FROM {self.table_name}")
+        before_segment = cursor.fetchone()[0]
+
+        person_ids = [int(person_id) for person_id in person_ids]
+        cursor.executemany(f"INSERT OR REPLACE INTO {self.table_name}_tombstones (person_id, before_segment) VALUES (?, ?)", [(person_id, before_segment) for person_id in person_ids])
+        cursor.executemany(f"DELETE FROM {self.table_name}_documents WHERE person_id = ?", [(person_id, ) for person_id in person_ids])
+        # any topic may hold them
+        self.__cache.clear()
+        self.__documents = None
+        self.__document_count = None
+        self.__tombstones = None
+
+    def get_unindexed_tombstones(self) -> list[int]:
+        """
+        Returns the tombstoned persons that still exist but haven't been indexed again (updated persons awaiting their new postings).
+        """
+        cursor = self.conn.cursor()
+        cursor.execute(f"""SELECT person_id FROM {self.table_name}_tombstones 
+                       WHERE person_id IN (SELECT id FROM persons) AND person_id NOT IN (SELECT person_id FROM {self.table_name}_documents) ORDER BY person_id ASC""")
+        return [row[0] for row in cursor.fetchall()]
+
+    def compact(self) -> int:
+        """
+        Rewrites every topic written before the call as a single segment without its dead postings, one commit per topic,
+        so queries and writers can interleave with it. Tombstones are dropped once no segment they apply to is left,
+        except those of updated persons not indexed again yet (see get_unindexed_tombstones).
+
+        Returns:
+            int: The number of dead postings purged.
         """
+        cursor = self.conn.cursor()
+        cursor.execute(f"SELECT COALESCE(MAX(id), 0) + 1 FROM {self.table_name}")
+        limit = cursor.fetchone()[0]
+        cursor.execute(f"SELECT DISTINCT topic_id FROM {self.table_name} WHERE id < ?", (limit, ))
+        topic_ids = [row[0] for row in cursor.fetchall()]
+
+        purged = 0
         for topic_id in topic_ids:
-            cursor.execute(query, (topic_id, person_id, feature_count))
+            cursor.execute(f"SELECT id, first_person_id, postings, person_count FROM {self.table_name} WHERE topic_id = ? AND id < ?", (topic_id, limit))
+            segments = cursor.fetchall()
+            postings = self.__live_postings([segment[:3] for segment in segments])
+            purged += sum(segment[3] for segment in segments) - len(postings)
+
+            cursor.execute(f"DELETE FROM {self.table_name} WHERE topic_id = ? AND id < ?", (topic_id, limit))
+            if len(postings) > 0:
+                first_person_id, blob = encode_postings(postings)
+                cursor.execute(f"INSERT INTO {self.table_name} (topic_id, first_person_id, person_count, postings) VALUES (?, ?, ?, ?)", (topic_id, first_person_id, len(postings), blob))
+            self.__cache.pop(topic_id, None)
+            self.conn.commit()
+
+        cursor.execute(f"""DELETE FROM {self.table_name}_tombstones WHERE before_segment <= ? 
+                       AND (person_id NOT IN (SELECT id FROM persons) OR person_id IN (SELECT person_id FROM {self.table_name}_documents))""", (limit, ))
         self.conn.commit()
+        self.__tombstones = None
+        return purged
+
+    def is_empty(self) -> bool:
+        cursor = self.conn.cursor()
+        cursor.execute(f"SELECT 1 FROM {self.table_name} LIMIT 1")
+        return cursor.fetchone() is None
+
+    def get_topic_postings(self, topic_id: int) -> np.ndarray:
+        """
+        Returns the sorted, distinct person ids of a topic.
+        """
+        if topic_id in self.__cache:
+            self.__cache.move_to_end(topic_id)
+            return self.__cache[topic_id]
+
+        cursor = self.conn.cursor()
+        cursor.execute(f"SELECT id, first_person_id, postings FROM {self.table_name} WHERE topic_id = ?", (topic_id, ))
+        postings = self.__live_postings(cursor.fetchall())
+        postings.flags.writeable = False
+
+        self.__cache[topic_id] = postings
+        if len(self.__cache) > self.cache_topics:
+            self.__cache.popitem(last=False)
+        return postings
+
+    def get_document_count(self) -> int:
+        """
+        Returns the number of indexed persons, cached until the next write.
+        """
+        if self.__document_count is None:
+            cursor = self.conn.cursor()
+            cursor.execute(f"SELECT COUNT(*) FROM {self.table_name}_documents")
+            self.__document_count = cursor.fetchone()[0]
+        return self.__document_count
+
+    def get_feature_counts(self, person_ids: np.ndarray) -> np.ndarray:
+        """
+        Returns the number of topics of each person (0 for persons that aren't indexed).
+        A few persons are looked up by id; for a good share of the index, every feature count is loaded once and cached.
+        """
+        person_ids = np.asarray(person_ids, dtype=np.int64)
+        if self.__documents is None and len(person_ids) < self.get_document_count() // 16:
+            return self.__lookup_feature_counts(person_ids)
+
+        indexed_ids, feature_counts = self.__load_documents()
+        if len(indexed_ids) == 0:
+            return np.zeros(len(person_ids), dtype=np.int64)
+        rows = np.minimum(np.searchsorted(indexed_ids, person_ids), len(indexed_ids) - 1)
+        return np.where(indexed_ids[rows] == person_ids, feature_counts[rows], 0)
 
     def get_all_documents_by_topics(self, topic_ids: list[int], distinct: bool = True) -> list[int]:
         """
@@ -41,13 +202,233 @@ class InverseIndex:
         Returns:
             list[int]: List of person IDs matching any of the topic IDs.
         """
+        postings = [self.get_topic_postings(topic_id) for topic_id in dict.fromkeys(topic_ids)]
+        if len(postings) == 0:
+            return []
+        if distinct:
+            return self.count_documents_by_topics(topic_ids)[0].tolist()
+        return np.concatenate(postings).tolist()
+
+    def count_documents_by_topics(self, topic_ids: list[int]) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Union of the topics' posting lists, with how many of the topics each person matches.
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]: (person_ids, match_counts), sorted by person id.
+        """
+        postings = [self.get_topic_postings(topic_id) for topic_id in dict.fromkeys(topic_ids)]
+        matches = np.concatenate(postings) if len(postings) > 0 else np.empty(0, dtype=np.int64)
+        if len(matches) == 0:
+            return matches, matches.copy()
+
+        # counting into a dense array beats sorting once the matches cover a good share of the id range
+        if matches.min() >= 0 and matches.max() < 4 * len(matches):
+            counts = np.bincount(matches)
+            person_ids = np.flatnonzero(counts)
+            return person_ids, counts[person_ids]
+        return np.unique(matches, return_counts=True)
+
+    def top_k_documents(self, topic_ids: list[int], k: int = None) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Ranks the persons of the topics by the IDF weights of the topics they match, log(1 + N / df) with N the
+        number of indexed persons and df the topic's posting count, summed and divided by the square root of the
+        person's feature count (so persons with many topics don't match everything).
+
+        With `k`, topics are scored from the rarest (highest weight) down, MaxScore style: once the k-th best score
+        so far beats what the remaining topics could add up to, persons not seen yet can't make the top k, so the
+        remaining (common) topics only update the candidates, which are pruned as their upper bounds fall behind.
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]: (person_ids, scores) of the top k persons (all of them without `k`),
+            best first, ties by person id.
+        """
+        postings = [self.get_topic_postings(topic_id) for topic_id in dict.fromkeys(topic_ids)]
+        postings = [topic_postings for topic_postings in postings if len(topic_postings) > 0]
+        if len(postings) == 0 or k == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+
+        document_count = self.get_document_count()
+        weights = np.array([np.log1p(document_count / len(topic_postings)) for topic_postings in postings])
+        if k is None:
+            # nothing to prune: every match is scored in one pass, like count_documents_by_topics
+            matches = np.concatenate(postings)
+            match_weights = np.repeat(weights, [len(topic_postings) for topic_postings in postings])
+            if matches.min() >= 0 and matches.max() < 4 * len(matches):
+                candidates = np.flatnonzero(np.bincount(matches))
+                accumulated = np.bincount(matches, match_weights)[candidates]
+            else:
+                candidates, inverse = np.unique(matches, return_inverse=True)
+                accumulated = np.bincount(inverse, match_weights)
+            norms = 1 / np.sqrt(np.maximum(self.get_feature_counts(candidates), 1))
+        else:
+            order = np.argsort(-weights, kind='stable')
+            # what the topics after the j-th could still add to a score
+            remaining = np.append(np.cumsum(weights[order][::-1])[::-1], 0)[1:]
+            candidates = np.empty(0, dtype=np.int64)
+            accumulated = np.empty(0, dtype=np.float64)
+            norms = np.empty(0, dtype=np.float64)
+            new_candidates = True
+            for j, topic in enumerate(order):
+                topic_postings = postings[topic]
+                if new_candidates:
+                    merged = np.union1d(candidates, topic_postings)
+                    seen = np.searchsorted(merged, candidates)
+                    merged_accumulated = np.zeros(len(merged))
+                    merged_accumulated[seen] = accumulated
+                    merged_accumulated[np.searchsorted(merged, topic_postings)] += weights[topic]
+                    # feature counts are only looked up for persons that just became candidates
+                    merged_norms = np.zeros(len(merged))
+                    merged_norms[seen] = norms
+                    added = np.ones(len(merged), dtype=bool)
+                    added[seen] = False
+                    merged_norms[added] = 1 / np.sqrt(np.maximum(self.get_feature_counts(merged[added]), 1))
+                    candidates, accumulated, norms = merged, merged_accumulated, merged_norms
+                else:
+                    rows = np.minimum(np.searchsorted(topic_postings, candidates), len(topic_postings) - 1)
+                    accumulated = accumulated + weights[topic] * (topic_postings[rows] == candidates)
+
+                if len(candidates) <= k:
+                    continue
+                threshold = np.partition(accumulated * norms, len(candidates) - k)[len(candidates) - k]
+                # an unseen person matches none of the topics so far, and norms are at most 1
+                if remaining[j] < threshold:
+                    new_candidates = False
+                keep = (accumulated + remaining[j]) * norms >= threshold
+                candidates, accumulated, norms = candidates[keep], accumulated[keep], norms[keep]
+
+        scores = accumulated * norms
+        if k is not None and len(candidates) > k:
+            top = np.argpartition(-scores, k - 1)[:k]
+            # keep every person tied with the k-th score, so ties are broken by id
+            top = np.flatnonzero(scores >= scores[top].min())
+            candidates, scores = candidates[top], scores[top]
+        ranking = np.lexsort((candidates, -scores))[:k]
+        return candidates[ranking], scores[ranking]
+
+    def get_documents_in_all_topics(self, topic_ids: list[int]) -> list[int]:
+        """
+        Intersection of the topics' posting lists: the persons that have every one of the topics.
+        """
+        postings = sorted((self.get_topic_postings(topic_id) for topic_id in dict.fromkeys(topic_ids)), key=len)
+        if len(postings) == 0:
+            return []
+        # starting from the shortest list keeps every intermediate result small
+        matches = postings[0]
+        for topic_postings in postings[1:]:
+            matches = np.intersect1d(matches, topic_postings, assume_unique=True)
+        return matches.tolist()
+
+    def _add_postings(self, postings: dict[int, np.ndarray], feature_counts) -> None:
+        """
+        Appends one segment per topic of sorted, distinct person ids, and records the persons' feature counts.
+        """
+        segments = []
+        for topic_id, person_ids in postings.items():
+            first_person_id, blob = encode_postings(person_ids)
+            segments.append((topic_id, first_person_id, len(person_ids), blob))
+
         cursor = self.conn.cursor()
-        distinct_clause = "DISTINCT" if distinct else ""
-        placeholders = ", ".join("?" for _ in topic_ids)
-        query = f"""
-        SELECT {distinct_clause} person_id
-        FROM {self.table_name}
-        WHERE topic_id IN ({placeholders})
-        """
-        cursor.execute(query, topic_ids)
-        return [row[0] for row in cursor.fetchall()]
+        cursor.executemany(f"INSERT INTO {self.table_name} (topic_id, first_person_id, person_count, postings) VALUES (?, ?, ?, ?)", segments)
+        cursor.executemany(f"INSERT OR REPLACE INTO {self.table_name}_documents (person_id, feature_count) VALUES (?, ?)", feature_counts)
+        for topic_id in postings:
+            self.__cache.pop(topic_id, None)
+        self.__documents = None
+        self.__document_count = None
+
+    def __live_postings(self, segments: list[tuple[int, int, bytes]]) -> np.ndarray:
+        """
+        Decodes (id, first_person_id, postings) segments into sorted, distinct person ids, without tombstoned postings.
+        """
+        decoded = [decode_postings(first, blob) for _, first, blob in segments]
+        postings = np.concatenate(decoded) if len(decoded) > 0 else np.empty(0, dtype=np.int64)
+
+        tombstoned_ids, before_segments = self.__load_tombstones()
+        if len(tombstoned_ids) > 0 and len(postings) > 0:
+            segment_ids = np.repeat(np.array([segment[0] for segment in segments], dtype=np.int64), [len(ids) for ids in decoded])
+            rows = np.minimum(np.searchsorted(tombstoned_ids, postings), len(tombstoned_ids) - 1)
+            dead = (tombstoned_ids[rows] == postings) & (segment_ids < before_segments[rows])
+            postings = postings[~dead]
+
+        # segments are appended in write order, which is usually but not always id order
+        if np.any(np.diff(postings) <= 0):
+            postings = np.unique(postings)
+        return postings
+
+    def __load_tombstones(self) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Loads every (person_id, before_segment) tombstone into two sorted arrays, cached until the next removal or compaction.
+        """
+        if self.__tombstones is None:
+            cursor = self.conn.cursor()
+            cursor.execute(f"SELECT person_id, before_segment FROM {self.table_name}_tombstones ORDER BY person_id ASC")
+            tombstones = np.array(cursor.fetchall(), dtype=np.int64).reshape(-1, 2)
+            self.__tombstones = (tombstones[:, 0], tombstones[:, 1])
+        return self.__tombstones
+
+    def __lookup_feature_counts(self, person_ids: np.ndarray) -> np.ndarray:
+        cursor = self.conn.cursor()
+        found = {}
+        unique = np.unique(person_ids).tolist()
+        # stay under SQLite's bound parameter limit
+        for i in range(0, len(unique), 500):
+            part = unique[i:i + 500]
+            placeholders = ", ".join("?" for _ in part)
+            cursor.execute(f"SELECT person_id, feature_count FROM {self.table_name}_documents WHERE person_id IN ({placeholders})", part)
+            found.update(cursor.fetchall())
+        return np.array([found.get(person_id, 0) for person_id in person_ids.tolist()], dtype=np.int64)
+
+    def __load_documents(self) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Loads every (person_id, feature_count) into two sorted arrays, cached until the next write.
+        """
+        if self.__documents is None:
+            cursor = self.conn.cursor()
+            cursor.execute(f"SELECT person_id, feature_count FROM {self.table_name}_documents ORDER BY person_id ASC")
+            documents = np.array(cursor.fetchall(), dtype=np.int64).reshape(-1, 2)
+            self.__documents = (documents[:, 0], documents[:, 1])
+        return self.__documents
+
+
+def migrate_row_postings(conn: sqlite3.Connection, table_name: str) -> int:
+    """
+    Converts an index written before posting lists, with one (topic_id, person_id, feature_count) row per posting.
+    initialize_index_table moves such a table to `{table_name}_rows`; this re-encodes it into `table_name`, one segment
+    per topic, and drops it. Safe to re-run after a crash. The caller is responsible for committing.
+
+    Returns:
+        int: The number of rows converted.
+    """
+    cursor = conn.cursor()
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (f"{table_name}_rows", ))
+    if cursor.fetchone() is None:
+        return 0
+
+    # a previous attempt may have written some segments before it was interrupted
+    cursor.execute(f"DELETE FROM {table_name}")
+    cursor.execute(f"DELETE FROM {table_name}_documents")
+
+    index = InverseIndex(conn, table_name)
+    converted = 0
+
+    def flush(rows: list[tuple[int, int, int]]):
+        person_ids = np.unique(np.array([row[1] for row in rows], dtype=np.int64))
+        index._add_postings({rows[0][0]: person_ids}, [row[1:] for row in rows])
+
+    # one sorted pass over the rows, each topic's rows become one segment
+    cursor.execute(f"SELECT topic_id, person_id, feature_count FROM {table_name}_rows ORDER BY topic_id, person_id")
+    topic_rows = []
+    while True:
+        batch = cursor.fetchmany(100000)
+        for row in batch:
+            if topic_rows and row[0] != topic_rows[0][0]:
+                flush(topic_rows)
+                topic_rows = []
+            topic_rows.append(row)
+        converted += len(batch)
+        if not batch:
+            break
+    if topic_rows:
+        flush(topic_rows)
+
+    cursor.execute(f"DROP TABLE {table_name}_rows")
+    return converted
@@ -36,6 +36,21 @@ class MetaData():
     
     def get_index_table_name(self) -> str:
         return self.__select_col("index_table_name")
+
+    def get_embedding_format(self) -> int:
+        return self.__select_col("embedding_format")
+
+    def get_embedding_dim(self) -> int:
+        return self.__select_col("embedding_dim")
+
+    def get_embedding_dtype(self) -> str:
+        return self.__select_col("embedding_dtype")
+
+    def get_embedding_scale(self) -> bytes:
+        return self.__select_col("embedding_scale")
+
+    def get_append_index(self) -> int:
+        return self.__select_col("append_index")
     
     def update_current_index(self, new_index: int) -> None:
         assert new_index >= 0, "new_index can't be negative"
@@ -44,6 +59,13 @@ class MetaData():
 
         cursor.execute(f"UPDATE metadata SET current_index = {new_index} WHERE trial_name = ?", (self.__trial_name, ))
 
+    def update_append_index(self, new_index: int) -> None:
+        assert new_index >= self.get_append_index(), "append_index can't move backwards"
+
+        cursor = self.__conn.cursor()
+
+        cursor.execute(f"UPDATE metadata SET append_index = ? WHERE trial_name = ?", (new_index, self.__trial_name))
+
     def update_current_stage(self, new_stage: int): 
         assert new_stage >= 0, "new_stage can't be negative"
         cursor = self.__conn.cursor()
@@ -67,6 +89,11 @@ class MetaData():
         
         cursor.execute(f"UPDATE metadata SET current_epoch = ? WHERE trial_name = ?", (new_epoch, self.__trial_name, ))
 
+    def reset_current_epoch(self):
+        cursor = self.__conn.cursor()
+
+        cursor.execute(f"UPDATE metadata SET current_epoch = 0 WHERE trial_name = ?", (self.__trial_name, ))
+
     def update_person_count(self, new_person_count: int):
         assert new_person_count >= 0, "new_person_count can't be negative"
         
@@ -100,4 +127,66 @@ class MetaData():
     def update_index_table_name(self, new_name: str): 
         cursor = self.__conn.cursor() 
 
-        cursor.execute(f"UPDATE metadata SET index_table_name = ? WHERE trial_name = ?", (new_name, self.__trial_name))
\ No newline at end of file
+        cursor.execute(f"UPDATE metadata SET index_table_name = ? WHERE trial_name = ?", (new_name, self.__trial_name))
+
+    def update_embedding_format(self, new_format: int):
+        assert new_format >= self.get_embedding_format(), "embedding_format can't be downgraded"
+
+        cursor = self.__conn.cursor()
+
+        cursor.execute(f"UPDATE metadata SET embedding_format = ? WHERE trial_name = ?", (new_format, self.__trial_name))
+
+    def update_embedding_dim(self, new_dim: int):
+        assert new_dim > 0, "new_dim must be positive"
+
+        currVal = self.get_embedding_dim()
+        assert currVal == 0 or new_dim == currVal, "Embedding dimension is immutable"
+
+        cursor = self.__conn.cursor()
+
+        cursor.execute(f"UPDATE metadata SET embedding_dim = ? WHERE trial_name = ?", (new_dim, self.__trial_name))
+
+    def update_embedding_dtype(self, new_dtype: str):
+        currVal = self.get_embedding_dtype()
+        assert currVal == "" or new_dtype == currVal, "Embedding dtype is immutable"
+
+        cursor = self.__conn.cursor()
+
+        cursor.execute(f"UPDATE metadata SET embedding_dtype = ? WHERE trial_name = ?", (new_dtype, self.__trial_name))
+
+    def update_embedding_scale(self, new_scale: bytes):
+        currVal = self.get_embedding_scale()
+        assert currVal is None or new_scale == currVal, "Embedding scale is immutable"
+
+        cursor = self.__conn.cursor()
+
+        cursor.execute(f"UPDATE metadata SET embedding_scale = ? WHERE trial_name = ?", (new_scale, self.__trial_name))
+
+
+def find_embedding_format(conn: sqlite3.Connection, embeddings_table_name: str) -> tuple[int, str, bytes]:
+    """
+    Embeddings tables are shared by every trial with the same chunking and embedding agents.
+    Returns the (dim, dtype, scale) recorded by any trial that has written to `embeddings_table_name`, or None.
+    """
+    cursor = conn.cursor()
+    cursor.execute(f"""SELECT embedding_dim, embedding_dtype, embedding_scale FROM metadata 
+                   WHERE embeddings_table_name = ? AND embedding_dim > 0 LIMIT 1""", (embeddings_table_name, ))
+    return cursor.fetchone()
+
+def find_embedding_trial(conn: sqlite3.Connection, embeddings_table_name: str, min_stage: int) -> tuple[str, int]:
+    """
+    Returns the (trial_name, person_count) of a trial that has reached `min_stage` with `embeddings_table_name`, or None.
+    """
+    cursor = conn.cursor()
+    cursor.execute(f"""SELECT trial_name, person_count FROM metadata 
+                   WHERE embeddings_table_name = ? AND current_stage >= ? ORDER BY id ASC LIMIT 1""", (embeddings_table_name, min_stage))
+    return cursor.fetchone()
+
+def find_indexed_trials(conn: sqlite3.Connection) -> list[tuple[str, str, str, str]]:
+    """
+    Returns the (trial_name, embeddings_table_name, results_table_name, index_table_name) of every trial that has created its results and index tables.
+    """
+    cursor = conn.cursor()
+    cursor.execute(f"""SELECT trial_name, embeddings_table_name, results_table_name, index_table_name FROM metadata 
+                   WHERE results_table_name != '' AND index_table_name != '' ORDER BY id ASC""")
+    return cursor.fetchall()
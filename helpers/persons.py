@@ -1,4 +1,6 @@
 import sqlite3
+import numpy as np
+from .utils.keysetCursor import KeysetCursor
 
 ## throws errors
 class Persons(): 
@@ -9,7 +11,65 @@ class Persons():
         cursor = self.conn.cursor()
         cursor.execute(f"INSERT OR REPLACE INTO persons (id, description) VALUES (?, ?)", (person_id, description, ))
 
+    def deleteDescription(self, person_id: int) -> bool:
+        """
+        Deletes a person. Their embeddings, results and feature counts go with them (ON DELETE CASCADE). Returns whether they existed.
+        """
+        cursor = self.conn.cursor()
+        cursor.execute(f"DELETE FROM persons WHERE id = ?", (person_id, ))
+        return cursor.rowcount > 0
+
+    def getDescriptions(self, person_ids: list[int]) -> list[tuple[int, str]]:
+        """
+        Gets the (id, description) tuples of the given persons that exist, ordered by id.
+        """
+        cursor = self.conn.cursor()
+        descriptions = []
+        # stays below SQLite's limit on query parameters
+        for start in range(0, len(person_ids), 500):
+            chunk = [int(person_id) for person_id in person_ids[start:start + 500]]
+            cursor.execute(f"SELECT id, description FROM persons WHERE id IN ({', '.join('?' * len(chunk))})", chunk)
+            descriptions.extend(cursor.fetchall())
+        return sorted(descriptions)
+
+    def getDescriptionSample(self, sample_size: int, seed: int = 0) -> list[tuple[int, str]]:
+        """
+        Gets the (id, description) tuples of `sample_size` persons picked uniformly at random (seeded), ordered by id.
+        """
+        cursor = self.conn.cursor()
+        cursor.execute(f"SELECT id FROM persons")
+        person_ids = np.array([row[0] for row in cursor.fetchall()], dtype=np.int64)
+        if len(person_ids) > sample_size:
+            person_ids = np.random.default_rng(seed).choice(person_ids, sample_size, replace=False)
+        return self.getDescriptions(person_ids.tolist())
+
     def getDescriptionBatch(self, row_index: int, batch_size: int) -> list[tuple[int, str]]:
         cursor = self.conn.cursor()
-        cursor.execute(f"SELECT id, description FROM persons WHERE id >= {row_index} LIMIT {batch_size}")
-        return cursor.fetchall() 
\ No newline at end of file
+        cursor.execute(f"SELECT id, description FROM persons WHERE id >= {row_index} ORDER BY id ASC LIMIT {batch_size}")
+        return cursor.fetchall()
+
+    def streamDescriptions(self, start_id: int, end_id: int = None) -> KeysetCursor:
+        """
+        Streams (id, description) tuples with ids in [start_id, end_id) in id order, batch by batch
+        (see KeysetCursor). Checkpoint the cursor's `next_key` to resume after the last batch read.
+        """
+        if end_id is None:
+            return KeysetCursor(self.conn, "SELECT id, description FROM persons WHERE id >= ? ORDER BY id ASC", (start_id, ), start_id)
+        return KeysetCursor(self.conn, "SELECT id, description FROM persons WHERE id >= ? AND id < ? ORDER BY id ASC", (start_id, end_id), start_id)
+
+    def streamUnassignedDescriptions(self, start_id: int, results_table_name: str) -> KeysetCursor:
+        """
+        Streams, like streamDescriptions, the persons from `start_id` on that have no row in `results_table_name`
+        (persons added after a trial computed its results).
+        """
+        query = f"""SELECT id, description FROM persons 
+                    WHERE id >= ? AND NOT EXISTS (SELECT 1 FROM {results_table_name} WHERE person_id = persons.id) ORDER BY id ASC"""
+        return KeysetCursor(self.conn, query, (start_id, ), start_id)
+
+    def getIdBounds(self) -> tuple[int, int, int]:
+        """
+        Returns (count, min id, max id) of the persons table. The ids are None when it is empty.
+        """
+        cursor = self.conn.cursor()
+        cursor.execute(f"SELECT COUNT(*), MIN(id), MAX(id) FROM persons")
+        return cursor.fetchone()
@@ -1,26 +1,32 @@
 from typing import Protocol
+import numpy as np
 from .embeddings import Embeddings
 
 ## Chunking agents implement description chunking step 
 class ChunkingAgent(Protocol):
     name: str
+    ## True if the agent can be pickled to chunk in worker processes
+    picklable: bool
 
     ## Chunk a piece of text 
     def chunk(self, raw_text: str) -> list[str]:
         ...
 
 ## Embedding agents implement the chunk embeding step 
+## Agents that predate the ndarray protocol (returning list[list[float]]) are wrapped by utils/ndarrayAgents
 class EmbeddingAgent(Protocol):
     name: str
+    ndarray_native: bool
 
-    ## Generate a text embedding for a piece of text 
-    def embed(self, raw_text: list[str]) -> list[list[float]]:
+    ## Generate text embeddings for a batch of texts, as a (len(raw_text), dim) float32 matrix
+    def embed(self, raw_text: list[str]) -> np.ndarray:
         ...
     
 ## Clustering agents implement the topic learning step. 
 class ClusteringAgent(Protocol):
     name: str
     topic_count: int
+    ndarray_native: bool
     
     ## Pass the filled Embeddings object used to access embeddings 
     def pass_embeddings(self, embeddings: Embeddings):
@@ -30,11 +36,45 @@ class ClusteringAgent(Protocol):
     def train():
         ...
 
-    ## Get result vector for a set of person embeddings
-    def generate_result(self, person_embeddings: list[list[float]]) -> list[int]:
+    ## Get the binary result vector (topic_count,) for a (n, dim) float32 matrix of person embeddings
+    def generate_result(self, person_embeddings: np.ndarray) -> np.ndarray:
+        ...
+
+    ## Get the (persons, topic_count) binary result matrix for many persons at once. `embeddings` stacks their 
+    ## matrices and person i owns rows offsets[i]:offsets[i + 1]. Optional: the ResearchRunner falls back to generate_result
+    def generate_results_batch(self, embeddings: np.ndarray, offsets: np.ndarray) -> np.ndarray:
         ...
 
     ## True if train has been called previously 
     def is_finished_training() -> bool:
         ...
- 
\ No newline at end of file
+ 
+
+## Clustering agents whose trained model is a set of centers. The ResearchRunner persists them in a centers table 
+## next to the results, so restarted runs and queries load them instead of retraining
+class PersistentClusteringAgent(ClusteringAgent, Protocol):
+    ## The (topic_count, dim) centers and optional per-center weights to persist (None before training)
+    def get_centers(self) -> np.ndarray:
+        ...
+
+    def get_center_weights(self) -> np.ndarray:
+        ...
+
+    ## Restore centers and weights from the centers table
+    def load_centers(self, centers: np.ndarray, weights: np.ndarray):
+        ...
+
+    ## Mark training as finished once the centers are learned or loaded
+    def finish_training(self):
+        ...
+
+## Clustering agents that learn from a stream of mini-batches (`streaming = True`). 
+## The ResearchRunner feeds them person-balanced epoch batches and checkpoints their centers after each one
+class StreamingClusteringAgent(PersistentClusteringAgent, Protocol):
+    streaming: bool
+    epochs: int
+    batch_size: int
+
+    ## Update the centers with a (n, dim) float32 batch of embeddings
+    def partial_fit(self, batch: np.ndarray):
+        ...
@@ -0,0 +1,41 @@
+import numpy as np
+from sklearn.cluster import KMeans
+from .embeddingCodec import EmbeddingCodec
+
+def quantization_report(sample: np.ndarray, codec: EmbeddingCodec, topic_count: int) -> dict:
+    """
+    Measures what storing `sample` (float32 embeddings) with `codec` costs in accuracy.
+
+    Args:
+        sample (np.ndarray): (n, dim) float32 embeddings, ideally the raw agent output.
+        codec (EmbeddingCodec): The codec the embeddings are stored with (an int8 codec should already be calibrated).
+        topic_count (int): Number of clusters used to measure k-means assignment drift, capped at one per
+                           10 sample points so each center is fit on enough of them to mean something.
+
+    Returns:
+        dict: mean/max absolute error, mean cosine similarity between original and stored vectors, 
+        and the fraction of sample points whose nearest k-means center changes after quantization 
+        (None when the sample is too small for two clusters).
+    """
+    sample = np.asarray(sample, dtype=np.float32)
+    restored = codec.from_stored(codec.to_stored(sample))
+
+    error = np.abs(restored - sample)
+    norms = np.linalg.norm(sample, axis=1) * np.linalg.norm(restored, axis=1)
+    cosine = np.sum(sample * restored, axis=1) / np.maximum(norms, 1e-12)
+
+    # Fit on the float32 sample, then check how many points switch clusters once quantized
+    clusters = min(topic_count, len(sample) // 10)
+    drift = None
+    if clusters >= 2:
+        kmeans = KMeans(n_clusters=clusters, random_state=42, n_init=1).fit(sample)
+        drift = float(np.mean(kmeans.predict(sample) != kmeans.predict(restored)))
+
+    return {
+        'dtype': codec.dtype,
+        'sample_size': len(sample),
+        'mean_abs_error': float(error.mean()),
+        'max_abs_error': float(error.max()),
+        'mean_cosine': float(cosine.mean()),
+        'assignment_drift': drift,
+    }
@@ -1,21 +1,34 @@
 import sqlite3
 from enum import Enum
 import random
-from typing import List
-
-from .metadata import MetaData
+import multiprocessing
+import os
+import queue
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+from .metadata import MetaData, find_embedding_format, find_embedding_trial, find_indexed_trials
 from .persons import Persons
-from .embeddings import Embeddings
-from .results import Results
+from .embeddings import Embeddings, migrate_pickled_embeddings
+from .embeddingCodec import EmbeddingCodec, EMBEDDING_FORMAT_VERSION, STORAGE_DTYPES
+from .quantizationReport import quantization_report
+from .results import Results, migrate_pickled_results
+from .centers import Centers
 from .prototypes import ChunkingAgent, EmbeddingAgent, ClusteringAgent
-from .setup import initialize_embeddings_table, initialize_centers_table, initialize_results_table, initialize_index_table
-from .inverseIndex import InverseIndex
+from .setup import initialize_database_tables, initialize_embedding_cache_table, initialize_embeddings_table, initialize_centers_table, initialize_results_table, initialize_index_table
+from .inverseIndex import InverseIndex, migrate_row_postings
+from .embeddingCache import EmbeddingCache
+from .shardProgress import ShardProgress
 from .updatePrinter import UpdatePrinter
 from .stopwatch import Stopwatch 
-from collections import Counter
 import datetime
 from IPython.display import display, update_display, Markdown
 from .utils.chunkDescriptionBatch import chunk_description_batch
+from .utils.ndarrayAgents import as_ndarray_embedding_agent, as_ndarray_clustering_agent, generate_results_batch
+from .utils.pipeline import run_pipeline
+from .utils.embedShard import embed_shard
+from .utils.batchController import BatchController
 
 
 def printUpdate(message: str, indent: int = 1): 
@@ -46,28 +59,62 @@ class ResearchRunner:
     embeddings: Embeddings
     results: Results
 
-    def __init__(self, db_path: str, trial_name: str, chunking_agent: ChunkingAgent, embedding_agent: EmbeddingAgent, clustering_agent: ClusteringAgent):
+    def __init__(self, db_path: str, trial_name: str, chunking_agent: ChunkingAgent, embedding_agent: EmbeddingAgent, clustering_agent: ClusteringAgent, embedding_dtype: str = 'float32', pipeline_depth: int = 0, chunking_processes: int = 0, embedding_cache_size: int = 0, embedding_workers: int = 0, memory_budget_mb: int = 0):
+        """
+        Args:
+            embedding_dtype (str): How embeddings are stored: 'float32', or the quantized 'float16' / 'int8' 
+                                   (2-4x less embedding I/O; stored in separately named tables).
+            pipeline_depth (int): When > 0, embeddings are generated by a pipeline of reader, chunking, embedding 
+                                  and writer stages with queues of this many batches. 0 runs the stage serially.
+            chunking_processes (int): Size of a process pool that chunks large description batches in parallel 
+                                      (only used with chunking agents that declare `picklable = True`). 0 chunks in-process.
+            embedding_cache_size (int): Maximum number of chunk embeddings kept in a persistent cache shared across trials, 
+                                        so repeated chunks are only embedded once per model. 0 disables the cache.
+            embedding_workers (int): When > 0, embeddings are generated by this many worker processes, each owning a 
+                                     person-id range (shard) with its own checkpoint, while this process is the only writer. 
+                                     The agents are pickled to each worker, and agents with `set_threads` get an even share of the cores 
+                                     unless they were given their own cap. The embedding cache isn't used by workers.
+            memory_budget_mb (int): RSS budget of the process (split evenly between embedding workers). Each stage's batch size 
+                                    adapts to measured rows/sec and memory so batches stay under it. 0 adapts to throughput only.
+        """
         self.error = None
+        if embedding_dtype not in STORAGE_DTYPES:
+            raise ValueError(f"Unsupported embedding dtype '{embedding_dtype}'. Expected one of {list(STORAGE_DTYPES)}")
 
         # Initialize core components
         self.chunking_agent = chunking_agent
-        self.embedding_agent = embedding_agent
-        self.clustering_agent = clustering_agent
+        self.embedding_agent = as_ndarray_embedding_agent(embedding_agent)
+        self.clustering_agent = as_ndarray_clustering_agent(clustering_agent)
         self.db_path = db_path
         self.trial_name = trial_name
+        self.embedding_dtype = embedding_dtype
+        self.pipeline_depth = pipeline_depth
+        self.chunking_processes = chunking_processes
+        self.embedding_cache_size = embedding_cache_size
+        self.embedding_workers = embedding_workers
+        self.memory_budget_mb = memory_budget_mb
+        # query() keeps its connection and index (with the index's caches) between calls
+        self._query_conn = None
+        self._query_index = None
+        self._query_data_version = None
 
         printToLog('✅ ResearchRunner Initialized!')
 
+    def _connect(self, check_same_thread: bool = True) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, check_same_thread = check_same_thread)
+        conn.execute("PRAGMA foreign_keys = ON;")
+        conn.execute("PRAGMA journal_mode = WAL;")
+        conn.execute("PRAGMA cache_size = -2000;")
+        return conn
+
     def __setup(self):
         # Database connection setup
-        self.conn: sqlite3.Connection = sqlite3.connect(self.db_path)
-        self.conn.execute("PRAGMA foreign_keys = ON;")
-        self.conn.execute("PRAGMA journal_mode = WAL;")
-        self.conn.execute("PRAGMA cache_size = -2000;")
+        self.conn: sqlite3.Connection = self._connect()
 
         # Ensure core tables exist 
-        initialize_embeddings_table(self.conn, self._get_embedding_table_name())
-        #initialize_centers_table(self.conn, self._get_centers_table_name())
+        initialize_database_tables(self.conn)
+        initialize_embeddings_table(self.conn, self._get_embedding_table_name(), sidecar = self._get_embedding_sidecar_path() is not None)
+        initialize_centers_table(self.conn, self._get_centers_table_name())
         initialize_results_table(self.conn, self._get_results_table_name())
         initialize_index_table(self.conn, self._get_index_table_name())
 
@@ -75,19 +122,39 @@ class ResearchRunner:
         self.metadata = MetaData(self.conn, self.trial_name)
         
         self.persons = Persons(self.conn)
-
-        self.embeddings = Embeddings(self.conn, self._get_embedding_table_name())
-        if self.metadata.get_embeddings_table_name() != '':
+        self.shard_progress = ShardProgress(self.conn, self.trial_name)
+
+        # Reuse the format of the shared embeddings table if another trial already wrote it
+        dim, scale = self.metadata.get_embedding_dim(), self.metadata.get_embedding_scale()
+        shared_format = find_embedding_format(self.conn, self._get_embedding_table_name()) if dim == 0 else None
+        if shared_format is not None:
+            dim, _, scale = shared_format
+        codec = EmbeddingCodec(self.embedding_dtype, dim, EmbeddingCodec.scale_from_bytes(scale))
+        self.embeddings = Embeddings(self.conn, self._get_embedding_table_name(), codec, self._get_embedding_sidecar_path())
+        if self.metadata.get_embeddings_table_name() == '':
             self.metadata.update_embeddings_table_name(self._get_embedding_table_name())
+        self._migrate_embeddings()
 
-        #self.centers = Centers(self.conn, self._get_centers_table_name(), clustering_agent.topic_count)
+        self.embedding_cache = None
+        if self.embedding_cache_size > 0:
+            initialize_embedding_cache_table(self.conn, 'chunk_embedding_cache')
+            self.embedding_cache = EmbeddingCache(self.conn, 'chunk_embedding_cache', self.embedding_cache_size)
 
-        self.results = Results(self.conn, self._get_results_table_name())
-        if self.metadata.get_results_table_name() != '':
+        self.centers = Centers(self.conn, self._get_centers_table_name(), self.clustering_agent.topic_count)
+
+        self.results = Results(self.conn, self._get_results_table_name(), self.clustering_agent.topic_count)
+        if self.metadata.get_results_table_name() == '':
             self.metadata.update_results_table_name(self._get_results_table_name())
+        if migrate_pickled_results(self.conn, self._get_results_table_name(), self.clustering_agent.topic_count) > 0:
+            printToLog("🔁 Migrated pickled results to packed bitsets", 1)
+            self.conn.commit()
 
+        converted = migrate_row_postings(self.conn, self._get_index_table_name())
+        if converted > 0:
+            printToLog(f"🔁 Migrated {converted} index rows to compressed posting lists", 1)
+            self.conn.commit()
         self.inverseIndex = InverseIndex(self.conn, self._get_index_table_name())
-        if self.metadata.get_index_table_name() != '':
+        if self.metadata.get_index_table_name() == '':
             self.metadata.update_index_table_name(self._get_index_table_name())
 
         # Restore research state
@@ -98,138 +165,507 @@ class ResearchRunner:
         # Validate clustering agent dimensions
         self.metadata.update_topic_count(self.clustering_agent.topic_count)
 
+        # Agents trained by an earlier run load the persisted centers instead of retraining
+        if self.current_stage.value > Stage.LEARNING_TOPICS.value:
+            self._restore_centers(self.centers)
+
         # Initialize update_printer
         self.update_printer = UpdatePrinter(100)
 
+    def _migrate_embeddings(self):
+        """
+        Converts embeddings pickled by older versions into the current binary format (runs once per trial).
+        """
+        if self.metadata.get_embedding_format() >= EMBEDDING_FORMAT_VERSION:
+            return
+
+        if not self.embeddings.uses_sidecar:
+            converted = migrate_pickled_embeddings(self.conn, self.embeddings.table_name, self.embeddings.codec)
+            if converted > 0:
+                printToLog(f"🔁 Migrated {converted} pickled embeddings to the binary format", 1)
+        self._record_embedding_format(self.metadata)
+        self.conn.commit()
+
+    def _record_embedding_format(self, metadata: MetaData):
+        codec = self.embeddings.codec
+        metadata.update_embedding_format(EMBEDDING_FORMAT_VERSION)
+        metadata.update_embedding_dtype(codec.dtype)
+        if codec.dim > 0:
+            metadata.update_embedding_dim(codec.dim)
+        if codec.scale is not None:
+            metadata.update_embedding_scale(codec.scale_bytes())
+
+    def _calibrate_quantization(self, sample_size: int = 200):
+        """
+        Embeds the descriptions of a random sample of persons before the first batch is stored: the int8 scale is
+        calibrated on it (rather than on whichever persons come first), and the error quantized storage introduces
+        is logged on it. The sample goes through the embedding cache, when there is one.
+        """
+        descriptions = self.persons.getDescriptionSample(sample_size)
+        if len(descriptions) == 0:
+            return
+        _, _, _, chunks = chunk_description_batch(self.chunking_agent, descriptions)
+        sample = self._embed_chunks(chunks)
+        if len(sample) == 0:
+            return
+        self.embeddings.codec.calibrate(sample)
+
+        report = quantization_report(sample[:2000], self.embeddings.codec, self.clustering_agent.topic_count)
+        drift = f"{100 * report['assignment_drift']:.2f}%" if report['assignment_drift'] is not None else 'n/a'
+        printToLog(f"📏 {report['dtype']} storage on {report['sample_size']} sampled embeddings: mean abs error {report['mean_abs_error']:.2e}, "
+                   f"max abs error {report['max_abs_error']:.2e}, mean cosine {report['mean_cosine']:.5f}, "
+                   f"k-means assignment drift {drift}", 2)
+
     def __cleanup(self):
         if self.conn: 
             self.conn.rollback()
             self.conn.close()
 
 
+    def _get_embedding_key(self):
+        # quantized embeddings differ numerically, so they (and everything derived from them) get their own tables
+        suffix = '' if self.embedding_dtype == 'float32' else f"_{self.embedding_dtype}"
+        return f"{self.chunking_agent.name}_{self.embedding_agent.name}{suffix}"
+
     def _get_embedding_table_name(self):
-        return f"embeddings_{self.chunking_agent.name}_{self.embedding_agent.name}"
+        return f"embeddings_{self._get_embedding_key()}"
 
-    #def _get_centers_table_name(self):
-    #    return f"centers_{self.chunking_agent.name}_{self.embedding_agent.name}_{self.clustering_agent.name}"
+    def _get_embedding_sidecar_path(self):
+        """
+        New embeddings tables keep their vectors in a memory-mappable file next to the database 
+        (named like SQLite's own -wal file). In-memory databases store them inline.
+        """
+        if self.db_path == ':memory:':
+            return None
+        return f"{self.db_path}-{self._get_embedding_table_name()}.emb"
+
+    def _get_centers_table_name(self):
+        return f"centers_{self._get_embedding_key()}_{self.clustering_agent.name}"
 
     def _get_results_table_name(self):
-        return f"results_{self.chunking_agent.name}_{self.embedding_agent.name}_{self.clustering_agent.name}"
+        return f"results_{self._get_embedding_key()}_{self.clustering_agent.name}"
 
     def _get_index_table_name(self):
-        return f"indexes_{self.chunking_agent.name}_{self.embedding_agent.name}_{self.clustering_agent.name}"
+        return f"indexes_{self._get_embedding_key()}_{self.clustering_agent.name}"
+
+    def _batch_controller(self, name: str, initial_size: int, workers: int = 1) -> BatchController:
+        memory_budget = self.memory_budget_mb * 2**20 // workers if self.memory_budget_mb > 0 else None
+        return BatchController(name, initial_size, memory_budget = memory_budget)
+
+    def _log_batch_sizes(self, report: dict):
+        sizes = ' → '.join(str(size) for size in report['sizes'])
+        budget = f" of {report['memory_budget'] / 2**20:.0f} MB" if report['memory_budget'] is not None else ''
+        printToLog(f"📦 {report['name']} batch sizes: {sizes} (peak RSS {report['peak_rss'] / 2**20:.0f} MB{budget})", 2)
+
+    def _write_embedding_batch(self, embeddings: Embeddings, metadata: MetaData, pids: list[int], sizes: list[int], eids: list[int], vectors: np.ndarray, next_index: int):
+        """
+        Stages a batch of embeddings together with the checkpoint that skips it on resume. The caller commits.
+        """
+        embeddings.insertEmbeddings(pids, sizes, eids, vectors)
+        self._record_embedding_format(metadata)
+        metadata.update_current_index(next_index)
+
+    def _reuse_embeddings(self) -> bool:
+        """
+        Embeddings tables are shared, so a trial that hasn't started generating skips the stage
+        when another trial has already filled its table. Returns whether the stage was skipped.
+        """
+        if self.current_index > 0 or len(self.shard_progress.get_shards()) > 0:
+            return False
+        finished = find_embedding_trial(self.conn, self._get_embedding_table_name(), Stage.LEARNING_TOPICS.value)
+        if finished is None:
+            return False
+
+        trial_name, self.person_count = finished
+        printToLog(f"♻️ Reusing the embeddings of trial {trial_name}", 2)
+        self._record_embedding_format(self.metadata)
+        self.metadata.update_person_count(self.person_count)
+        self._advance_stage()
+        return True
 
     def _generate_embeddings(self):
-        batch_size = 100
+        if self._reuse_embeddings():
+            return
+
+        batch_controller = self._batch_controller('Embedding', 100)
         self.update_printer.reload(2)
         self.update_printer.update_message_level('🚀 Generating Embeddings...', 0)
 
         stopwatch = Stopwatch()
         start_index = self.current_index
-        while True:
-            batch = self.persons.getDescriptionBatch(self.current_index, batch_size)
-            if not batch:
-                break
-            
-            self.update_printer.update_message_level(f'⏳ Generating Embeddings for persons {self.current_index}-{self.current_index + batch_size - 1}...', 1)
-            pids, sizes, eids, chunks = chunk_description_batch(self.chunking_agent, batch)
-            embeddings = self.embedding_agent.embed(chunks)
-            self.embeddings.insertEmbeddings(pids, sizes, eids, embeddings)
+        # a trial that already stored embeddings has its scale, and was reported on then
+        if self.embedding_dtype != 'float32' and self.current_index == 0 and len(self.shard_progress.get_shards()) == 0:
+            self._calibrate_quantization()
 
-            #self._process_batch(batch, lambda person: self._generate_embeddings_for_person(*person), update_log)
-            self.current_index += len(batch)
-            self.metadata.update_current_index(self.current_index)
-            self.conn.commit()
-            self.update_printer.update_message_level(f"✅ Embeddings generated for persons {start_index}-{self.current_index-1}! (⏳ {stopwatch.measure()})", 0)
+        # workers read the database through their own connections, so sharding needs a database file. 
+        # A trial that started sharded stays sharded, or its shards' embeddings would be generated twice
+        sharded = self.db_path != ':memory:' and (self.embedding_workers > 0 or len(self.shard_progress.get_shards()) > 0)
+
+        # spawn rather than fork: the embedding model may hold CUDA state, and the pipeline runs threads
+        self._chunking_pool = None
+        if self.chunking_processes > 0 and getattr(self.chunking_agent, 'picklable', False) and not sharded:
+            self._chunking_pool = ProcessPoolExecutor(self.chunking_processes, mp_context = multiprocessing.get_context('spawn'))
 
+        try:
+            if sharded:
+                self._generate_embeddings_sharded(batch_controller.next_size(), stopwatch)
+            # separate reader/writer connections need a database file
+            elif self.pipeline_depth > 0 and self.db_path != ':memory:':
+                self._generate_embeddings_pipelined(batch_controller, start_index, stopwatch)
+            else:
+                descriptions = self.persons.streamDescriptions(self.current_index)
+                while True:
+                    batch_size = batch_controller.next_size()
+                    batch_start = time.perf_counter()
+                    batch = descriptions.next_batch(batch_size)
+                    if not batch:
+                        break
+                    
+                    self.update_printer.update_message_level(f'⏳ Generating Embeddings for persons {batch[0][0]}-{batch[-1][0]}...', 1)
+                    pids, sizes, eids, chunks = chunk_description_batch(self.chunking_agent, batch, pool = self._chunking_pool)
+                    embeddings = self._embed_chunks(chunks)
+
+                    # the checkpoint is the next person id to read, so gaps in the ids are neither skipped nor repeated
+                    self._write_embedding_batch(self.embeddings, self.metadata, pids, sizes, eids, embeddings, descriptions.next_key)
+                    self.conn.commit()
+                    self.current_index = descriptions.next_key
+                    batch_controller.record(len(batch), time.perf_counter() - batch_start)
+                    self.update_printer.update_message_level(f"✅ Embeddings generated for persons {start_index}-{self.current_index-1}! (⏳ {stopwatch.measure()})", 0)
+        finally:
+            if self._chunking_pool is not None:
+                self._chunking_pool.shutdown(cancel_futures = True)
+
+        # the cursor is a person id, the stage's result is how many persons there are
+        self.person_count, _, _ = self.persons.getIdBounds()
         self.update_printer.release_levels(1)
-        self.update_printer.update_message_level(f"✅ Finished generating embeddings! ({self.current_index} results in ⏳ {stopwatch.measure()})", 0)
+        self.update_printer.update_message_level(f"✅ Finished generating embeddings! ({self.person_count} persons in ⏳ {stopwatch.measure()})", 0)
         self.update_printer.finish()
+        if not sharded:
+            self._log_batch_sizes(batch_controller.report())
+        codec = self.embeddings.codec
+        if codec.clipped_values > 0:
+            printToLog(f"✂️ int8 storage clipped {codec.clipped_values} of {codec.encoded_values} values ({100 * codec.clipped_values / codec.encoded_values:.3f}%) beyond the calibrated scale", 2)
+        report = self.embedding_agent.throughput_report() if hasattr(self.embedding_agent, 'throughput_report') else None
+        if report is not None and report['chunks'] > 0:
+            printToLog(f"⚡ Embedded {report['chunks']} chunks at {report['chunks_per_sec']:.1f} chunks/sec ({100 * report['padding_ratio']:.1f}% padding)", 2)
+        if self.embedding_cache is not None:
+            stats = self.embedding_cache.stats()
+            printToLog(f"🗃️ Embedding cache: {stats['hits']} hits, {stats['misses']} misses ({100 * stats['hit_rate']:.1f}% hit rate, {stats['entries']} entries)", 2)
         # Update metadata and move to the next stage
-        self.person_count = self.current_index
         self.metadata.update_person_count(self.person_count)
         self._advance_stage()
 
+    def _embed_chunks(self, chunks: list[str]) -> np.ndarray:
+        if self.embedding_cache is not None:
+            # cache entries are committed on their own, ahead of the batch's checkpoint
+            embeddings = self.embedding_cache.embed(self.embedding_agent, chunks)
+            self.conn.commit()
+        else:
+            embeddings = self.embedding_agent.embed(chunks)
+        return embeddings
+
+    def _generate_embeddings_pipelined(self, batch_controller: BatchController, start_index: int, stopwatch: Stopwatch):
+        """
+        Same batches and checkpoints as the serial loop, but overlapped: a reader thread prefetches descriptions,
+        a chunking thread feeds the embedding agent (on this thread), and a single writer thread owns the 
+        write connection, committing each batch's embeddings together with its `current_index` checkpoint.
+        """
+        read_conn = self._connect(check_same_thread = False)
+        write_conn = self._connect(check_same_thread = False)
+        try:
+            persons = Persons(read_conn)
+            writer_metadata = MetaData(write_conn, self.trial_name)
+            writer_embeddings = Embeddings(write_conn, self.embeddings.table_name, self.embeddings.codec, self.embeddings.sidecar_path)
+            committed_index = [self.current_index]
+
+            def read_batches():
+                descriptions = persons.streamDescriptions(self.current_index)
+                while True:
+                    batch = descriptions.next_batch(batch_controller.next_size())
+                    if not batch:
+                        return
+                    yield descriptions.next_key, batch
+
+            def chunk(item):
+                next_index, batch = item
+                return next_index, len(batch), chunk_description_batch(self.chunking_agent, batch, pool = self._chunking_pool)
+
+            def embed(item):
+                next_index, person_count, (pids, sizes, eids, chunks) = item
+                self.update_printer.update_message_level(f'⏳ Generating Embeddings for persons up to {next_index - 1}...', 1)
+                # embedding is the pipeline's bottleneck, so it paces the batch size
+                embed_start = time.perf_counter()
+                if self.embedding_cache is not None:
+                    # only the writer touches the database, so the cache update rides along with the batch
+                    embeddings, cache_update = self.embedding_cache.lookup(self.embedding_agent, chunks)
+                else:
+                    embeddings, cache_update = self.embedding_agent.embed(chunks), None
+                # persons read, like the serial loop: chunkless descriptions still count
+                batch_controller.record(person_count, time.perf_counter() - embed_start)
+                self.update_printer.update_message_level(f"✅ Embeddings generated for persons {start_index}-{committed_index[0]-1}! (⏳ {stopwatch.measure()})", 0)
+                return next_index, pids, sizes, eids, embeddings, cache_update
+
+            def write(item):
+                next_index, pids, sizes, eids, embeddings, cache_update = item
+                if cache_update is not None:
+                    self.embedding_cache.store(cache_update, write_conn)
+                self._write_embedding_batch(writer_embeddings, writer_metadata, pids, sizes, eids, embeddings, next_index)
+                write_conn.commit()
+                committed_index[0] = next_index
+
+            run_pipeline(read_batches(), [chunk, embed, write], depth = self.pipeline_depth, main_stage = 1)
+            self.current_index = committed_index[0]
+        finally:
+            read_conn.close()
+            write_conn.rollback()
+            write_conn.close()
+
+    def _generate_embeddings_sharded(self, batch_size: int, stopwatch: Stopwatch):
+        """
+        Splits the persons into `embedding_workers` id ranges and embeds each in its own spawned process. 
+        Workers only read; their batches funnel through a bounded queue to this process, which commits each 
+        batch together with its shard's cursor in `shard_progress`. Finished shards are skipped on resume.
+        """
+        person_count, min_id, max_id = self.persons.getIdBounds()
+        if person_count > 0:
+            self.shard_progress.plan_shards(max(self.current_index, min_id), max_id + 1, max(self.embedding_workers, 1))
+            self.conn.commit()
+        pending = self.shard_progress.get_unfinished_shards()
+        shard_count = len(self.shard_progress.get_shards())
+
+        context = multiprocessing.get_context('spawn')
+        out_queue = context.Queue(maxsize = 2 * max(self.embedding_workers, 1))
+        workers: dict[int, multiprocessing.Process] = {}
+        finished = shard_count - len(pending)
+
+        def start_next_shard():
+            shard = pending.pop(0)
+            memory_budget = self.memory_budget_mb * 2**20 // max(self.embedding_workers, 1) if self.memory_budget_mb > 0 else None
+            threads = max((os.cpu_count() or 1) // max(self.embedding_workers, 1), 1)
+            worker = context.Process(target = embed_shard, args = (self.db_path, shard, self.chunking_agent, self.embedding_agent, batch_size, out_queue, memory_budget, threads), daemon = True)
+            worker.start()
+            workers[shard[0]] = worker
+
+        try:
+            while pending and len(workers) < max(self.embedding_workers, 1):
+                start_next_shard()
+
+            while workers:
+                try:
+                    message = out_queue.get(timeout = 1)
+                except queue.Empty:
+                    # a worker killed outside of Python never reports back
+                    for shard_id, worker in workers.items():
+                        if not worker.is_alive() and worker.exitcode != 0:
+                            raise Exception(f"Embedding worker for shard {shard_id} exited with code {worker.exitcode}")
+                    continue
+
+                kind, shard_id = message[0], message[1]
+                if kind == 'error':
+                    raise Exception(f"Embedding shard {shard_id} failed:\n{message[2]}")
+
+                if kind == 'batch':
+                    _, _, next_index, pids, sizes, eids, embeddings = message
+                    self.embeddings.insertEmbeddings(pids, sizes, eids, embeddings)
+                    self._record_embedding_format(self.metadata)
+                else:
+                    _, _, next_index, batch_report = message
+                    self._log_batch_sizes(batch_report)
+                    workers.pop(shard_id).join()
+                    finished += 1
+                    if pending:
+                        start_next_shard()
+
+                # the batch and the cursor that skips it on resume are committed together
+                self.shard_progress.update_shard_index(shard_id, next_index)
+                self.conn.commit()
+                self.update_printer.update_message_level(f'⏳ Generating Embeddings for {shard_count} shards ({finished} finished)...', 1)
+                self.update_printer.update_message_level(f"✅ Embeddings generated for {finished}/{shard_count} shards! (⏳ {stopwatch.measure()})", 0)
+        finally:
+            for worker in workers.values():
+                worker.terminate()
+                worker.join()
+
+        # the stage advances only once every shard is done
+        assert len(self.shard_progress.get_unfinished_shards()) == 0, "Embedding shards out of sync!"
+        self.current_index = max_id + 1 if person_count > 0 else self.current_index
+
+    def _is_streaming(self) -> bool:
+        return getattr(self.clustering_agent, 'streaming', False)
+
+    def _is_persistent(self) -> bool:
+        return hasattr(self.clustering_agent, 'get_centers') and hasattr(self.clustering_agent, 'load_centers')
+
+    def _restore_centers(self, centers: Centers) -> bool:
+        """
+        Loads the trained centers from the centers table into an untrained agent. Returns whether the agent is trained.
+        """
+        if self.clustering_agent.is_finished_training():
+            return True
+        if not self._is_persistent():
+            return False
+
+        stored = centers.get_centers()
+        if stored is None:
+            return False
+        self.clustering_agent.load_centers(stored, centers.get_weights())
+        self.clustering_agent.finish_training()
+        return True
+
     def _train_clusters(self):
         start_time = datetime.datetime.now()
-        if not self.clustering_agent.is_finished_training():
+        if self._is_streaming() and not self.clustering_agent.is_finished_training():
+            self._train_clusters_streaming()
+        elif not self.clustering_agent.is_finished_training():
             self.clustering_agent.pass_embeddings(self.embeddings)
             self.clustering_agent.train()
         delta = datetime.datetime.now() - start_time
         printUpdate(f"✅ Topics learned! (⏳ {delta})", 2)
+
+        # the centers are committed together with the stage advance, so a finished stage always has them
+        if self._is_persistent():
+            self.centers.update_centers(self.clustering_agent.get_centers(), self.clustering_agent.get_center_weights())
         self._advance_stage()
 
 
-    def _compute_results_for_person(self, person_id: int, embeddings: List[List[int]]):
-        result = self.clustering_agent.generate_result(embeddings)
-        self.results.insertResult(person_id, result)
+    def _train_clusters_streaming(self):
+        """
+        Feeds a streaming agent person-balanced epoch batches (see getEmbeddingBatch), committing its centers 
+        together with the (current_epoch, current_index) cursor after every batch, so training resumes mid-epoch.
+        """
+        agent = self.clustering_agent
+        agent.pass_embeddings(self.embeddings)
+
+        centers = self.centers.get_centers()
+        if centers is not None:
+            agent.load_centers(centers, self.centers.get_weights())
+
+        self.update_printer.reload(1)
+        epoch = self.metadata.get_current_epoch()
+        while epoch < agent.epochs:
+            self.update_printer.update_message_level(f"⏳ Epoch {epoch + 1}/{agent.epochs} from embedding {self.current_index}...", 0)
+            while True:
+                last_id, batch = self.embeddings.getEmbeddingBatch(self.current_index, agent.batch_size, epoch)
+                if len(batch) == 0:
+                    break
+
+                agent.partial_fit(batch)
+                self.current_index = last_id + 1
+                self.centers.update_centers(agent.get_centers(), agent.get_center_weights())
+                self.metadata.update_current_index(self.current_index)
+                self.conn.commit()
+
+            epoch += 1
+            self.current_index = 0
+            self.metadata.update_current_epoch(epoch)
+            self.metadata.update_current_index(self.current_index)
+            self.conn.commit()
+
+        self.update_printer.update_message_level(f"✅ Trained for {agent.epochs} epochs!", 0)
+        self.update_printer.finish()
+        agent.finish_training()
+        self.metadata.reset_current_epoch()
 
     def _compute_results(self):
-        batch_size = 1000
+        """
+        Computes every person's result vector and its inverse index postings in one pass: each block of persons 
+        commits its results, its postings and the checkpoint that skips it together, so the two old stages 
+        (COMPUTING_RESULTS, INDEXING) resume as one unit and the results are never read back.
+        """
+        batch_controller = self._batch_controller('Results', 1000)
         
         stopwatch = Stopwatch()
         self.update_printer.reload(2)
         self.update_printer.update_message_level("🎯 Restoring progress...", 0)
+        if not self.clustering_agent.is_finished_training():
+            # resuming with an agent that has no persisted centers: retrain it on the stored embeddings
+            self.clustering_agent.pass_embeddings(self.embeddings)
+            self.clustering_agent.train()
+        self._index_unindexed_results()
         start_index = self.current_index
 
+        blocks = self.embeddings.streamPersonEmbeddings(self.current_index)
         while True:
-            batch = self.embeddings.getPersonEmbeddingsBatch(self.current_index, batch_size)
-            if not batch:
+            batch_size = batch_controller.next_size()
+            batch_start = time.perf_counter()
+            person_ids, offsets, embeddings = blocks.next_batch(batch_size)
+            if len(person_ids) == 0:
                 break
 
-            for i, (person_id, _, embeddings) in enumerate(batch):
-                self.update_printer.update_message_level(f"✅ Results generated for persons {start_index}-{self.current_index-1}! (⏳ {stopwatch.measure()})")
-                self.update_printer.update_message_level(f"⏳ Generating results for persons {self.current_index}-{self.current_index + batch_size - 1} ({i}/{len(batch)})...", 1)
-                result = self.clustering_agent.generate_result(embeddings)
-                self.results.insertResult(person_id, result)
+            # one assignment call and one executemany per table per block of persons
+            self.update_printer.update_message_level(f"⏳ Generating results for persons {person_ids[0]}-{person_ids[-1]} ({len(person_ids)} persons)...", 1)
+            results = generate_results_batch(self.clustering_agent, embeddings, offsets)
+            self.results.insertResults(person_ids, results)
+            self.inverseIndex.add_results(person_ids, results)
             
-            self.current_index += len(batch)
+            self.current_index = blocks.next_key
             self.metadata.update_current_index(self.current_index)
             self.conn.commit()
+            batch_controller.record(len(person_ids), time.perf_counter() - batch_start)
+            self.update_printer.update_message_level(f"✅ Results generated and indexed for persons {start_index}-{self.current_index-1}! (⏳ {stopwatch.measure()})")
     
         self.update_printer.release_levels(1)
         self.update_printer.update_message_level(f"✅ Finished! (⏳ {stopwatch.measure()})", 0)
+        self._log_batch_sizes(batch_controller.report())
 
-        # Update metadata and move to the next stage
+        # INDEXING is already done, so both stages advance in one commit
+        self._advance_stage(commit = False)
         self._advance_stage()
 
-    def _inverse_index(self):
+    def _index_unindexed_results(self):
         """
-        Generates the inverse index for the results stored in the results table.
+        Trials stopped inside COMPUTING_RESULTS by versions without the fused stage have results but no postings.
+        Those results are indexed before the fused pass continues, in one transaction, so a crash just redoes it.
         """
-        batch_size = 100
+        if self.current_index == 0 or not self.inverseIndex.is_empty():
+            return
 
+        stored = self.results.streamPersonResults(0)
+        while True:
+            person_ids, results = stored.next_batch(1000)
+            if len(person_ids) == 0:
+                break
+            self.inverseIndex.add_results(person_ids, results)
+        printToLog(f"🔁 Indexed the results of persons before {self.current_index}", 2)
+        self.conn.commit()
+
+    def _inverse_index(self):
+        """
+        Generates the inverse index for the results stored in the results table. New trials index their results
+        while computing them (see _compute_results), this only finishes trials that stopped in the old INDEXING stage.
+        """
         if self.current_stage != Stage.INDEXING:
             return
 
+        batch_controller = self._batch_controller('Indexing', 100)
+
         stopwatch = Stopwatch()
         self.update_printer.reload(2)
         self.update_printer.update_message_level("🎯 Restoring progress...", 0)
         start_index = self.current_index
         
+        stored = self.results.streamPersonResults(self.current_index)
         while True:
             # Fetch a batch of results for processing
-            batch = self.results.getPersonResultsBatch(self.current_index, batch_size)
-            if not batch:
+            batch_size = batch_controller.next_size()
+            batch_start = time.perf_counter()
+            person_ids, results = stored.next_batch(batch_size)
+            if len(person_ids) == 0:
                 break
 
-            # Process each person's results
-            for i, (person_id, result_vector) in enumerate(batch):
-                self.update_printer.update_message_level(f"✅ Inverse Indexes applied to persons {start_index}-{self.current_index-1}! (⏳ {stopwatch.measure()})")
-                self.update_printer.update_message_level(f"⏳ Applying inverse indexes to persons {self.current_index}-{self.current_index + batch_size - 1} ({i}/{len(batch)})...", 1)
-                # Get the topic IDs (indices of 1s in the sparse binary vector)
-                topic_ids = [idx for idx, val in enumerate(result_vector) if val == 1]
-                
-                # Add the result vector to the inverse index
-                self.inverseIndex.add_result_vector(topic_ids, person_id, len(topic_ids))
+            self.update_printer.update_message_level(f"⏳ Applying inverse indexes to persons {person_ids[0]}-{person_ids[-1]}...", 1)
+            self.inverseIndex.add_results(person_ids, results)
 
             # Update the current index and commit progress
-            self.current_index += len(batch)
+            self.current_index = stored.next_key
             self.metadata.update_current_index(self.current_index)
             self.conn.commit()
+            batch_controller.record(len(person_ids), time.perf_counter() - batch_start)
+            self.update_printer.update_message_level(f"✅ Inverse Indexes applied to persons {start_index}-{self.current_index-1}! (⏳ {stopwatch.measure()})")
 
         self.update_printer.release_levels(1)
         self.update_printer.update_message_level(f"✅ Finished! (⏳ {stopwatch.measure()})", 0)    
+        self._log_batch_sizes(batch_controller.report())
 
         # Update metadata to advance to the next stage
         self._advance_stage()
@@ -239,14 +675,19 @@ class ResearchRunner:
         query = f"SELECT 1 from {table_name} LIMIT 1"
         return self.conn.execute(query).fetchone() != None
 
-    def _advance_stage(self): 
+    def _advance_stage(self, commit: bool = True): 
         self.current_stage = Stage(self.current_stage.value + 1)
         self.metadata.update_current_stage(self.current_stage.value)
         self.current_index = 0
         self.metadata.update_current_index(self.current_index)
-        self.conn.commit()          
+        if commit:
+            self.conn.commit()          
 
-    def run_research(self):
+    def run_research(self, until: Stage = Stage.DONE):
+        """
+        Runs (or resumes) every stage of the trial. Stops once `until` is reached, e.g. 
+        Stage.LEARNING_TOPICS only generates the embeddings.
+        """
         try:
             ## Connect to db & restore state 
             self.__setup()
@@ -258,57 +699,235 @@ class ResearchRunner:
             else: 
                 printToLog("🚀 Resuming Research Pipeline...", 0)
 
-
-            ## Generate Embeddings 
-            printToLog("🏋️‍♂️ Generating Embeddings", 1)
-            if self.current_stage == Stage.GENERATING_EMBEDDINGS:
-                self._generate_embeddings()
-            else: 
-                printToLog("✅ Already done! Skipping...", 2)
-
-            ## Train Clusters
-            printToLog("📖 Learning topics...", 1)
-            if self.current_stage == Stage.LEARNING_TOPICS:
-                self._train_clusters()
-            else: 
-                printToLog("✅ Already done! Skipping...", 2)
-
-            ## Generate Results
-            printToLog("🖊️ Generating Results...", 1)
-            if self.current_stage == Stage.COMPUTING_RESULTS:
-                self._compute_results()
-            else: 
-                printToLog("✅ Already done! Skipping...", 2)
-
-            ## Index documents
-            printToLog("📁 Indexing Documents...", 1)
-            if self.current_stage == Stage.INDEXING:
-                self._inverse_index()
-            else: 
-                printToLog("✅ Already done! Skipping...", 2)
+            stages = [
+                (Stage.GENERATING_EMBEDDINGS, "🏋️‍♂️ Generating Embeddings", self._generate_embeddings),
+                (Stage.LEARNING_TOPICS, "📖 Learning topics...", self._train_clusters),
+                (Stage.COMPUTING_RESULTS, "🖊️ Generating Results & Indexing Documents...", self._compute_results),
+                (Stage.INDEXING, "📁 Indexing Documents...", self._inverse_index),
+            ]
+            for stage, message, run_stage in stages:
+                if stage.value >= until.value:
+                    break
+                printToLog(message, 1)
+                if self.current_stage == stage:
+                    run_stage()
+                else: 
+                    printToLog("✅ Already done! Skipping...", 2)
             
             ## Done!
-            if self.current_stage != Stage.DONE:
+            if self.current_stage.value < until.value:
                 raise AssertionError(f"Stages out of sync! Current Stage: {self.current_stage}")
-            printToLog("🎉 Research Completed!", 0)
+            if until == Stage.DONE:
+                printToLog("🎉 Research Completed!", 0)
         finally: 
             self.__cleanup()
 
-    def query(self, query: str): 
-        if self.current_stage != Stage.DONE:
-            raise AssertionError('Cannot query until research is finished')
-        
+    def append_persons(self) -> int:
+        """
+        Adds the persons inserted after the trial finished, at the cost of the new persons only: each is embedded 
+        (unless a trial sharing the embeddings table already did), assigned to its topics by the trained model and 
+        indexed. Every batch commits its embeddings, results and postings with the trial's `append_index` watermark, 
+        so an interrupted append resumes after its last batch. Meant to run after every ingest into `persons`, 
+        with new persons given ids above the watermark (the first append of a trial checks every id once).
+        Persons updated through another trial (see update_person) are re-indexed first.
+
+        Returns:
+            int: The number of persons added.
+        """
+        try:
+            self.__setup()
+            if self.current_stage != Stage.DONE:
+                raise AssertionError('Cannot append persons until research is finished')
+
+            printToLog("➕ Appending new persons...", 0)
+            self._prepare_assignment()
+            batch_controller = self._batch_controller('Appending', 100)
+            stopwatch = Stopwatch()
+            self.update_printer.reload(1)
+            added = 0
+
+            # updated persons below the watermark have lost their results, but the stream below won't see them again
+            watermark = self.metadata.get_append_index()
+            updated = [person_id for person_id in self.inverseIndex.get_unindexed_tombstones() if person_id < watermark]
+            for start in range(0, len(updated), 100):
+                added += self._assign_persons(self.persons.getDescriptions(updated[start:start + 100]))
+                self.conn.commit()
+
+            new_persons = self.persons.streamUnassignedDescriptions(watermark, self._get_results_table_name())
+            while True:
+                batch_start = time.perf_counter()
+                batch = new_persons.next_batch(batch_controller.next_size())
+                if not batch:
+                    break
+                self.update_printer.update_message_level(f"⏳ Appending persons {batch[0][0]}-{batch[-1][0]}...", 0)
+                added += self._assign_persons(batch)
+                self.metadata.update_append_index(new_persons.next_key)
+                self.conn.commit()
+                batch_controller.record(len(batch), time.perf_counter() - batch_start)
+
+            self.update_printer.update_message_level(f"✅ Appended {added} persons! (⏳ {stopwatch.measure()})", 0)
+            self.update_printer.finish()
+            if added > 0:
+                self._log_batch_sizes(batch_controller.report())
+            return added
+        finally:
+            self.__cleanup()
+
+    def update_person(self, person_id: int, description: str) -> None:
+        """
+        Replaces a person's description, then re-embeds and re-indexes only that person in this trial, in one commit.
+        Every trial forgets the person's old embeddings, results and postings; other trials re-index them on their
+        next append_persons.
+        """
+        try:
+            self.__setup()
+            if self.current_stage != Stage.DONE:
+                raise AssertionError('Cannot update persons until research is finished')
+
+            self._prepare_assignment()
+            self._forget_person(person_id)
+            # the cascade takes the old embeddings and results of every trial with it
+            self.persons.deleteDescription(person_id)
+            self.persons.insertDescription(person_id, description)
+            self._assign_persons([(person_id, description)])
+            self.conn.commit()
+            printToLog(f"✏️ Updated person {person_id}", 0)
+        finally:
+            self.__cleanup()
+
+    def delete_person(self, person_id: int) -> bool:
+        """
+        Deletes a person from the database and from every trial. Their embeddings and results are deleted right away
+        (ON DELETE CASCADE, through the person_id indexes), their postings are tombstoned until compact_index().
+
+        Returns:
+            bool: Whether the person existed.
+        """
+        try:
+            self.__setup()
+            if len(self.persons.getDescriptions([person_id])) == 0:
+                return False
+
+            self._forget_person(person_id)
+            self.persons.deleteDescription(person_id)
+            self.conn.commit()
+            printToLog(f"🗑️ Deleted person {person_id}", 0)
+            return True
+        finally:
+            self.__cleanup()
+
+    def compact_index(self) -> int:
+        """
+        Purges the postings of deleted and updated persons from this trial's index (see InverseIndex.compact).
+        Commits topic by topic, so it can run while the trial is queried or appended to.
+
+        Returns:
+            int: The number of dead postings purged.
+        """
+        try:
+            self.__setup()
+            stopwatch = Stopwatch()
+            purged = self.inverseIndex.compact()
+            printToLog(f"🧹 Compacted the index, {purged} dead postings purged (⏳ {stopwatch.measure()})", 0)
+            return purged
+        finally:
+            self.__cleanup()
+
+    def _prepare_assignment(self):
+        if not self.clustering_agent.is_finished_training():
+            # agents without persisted centers retrain on the stored embeddings
+            self.clustering_agent.pass_embeddings(self.embeddings)
+            self.clustering_agent.train()
+
+    def _assign_persons(self, batch: list[tuple[int, str]]) -> int:
+        """
+        Embeds the persons of `batch` that have no embeddings yet, then stages their results, postings and 
+        the trial's new person_count. The caller commits. Returns how many persons were assigned 
+        (persons whose descriptions make no chunks get no results, and aren't counted).
+        """
+        if not batch:
+            return 0
+        person_ids = [person_id for person_id, _ in batch]
+
+        person_ids_found, offsets, embeddings = self.embeddings.getEmbeddingsOfPersons(person_ids)
+        embedded = set(person_ids_found.tolist())
+        missing = [person for person in batch if person[0] not in embedded]
+        pids, sizes, eids, chunks = chunk_description_batch(self.chunking_agent, missing) if missing else ([], [], [], [])
+        if chunks:
+            self.embeddings.insertEmbeddings(pids, sizes, eids, self._embed_chunks(chunks))
+            self._record_embedding_format(self.metadata)
+            # read back from storage, so quantized trials assign the vectors they store
+            person_ids_found, offsets, embeddings = self.embeddings.getEmbeddingsOfPersons(person_ids)
+
+        results = generate_results_batch(self.clustering_agent, embeddings, offsets)
+        self.results.insertResults(person_ids_found, results)
+        self.inverseIndex.add_results(person_ids_found, results)
+
+        self.person_count += len(person_ids_found)
+        self.metadata.update_person_count(self.person_count)
+        return len(person_ids_found)
+
+    def _forget_person(self, person_id: int):
+        """
+        Tombstones a person's postings in every trial's index, and takes them out of the person_count of every
+        trial that had a result for them. The caller deletes or replaces the person and commits.
+        """
+        trials = find_indexed_trials(self.conn)
+        for _, embeddings_table_name, results_table_name, index_table_name in trials:
+            # trials not run since tombstones and person_id indexes were introduced get them now, 
+            # or the ON DELETE CASCADE and hasResult below scan their tables
+            if embeddings_table_name != '':
+                initialize_embeddings_table(self.conn, embeddings_table_name)
+            initialize_results_table(self.conn, results_table_name)
+            initialize_index_table(self.conn, index_table_name)
+
+        for trial_name, _, results_table_name, index_table_name in trials:
+            metadata = MetaData(self.conn, trial_name)
+            if Results(self.conn, results_table_name, metadata.get_topic_count()).hasResult(person_id):
+                metadata.update_person_count(metadata.get_person_count() - 1)
+            InverseIndex(self.conn, index_table_name).remove_persons([person_id])
+        # this trial's index and count were changed through other objects
+        self.inverseIndex = InverseIndex(self.conn, self._get_index_table_name())
+        self.person_count = self.metadata.get_person_count()
+
+    def query(self, query: str, k: int = None): 
+        """
+        Ranks persons by the query's topics they share, rare topics weighing more and persons with many topics less
+        (see InverseIndex.top_k_documents). With `k`, only the top k are scored to the end and returned.
+        Works on a finished trial from any process: the trained centers are loaded from the centers table rather than retrained.
+        """
         query = query.strip()
+
+        conn = self._query_connection()
+        metadata = MetaData(conn, self.trial_name)
+        if Stage(metadata.get_current_stage()) != Stage.DONE:
+            raise AssertionError('Cannot query until research is finished')
         if not query:
             return []
-        
-        if not self.clustering_agent.is_finished_training():
+
+        if not self._restore_centers(Centers(conn, self._get_centers_table_name(), self.clustering_agent.topic_count)):
+            # agents without persisted centers retrain on the stored embeddings
+            codec = EmbeddingCodec(self.embedding_dtype, metadata.get_embedding_dim(), EmbeddingCodec.scale_from_bytes(metadata.get_embedding_scale()))
+            self.clustering_agent.pass_embeddings(Embeddings(conn, self._get_embedding_table_name(), codec, self._get_embedding_sidecar_path()))
             self.clustering_agent.train()
 
         chunks: list[str] = self.chunking_agent.chunk(query)
-        embeddings: list[list[int]] = [self.embedding_agent.embed(c) for c in chunks]
-        result: list[int] = self.clustering_agent.generate_result(embeddings)
-        topics = [i for i, x in enumerate(result) if x == 1]
-        matches = self.inverseIndex.get_all_documents_by_topics(topics, False)
-        counter = Counter(matches)
-        return [e[0] for e in counter.most_common()]
+        embeddings: np.ndarray = self.embedding_agent.embed(chunks)
+        result: np.ndarray = self.clustering_agent.generate_result(embeddings)
+        topics = np.flatnonzero(result).tolist()
+        person_ids, _ = self._query_index.top_k_documents(topics, k)
+        return person_ids.tolist()
+
+    def _query_connection(self) -> sqlite3.Connection:
+        """
+        The connection queries share, with an InverseIndex whose caches (posting lists, document count) are kept 
+        across queries until any other connection commits a change to the database.
+        """
+        if self._query_conn is None:
+            self._query_conn = self._connect()
+
+        data_version = self._query_conn.execute("PRAGMA data_version").fetchone()[0]
+        if self._query_index is None or data_version != self._query_data_version:
+            self._query_index = InverseIndex(self._query_conn, self._get_index_table_name())
+            self._query_data_version = data_version
+        return self._query_conn
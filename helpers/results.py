@@ -1,27 +1,55 @@
 import sqlite3
 import pickle
+import numpy as np
+from .utils.keysetCursor import KeysetCursor
+
+# Result vectors are binary, so they are stored as np.packbits bitsets: topic_count / 8 bytes per person 
+# instead of a pickled list of ints. Similarity search keeps all bitsets in one memory-resident matrix
+# and counts bits with a byte lookup table, which scans millions of persons in milliseconds.
+POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
 
 class Results():
-    def __init__(self, conn: sqlite3.Connection, table_name: str):
+    def __init__(self, conn: sqlite3.Connection, table_name: str, topic_count: int):
         self.__conn = conn
         self.__table_name = table_name
+        self.__topic_count = topic_count
+        self.__bitsets = None
 
     
     def insertResult(self, person_id: int, result: list[int]):
         cursor = self.__conn.cursor()
         
-        blob_result = pickle.dumps(result)
+        blob_result = self.__pack(result)
 
         cursor.execute(f"INSERT OR REPLACE INTO {self.__table_name} (id, person_id, result) VALUES (?, ?, ?)", (person_id, person_id, blob_result))
+        self.__bitsets = None
+
+    def insertResults(self, person_ids: list[int], results: np.ndarray):
+        """
+        Inserts the (len(person_ids), topic_count) binary result matrix of a batch of persons. The caller commits.
+        """
+        results = np.asarray(results, dtype=np.uint8)
+        assert results.shape == (len(person_ids), self.__topic_count), f"Result matrix must have shape ({len(person_ids)}, {self.__topic_count})"
+        packed = np.packbits(results, axis=1)
 
-    def getAllResults(self): 
+        cursor = self.__conn.cursor()
+        cursor.executemany(f"INSERT OR REPLACE INTO {self.__table_name} (id, person_id, result) VALUES (?, ?, ?)",
+                           [(int(person_id), int(person_id), packed[i].tobytes()) for i, person_id in enumerate(person_ids)])
+        self.__bitsets = None
+
+    def hasResult(self, person_id: int) -> bool:
+        cursor = self.__conn.cursor()
+        cursor.execute(f"SELECT 1 FROM {self.__table_name} WHERE person_id = ?", (person_id, ))
+        return cursor.fetchone() is not None
+
+    def getAllResults(self) -> np.ndarray: 
         cursor = self.__conn.cursor()
         
         cursor.execute(f'SELECT result FROM {self.__table_name}')
 
-        return [pickle.loads(r[0]) for r in cursor.fetchall()]
+        return self.__unpack([r[0] for r in cursor.fetchall()])
 
-    def getPersonResultsBatch(self, start_id: int, batch_size: int) -> list[tuple[int, list[int]]]:
+    def getPersonResultsBatch(self, start_id: int, batch_size: int) -> list[tuple[int, np.ndarray]]:
         """
         Fetches a batch of result vectors from the results table.
 
@@ -30,11 +58,11 @@ class Results():
             batch_size (int): Number of results to fetch.
 
         Returns:
-            list[tuple[int, list[int]]]: List of tuples (person_id, result_vector).
+            list[tuple[int, np.ndarray]]: List of tuples (person_id, result_vector).
         """
         cursor = self.__conn.cursor()
 
-        # Query to fetch person IDs and serialized results
+        # Query to fetch person IDs and packed results
         query = f"""
         SELECT person_id, result
         FROM {self.__table_name}
@@ -45,7 +73,106 @@ class Results():
         cursor.execute(query, (start_id, batch_size))
         results = cursor.fetchall()
 
-        # Deserialize the result vectors
-        return [(row[0], pickle.loads(row[1])) for row in results]
+        # Unpack the result vectors
+        vectors = self.__unpack([row[1] for row in results])
+        return [(row[0], vectors[i]) for i, row in enumerate(results)]
+
+    def streamPersonResults(self, start_id: int) -> KeysetCursor:
+        """
+        Streams the results of every person from `start_id` on, in person id order. Each `next_batch(n)` returns
+        the (person_ids, results) of the next n persons, with results a (n, topic_count) uint8 matrix.
+        Checkpoint the cursor's `next_key` to resume after the last batch read.
+        """
+        def unpack(rows: list[tuple]) -> tuple[np.ndarray, np.ndarray]:
+            return np.array([row[0] for row in rows], dtype=np.int64), self.__unpack([row[1] for row in rows])
+
+        return KeysetCursor(self.__conn, f"SELECT person_id, result FROM {self.__table_name} WHERE person_id >= ? ORDER BY person_id ASC", (start_id, ), start_id, transform=unpack)
+
+    def most_similar(self, person_id: int, k: int, metric: str = 'jaccard') -> list[tuple[int, float]]:
+        """
+        Ranks every other person by the similarity of their result vector to `person_id`'s.
+
+        Args:
+            person_id (int): The person to find neighbours for.
+            k (int): Number of neighbours to return.
+            metric (str): 'jaccard' (shared topics / topics of either) or 'hamming' (1 - differing topics / topic_count).
+
+        Returns:
+            list[tuple[int, float]]: Up to k (person_id, similarity) tuples, most similar first.
+        """
+        if metric not in ('jaccard', 'hamming'):
+            raise ValueError(f"Unknown similarity metric '{metric}'")
+
+        person_ids, bitsets = self.__load_bitsets()
+        row = np.searchsorted(person_ids, person_id)
+        if row == len(person_ids) or person_ids[row] != person_id:
+            raise KeyError(f"No result stored for person {person_id}")
+
+        target = bitsets[row]
+        if metric == 'jaccard':
+            shared = POPCOUNT[bitsets & target].sum(axis=1, dtype=np.int64)
+            either = POPCOUNT[bitsets | target].sum(axis=1, dtype=np.int64)
+            similarity = np.divide(shared, either, out=np.zeros(len(shared)), where=either > 0)
+        else:
+            differing = POPCOUNT[bitsets ^ target].sum(axis=1, dtype=np.int64)
+            similarity = 1 - differing / self.__topic_count
+
+        # never return the person themselves
+        similarity[row] = -np.inf
+        k = min(k, len(person_ids) - 1)
+        if k <= 0:
+            return []
+
+        top = np.argpartition(-similarity, k - 1)[:k]
+        top = top[np.lexsort((person_ids[top], -similarity[top]))]
+        return [(int(person_ids[i]), float(similarity[i])) for i in top]
+
+    def __load_bitsets(self) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Loads every packed result into a (person_count, ceil(topic_count / 8)) uint8 matrix, cached until the next insert.
+        """
+        if self.__bitsets is None:
+            cursor = self.__conn.cursor()
+            cursor.execute(f"SELECT person_id, result FROM {self.__table_name} ORDER BY person_id ASC")
+            rows = cursor.fetchall()
+
+            person_ids = np.array([row[0] for row in rows], dtype=np.int64)
+            packed = np.frombuffer(b''.join(row[1] for row in rows), dtype=np.uint8).reshape(len(rows), self.__packed_bytes())
+            self.__bitsets = (person_ids, packed)
+        return self.__bitsets
+
+    def __packed_bytes(self) -> int:
+        return (self.__topic_count + 7) // 8
+
+    def __pack(self, result) -> bytes:
+        vector = np.asarray(result, dtype=np.uint8)
+        assert len(vector) == self.__topic_count, f"Result vector must have length {self.__topic_count}"
+        return np.packbits(vector).tobytes()
+
+    def __unpack(self, blobs: list[bytes]) -> np.ndarray:
+        packed = np.frombuffer(b''.join(blobs), dtype=np.uint8).reshape(len(blobs), self.__packed_bytes())
+        return np.unpackbits(packed, axis=1, count=self.__topic_count)
+
+
+def migrate_pickled_results(conn: sqlite3.Connection, table_name: str, topic_count: int) -> int:
+    """
+    Converts a results table written before the packed format, where each result was a pickled list of ints.
+    A table is migrated as a whole, so checking its first row is enough to tell. The caller is responsible for committing.
+
+    Returns:
+        int: The number of rows converted.
+    """
+    cursor = conn.cursor()
+    packed_bytes = (topic_count + 7) // 8
+
+    # a pickled list of topic_count ints is always longer than its packed bitset
+    cursor.execute(f"SELECT result FROM {table_name} ORDER BY id ASC LIMIT 1")
+    first = cursor.fetchone()
+    if first is None or len(first[0]) == packed_bytes:
+        return 0
 
+    cursor.execute(f"SELECT id, result FROM {table_name}")
+    updates = [(np.packbits(np.asarray(pickle.loads(blob), dtype=np.uint8)).tobytes(), row_id) for row_id, blob in cursor.fetchall()]
+    cursor.executemany(f"UPDATE {table_name} SET result = ? WHERE id = ?", updates)
 
+    return len(updates)
@@ -0,0 +1,57 @@
+import time
+from typing import Callable
+import numpy as np
+from .embeddings import Embeddings
+from .prototypes import PersistentClusteringAgent
+
+def sampling_benchmark(embeddings: Embeddings, make_agent: Callable[[int], PersistentClusteringAgent], fractions: list[float] = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0), evaluation_size: int = 10000) -> list[dict]:
+    """
+    Measures what training a clustering agent on a person-balanced subsample costs in center quality.
+
+    Args:
+        embeddings (Embeddings): The filled embeddings table to train on.
+        make_agent (Callable[[int], PersistentClusteringAgent]): Builds an untrained agent for a sample size
+                                                                 (None meaning every embedding), e.g.
+                                                                 `lambda n: KMeansClusteringAgent(100, sample_size=n)`.
+        fractions (list[float]): Sample sizes to try, as fractions of the stored embeddings (1.0 trains on all of them).
+        evaluation_size (int): Size of the person-balanced sample every model is scored on.
+
+    Returns:
+        list[dict]: Per fraction, the sample size, training seconds, the mean squared distance of the evaluation
+        sample to its nearest center (`inertia`), and the mean cosine between each center of the full model
+        and its closest center in the sampled model (`center_similarity`, 1.0 when they agree).
+    """
+    total = embeddings.getEmbeddingCount()
+    evaluation = embeddings.getBalancedSample(min(evaluation_size, total), seed=1)
+
+    def train(sample_size: int) -> tuple[float, np.ndarray]:
+        agent = make_agent(sample_size)
+        agent.pass_embeddings(embeddings)
+        start = time.perf_counter()
+        agent.train()
+        return time.perf_counter() - start, np.asarray(agent.get_centers(), dtype=np.float32)
+
+    full_seconds, full_centers = train(None)
+
+    report = []
+    for fraction in sorted(fractions):
+        sample_size = max(int(total * fraction), 1)
+        seconds, centers = (full_seconds, full_centers) if fraction >= 1 else train(sample_size)
+        report.append({
+            'fraction': fraction,
+            'sample_size': min(sample_size, total),
+            'train_seconds': seconds,
+            'inertia': _inertia(evaluation, centers),
+            'center_similarity': _center_similarity(full_centers, centers),
+        })
+    return report
+
+def _inertia(data: np.ndarray, centers: np.ndarray) -> float:
+    # ||x - c||^2 = ||x||^2 + ||c||^2 - 2 x.c
+    distances = np.sum(data ** 2, axis=1, keepdims=True) + np.sum(centers ** 2, axis=1) - 2 * data @ centers.T
+    return float(np.mean(np.maximum(np.min(distances, axis=1), 0)))
+
+def _center_similarity(reference: np.ndarray, centers: np.ndarray) -> float:
+    reference = reference / np.maximum(np.linalg.norm(reference, axis=1, keepdims=True), 1e-12)
+    centers = centers / np.maximum(np.linalg.norm(centers, axis=1, keepdims=True), 1e-12)
+    return float(np.mean(np.max(reference @ centers.T, axis=1)))
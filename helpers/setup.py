@@ -23,7 +23,22 @@ def initialize_database_tables (conn: sqlite3.Connection):
             current_index INTEGER DEFAULT 0,
             current_epoch INTEGER DEFAULT 0,
             person_count INTEGER DEFAULT 0, 
-            topic_count INTEGER DEFAULT 0
+            topic_count INTEGER DEFAULT 0,
+            embedding_format INTEGER DEFAULT 0,
+            embedding_dim INTEGER DEFAULT 0,
+            embedding_dtype TEXT NOT NULL DEFAULT "",
+            embedding_scale BLOB,
+            append_index INTEGER DEFAULT 0
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS shard_progress (
+            trial_name TEXT NOT NULL,
+            shard_id INTEGER NOT NULL,
+            start_id INTEGER NOT NULL,
+            end_id INTEGER NOT NULL,
+            current_index INTEGER NOT NULL,
+            PRIMARY KEY (trial_name, shard_id)
         )
         """
     ]
@@ -32,8 +47,29 @@ def initialize_database_tables (conn: sqlite3.Connection):
     cursor = conn.cursor()
     for table in tables:
         cursor.execute(table)
+
+    # Databases created before these columns existed are upgraded in place
+    add_missing_columns(conn, 'metadata', {
+        'embedding_format': 'INTEGER DEFAULT 0',
+        'embedding_dim': 'INTEGER DEFAULT 0',
+        'embedding_dtype': 'TEXT NOT NULL DEFAULT ""',
+        'embedding_scale': 'BLOB',
+        'append_index': 'INTEGER DEFAULT 0',
+    })
     conn.commit()
 
+def add_missing_columns(conn: sqlite3.Connection, table_name: str, columns: dict[str, str]) -> None:
+    """
+    Adds each `column: definition` in `columns` that `table_name` does not have yet.
+    """
+    cursor = conn.cursor()
+    cursor.execute(f"PRAGMA table_info({table_name})")
+    existing = {row[1] for row in cursor.fetchall()}
+
+    for column, definition in columns.items():
+        if column not in existing:
+            cursor.execute(f"ALTER TABLE {table_name} ADD COLUMN {column} {definition}")
+
 """
 -- Problem:
 -- The dataset consists of embeddings for multiple individuals, 
@@ -62,23 +98,51 @@ def initialize_database_tables (conn: sqlite3.Connection):
 -- scalable for large datasets.
 """
 
-def initialize_embeddings_table(conn: sqlite3.Connection, table_name: str)-> None:
+def initialize_embeddings_table(conn: sqlite3.Connection, table_name: str, sidecar: bool = False)-> None:
+    """
+    With `sidecar`, the vectors live in a raw file next to the database and each row stores
+    its `row_offset` into that file instead of an `embedding` BLOB. An existing table keeps its layout.
+    """
     cursor = conn.cursor()
     
+    vector_column = "row_offset INTEGER NOT NULL" if sidecar else "embedding BLOB NOT NULL"
     query = f"""
     CREATE TABLE IF NOT EXISTS {table_name} (
         id INTEGER PRIMARY KEY AUTOINCREMENT, 
         person_id INTEGER NOT NULL,                   
         embedding_id INTEGER NOT NULL,
         total_embeddings INTEGER NOT NULL,
-        embedding BLOB NOT NULL,      
+        {vector_column},      
         FOREIGN KEY (person_id) REFERENCES persons (id)
             ON DELETE CASCADE                    
     )
     """
 
     cursor.execute(query)
-    cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_embedding_composite ON {table_name}(embedding_id, total_embeddings);") #optimization for sampling
+    # databases from before per-table names gave the composite index to their first embeddings table only
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'idx_embedding_composite' AND tbl_name = ?", (table_name, ))
+    if cursor.fetchone() is not None:
+        cursor.execute("DROP INDEX idx_embedding_composite")
+    cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{table_name}_composite ON {table_name}(embedding_id, total_embeddings);") #optimization for sampling
+    cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{table_name}_person ON {table_name}(person_id, embedding_id);") #optimization for streaming persons in order
+    conn.commit()
+
+def initialize_embedding_cache_table(conn: sqlite3.Connection, table_name: str) -> None:
+    cursor = conn.cursor()
+
+    query = f"""
+    CREATE TABLE IF NOT EXISTS {table_name} (
+        agent_name TEXT NOT NULL,
+        model_name TEXT NOT NULL,
+        chunk_hash BLOB NOT NULL,
+        embedding BLOB NOT NULL,
+        last_used INTEGER NOT NULL,
+        PRIMARY KEY (agent_name, model_name, chunk_hash)
+    )
+    """
+
+    cursor.execute(query)
+    cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{table_name}_last_used ON {table_name}(last_used)") #optimization for eviction
     conn.commit()
 
 def initialize_centers_table(conn: sqlite3.Connection, table_name: str) -> None:
@@ -87,11 +151,13 @@ def initialize_centers_table(conn: sqlite3.Connection, table_name: str) -> None:
     query = f"""
     CREATE TABLE IF NOT EXISTS {table_name} (
         id INTEGER PRIMARY KEY AUTOINCREMENT, 
-        center BLOB NOT NULL                  
+        center BLOB NOT NULL,
+        weight REAL NOT NULL DEFAULT 0
     )
     """
 
     cursor.execute(query)
+    add_missing_columns(conn, table_name, {'weight': 'REAL NOT NULL DEFAULT 0'})
     conn.commit()
 
 def initialize_results_table(conn: sqlite3.Connection, table_name: str) -> None:
@@ -108,22 +174,50 @@ def initialize_results_table(conn: sqlite3.Connection, table_name: str) -> None:
     """
 
     cursor.execute(query)
+    cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{table_name}_person ON {table_name}(person_id)") #optimization for streaming persons in order
     conn.commit()
 
 
 def initialize_index_table(conn: sqlite3.Connection, table_name: str) -> None: 
+    """
+    Posting lists: one row per written segment of a topic's person ids (see InverseIndex), plus one row per indexed person
+    and one per removed person (tombstones).
+    A table in the older one-row-per-posting layout is moved to `{table_name}_rows` for migrate_row_postings.
+    """
     cursor = conn.cursor()
 
+    cursor.execute(f"PRAGMA table_info({table_name})")
+    if 'person_id' in {row[1] for row in cursor.fetchall()}:
+        cursor.execute(f"ALTER TABLE {table_name} RENAME TO {table_name}_rows")
+
     query = f"""
     CREATE TABLE IF NOT EXISTS {table_name} (
         id INTEGER PRIMARY KEY AUTOINCREMENT, 
         topic_id INTEGER NOT NULL,
-        person_id INTEGER NOT NULL,
+        first_person_id INTEGER NOT NULL,
+        person_count INTEGER NOT NULL,
+        postings BLOB NOT NULL
+    )
+    """ 
+    cursor.execute(query)
+    cursor.execute(f'CREATE INDEX IF NOT EXISTS idx_{table_name}_topic ON {table_name}(topic_id)')
+
+    query = f"""
+    CREATE TABLE IF NOT EXISTS {table_name}_documents (
+        person_id INTEGER PRIMARY KEY,
         feature_count INTEGER NOT NULL,
         FOREIGN KEY (person_id) REFERENCES persons (id)
             ON DELETE CASCADE  
     )
-    """ 
+    """
     cursor.execute(query)
-    cursor.execute(f'CREATE INDEX IF NOT EXISTS idx_topic_person ON {table_name}(topic_id, person_id)')
-    conn.commit()
\ No newline at end of file
+
+    # outlives deleted persons on purpose: their postings stay dead until compaction
+    query = f"""
+    CREATE TABLE IF NOT EXISTS {table_name}_tombstones (
+        person_id INTEGER PRIMARY KEY,
+        before_segment INTEGER NOT NULL
+    )
+    """
+    cursor.execute(query)
+    conn.commit()
@@ -0,0 +1,62 @@
+import sqlite3
+
+"""
+CREATE TABLE IF NOT EXISTS shard_progress (
+    trial_name TEXT NOT NULL,
+    shard_id INTEGER NOT NULL,
+    start_id INTEGER NOT NULL,
+    end_id INTEGER NOT NULL,
+    current_index INTEGER NOT NULL,
+    PRIMARY KEY (trial_name, shard_id)
+)
+"""
+
+# Sharded embedding generation splits the persons of a trial into id ranges [start_id, end_id),
+# each embedded by its own worker. Every shard keeps its own resumable cursor (`current_index`,
+# the lowest person id not yet embedded), so a crash only redoes the shards that hadn't finished.
+# A shard is finished once its cursor reaches end_id. The caller commits.
+
+## Throws errors
+class ShardProgress():
+    def __init__(self, conn: sqlite3.Connection, trial_name: str) -> None:
+        self.conn = conn
+        self.trial_name = trial_name
+
+    def plan_shards(self, start_id: int, end_id: int, shard_count: int) -> list[tuple[int, int, int, int]]:
+        """
+        Splits [start_id, end_id) into `shard_count` contiguous id ranges, unless this trial already has a plan,
+        which is kept so resumed runs continue the same shards (even with a different number of workers).
+
+        Returns:
+            list[tuple[int, int, int, int]]: (shard_id, start_id, end_id, current_index) of every shard.
+        """
+        assert shard_count > 0, "shard_count must be positive"
+        shards = self.get_shards()
+        if shards:
+            return shards
+
+        shard_count = max(min(shard_count, end_id - start_id), 1)
+        bounds = [start_id + (end_id - start_id) * i // shard_count for i in range(shard_count + 1)]
+        cursor = self.conn.cursor()
+        cursor.executemany(f"INSERT INTO shard_progress (trial_name, shard_id, start_id, end_id, current_index) VALUES (?, ?, ?, ?, ?)",
+                           [(self.trial_name, i, bounds[i], bounds[i + 1], bounds[i]) for i in range(shard_count)])
+        return self.get_shards()
+
+    def get_shards(self) -> list[tuple[int, int, int, int]]:
+        cursor = self.conn.cursor()
+        cursor.execute(f"SELECT shard_id, start_id, end_id, current_index FROM shard_progress WHERE trial_name = ? ORDER BY shard_id ASC", (self.trial_name, ))
+        return cursor.fetchall()
+
+    def get_unfinished_shards(self) -> list[tuple[int, int, int, int]]:
+        return [shard for shard in self.get_shards() if shard[3] < shard[2]]
+
+    def update_shard_index(self, shard_id: int, new_index: int) -> None:
+        cursor = self.conn.cursor()
+        cursor.execute(f"SELECT start_id, end_id, current_index FROM shard_progress WHERE trial_name = ? AND shard_id = ?", (self.trial_name, shard_id))
+        row = cursor.fetchone()
+        if row is None:
+            raise Exception(f"Shard {shard_id} of trial {self.trial_name} doesn't exist")
+
+        start_id, end_id, current_index = row
+        assert current_index <= new_index, "A shard's current_index can't move backwards"
+        cursor.execute(f"UPDATE shard_progress SET current_index = ? WHERE trial_name = ? AND shard_id = ?", (min(new_index, end_id), self.trial_name, shard_id))
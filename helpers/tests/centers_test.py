@@ -1,23 +1,31 @@
 from ..centers import Centers
 from ..setup import initialize_centers_table
+import numpy as np
 import sqlite3
 import pytest 
 
 def test_centers(): 
-    centers = [[1,2,3], [4,5,6], [7,8,9]]
+    centers = np.array([[1,2,3], [4,5,6], [7,8,9]], dtype=np.float32)
     table_name = 'testCenters'
 
     with sqlite3.connect(':memory:') as conn:
         initialize_centers_table(conn, table_name)
         c = Centers(conn, table_name, 3)
-        assert(c.get_centers() == [])
+        assert(c.get_centers() is None)
 
         ## test validation 
         with pytest.raises(AssertionError): 
             c.update_centers(centers[0:1])
         with pytest.raises(AssertionError): 
             c.update_centers(centers[1:2])
+        with pytest.raises(AssertionError): 
+            c.update_centers(centers, [1, 2])
 
         # test center update
         c.update_centers(centers)
-        assert(c.get_centers() == centers)
+        assert(np.array_equal(c.get_centers(), centers))
+        assert(np.array_equal(c.get_weights(), [0, 0, 0]))
+
+        c.update_centers(centers * 2, [3, 1.5, 0])
+        assert(np.array_equal(c.get_centers(), centers * 2))
+        assert(np.array_equal(c.get_weights(), [3, 1.5, 0]))
@@ -0,0 +1,90 @@
+from ..embeddingCache import EmbeddingCache
+from ..setup import initialize_embedding_cache_table
+from .testAgents import MockEmbeddingAgent, MockListEmbeddingAgent
+from ..utils.ndarrayAgents import as_ndarray_embedding_agent
+import numpy as np
+import sqlite3
+
+table_name = 'test_cache'
+
+class CountingEmbeddingAgent(MockEmbeddingAgent):
+    def __init__(self, name: str, model_name: str = 'mock-model'):
+        super().__init__(name)
+        self.model_name = model_name
+        self.embedded = []
+
+    def embed(self, raw_text: list[str]) -> np.ndarray:
+        self.embedded += raw_text
+        return super().embed(raw_text)
+
+def test_embedding_cache():
+    with sqlite3.connect(':memory:') as conn:
+        initialize_embedding_cache_table(conn, table_name)
+        cache = EmbeddingCache(conn, table_name, max_entries = 100)
+        agent = CountingEmbeddingAgent('counting')
+
+        chunks = ["They work in tech.", "Their religion is none.", "They work in tech."]
+        embeddings = cache.embed(agent, chunks)
+        assert(embeddings.tolist() == agent.embed(chunks).tolist())
+        assert(agent.embedded[:2] == ["They work in tech.", "Their religion is none."])
+        assert(cache.stats()['misses'] == 2 and cache.stats()['hits'] == 1)
+
+        # only misses reach the model, also across cache instances
+        agent.embedded = []
+        embeddings = EmbeddingCache(conn, table_name, 100).embed(agent, ["Their religion is none.", "They like hiking."])
+        assert(agent.embedded == ["They like hiking."])
+        assert(embeddings.tolist() == [[23, 1], [17, 1]])
+
+        # a different model never reuses these entries
+        other_model = CountingEmbeddingAgent('counting', model_name = 'other-model')
+        cache.embed(other_model, chunks)
+        assert(other_model.embedded == ["They work in tech.", "Their religion is none."])
+
+def test_embedding_cache_eviction():
+    with sqlite3.connect(':memory:') as conn:
+        initialize_embedding_cache_table(conn, table_name)
+        cache = EmbeddingCache(conn, table_name, max_entries = 2)
+        agent = CountingEmbeddingAgent('counting')
+
+        cache.embed(agent, ["a"])
+        cache.embed(agent, ["bb"])
+        cache.embed(agent, ["a"])  # refreshes "a"
+        cache.embed(agent, ["ccc"])  # evicts "bb", the least recently used
+        assert(cache.stats()['entries'] == 2)
+
+        agent.embedded = []
+        cache.embed(agent, ["a", "bb"])
+        assert(agent.embedded == ["bb"])
+
+def test_embedding_cache_empty_batch():
+    with sqlite3.connect(':memory:') as conn:
+        initialize_embedding_cache_table(conn, table_name)
+        cache = EmbeddingCache(conn, table_name, max_entries = 100)
+        agent = CountingEmbeddingAgent('counting')
+
+        # persons without chunks make empty batches, which never reach the model
+        assert(cache.embed(agent, []).shape[0] == 0)
+        assert(agent.embedded == [])
+        assert(cache.embed(as_ndarray_embedding_agent(MockListEmbeddingAgent('lists')), []).shape[0] == 0)
+        assert(cache.stats()['hits'] == 0 and cache.stats()['misses'] == 0)
+
+def test_embedding_cache_deferred_store(tmp_path):
+    database_path = str(tmp_path / 'cache.db')
+    with sqlite3.connect(database_path) as conn, sqlite3.connect(database_path) as write_conn:
+        initialize_embedding_cache_table(conn, table_name)
+        conn.commit()
+        cache = EmbeddingCache(conn, table_name, max_entries = 100)
+        agent = CountingEmbeddingAgent('counting')
+
+        # lookups only read, and chunks waiting to be stored are still served from memory
+        embeddings, first = cache.lookup(agent, ["a", "bb"])
+        _, second = cache.lookup(agent, ["bb", "ccc"])
+        assert(embeddings.tolist() == [[1, 1], [2, 1]])
+        assert(agent.embedded == ["a", "bb", "ccc"])
+        assert(not conn.in_transaction)
+
+        cache.store(first, write_conn)
+        cache.store(second, write_conn)
+        write_conn.commit()
+        assert(conn.execute(f"SELECT COUNT(*) FROM {table_name}").fetchone()[0] == 3)
+        assert(cache.stats()['entries'] == 3)
@@ -1,5 +1,10 @@
-from ..embeddings import Embeddings
+from ..embeddings import Embeddings, migrate_pickled_embeddings
+from ..embeddingCodec import EmbeddingCodec
+from ..quantizationReport import quantization_report
 from ..setup import initialize_embeddings_table
+import numpy as np
+import os
+import pickle
 import sqlite3
 
 table_name = 'test_embeddings'
@@ -61,4 +66,211 @@ def test_embeddings():
         assert(pid == 2) 
         assert(ecount == 1)
         assert(embs[0] == other_emb)
-        '''
\ No newline at end of file
+        '''
+
+def test_binary_embeddings():
+    with sqlite3.connect(':memory:') as conn:
+        initialize_embeddings_table(conn, table_name)
+        e = Embeddings(conn, table_name)
+
+        e.insertEmbeddings([1, 1, 1, 2], [3, 3, 3, 1], [0, 1, 2, 0], embedding_list + [[9, 10, 11]])
+        assert(e.codec.dim == 3)
+
+        # rows are stored as raw little-endian float32
+        blob = conn.execute(f"SELECT embedding FROM {table_name} WHERE id = 1").fetchone()[0]
+        assert(blob == np.array(embedding_list[0], dtype='<f4').tobytes())
+
+        all_embeddings = e.getAllEmbeddings()
+        assert(all_embeddings.dtype == np.float32)
+        assert(all_embeddings.tolist() == embedding_list + [[9, 10, 11]])
+
+        for epoch in range(7):
+            last_id, embeddings = e.getEmbeddingBatch(1, 99, epoch)
+            assert(embeddings.shape == (2, 3))
+            assert(embeddings[0].tolist() == embedding_list[epoch % 3])
+
+        tups = e.getPersonEmbeddingsBatch(0, 99)
+        assert([(pid, ecount) for pid, ecount, _ in tups] == [(1, 3), (2, 1)])
+        assert(tups[0][2].tolist() == embedding_list)
+        assert(tups[1][2].tolist() == [[9, 10, 11]])
+
+        person_ids, offsets, matrix = e.getPersonEmbeddingsBlock(0, 99)
+        assert(person_ids.tolist() == [1, 2])
+        assert(offsets.tolist() == [0, 3, 4])
+        assert(matrix.tolist() == embedding_list + [[9, 10, 11]])
+
+        person_ids, offsets, matrix = e.getPersonEmbeddingsBlock(5, 99)
+        assert(len(person_ids) == 0 and offsets.tolist() == [0] and matrix.shape == (0, 3))
+
+def test_stream_person_embeddings():
+    with sqlite3.connect(':memory:') as conn:
+        initialize_embeddings_table(conn, table_name)
+        e = Embeddings(conn, table_name)
+        # persons 7, 2 and 4, with 2, 1 and 3 embeddings, written out of order
+        e.insertEmbeddings([7, 2, 4, 4, 7, 4], [2, 1, 3, 3, 2, 3], [1, 0, 2, 0, 0, 1], [[7, 1], [2, 0], [4, 2], [4, 0], [7, 0], [4, 1]])
+
+        blocks = e.streamPersonEmbeddings(0)
+        person_ids, offsets, matrix = blocks.next_batch(2)
+        assert(person_ids.tolist() == [2, 4])
+        assert(offsets.tolist() == [0, 1, 4])
+        assert(matrix.tolist() == [[2, 0], [4, 0], [4, 1], [4, 2]])
+        assert(blocks.next_key == 5)
+
+        person_ids, offsets, matrix = blocks.next_batch(2)
+        assert(person_ids.tolist() == [7] and offsets.tolist() == [0, 2] and matrix.tolist() == [[7, 0], [7, 1]])
+        person_ids, offsets, matrix = blocks.next_batch(2)
+        assert(len(person_ids) == 0 and offsets.tolist() == [0])
+
+def test_embeddings_of_persons():
+    with sqlite3.connect(':memory:') as conn:
+        initialize_embeddings_table(conn, table_name)
+        e = Embeddings(conn, table_name)
+        e.insertEmbeddings([7, 2, 4, 4, 7], [2, 1, 2, 2, 2], [1, 0, 1, 0, 0], [[7, 1], [2, 0], [4, 1], [4, 0], [7, 0]])
+
+        # persons 3 and 9 have no embeddings
+        person_ids, offsets, matrix = e.getEmbeddingsOfPersons([9, 7, 2, 3, 7])
+        assert(person_ids.tolist() == [2, 7])
+        assert(offsets.tolist() == [0, 1, 3])
+        assert(matrix.tolist() == [[2, 0], [7, 0], [7, 1]])
+
+        person_ids, offsets, matrix = e.getEmbeddingsOfPersons(range(1000))
+        assert(person_ids.tolist() == [2, 4, 7] and len(matrix) == 5)
+
+def test_balanced_sample():
+    with sqlite3.connect(':memory:') as conn:
+        initialize_embeddings_table(conn, table_name)
+        e = Embeddings(conn, table_name)
+
+        # person 1 has 10 embeddings [1, i], persons 2-4 have one each [p, 0]
+        e.insertEmbeddings([1] * 10 + [2, 3, 4], [10] * 10 + [1, 1, 1], list(range(10)) + [0, 0, 0],
+                           [[1, i] for i in range(10)] + [[2, 0], [3, 0], [4, 0]])
+        assert(e.getEmbeddingCount() == 13)
+
+        # whole epochs: every person appears equally often, prolific or not
+        sample = e.getBalancedSample(8)
+        assert(sample.shape == (8, 2))
+        assert(np.bincount(sample[:, 0].astype(int), minlength=5)[1:].tolist() == [2, 2, 2, 2])
+        assert(sorted(sample[sample[:, 0] == 1][:, 1].tolist()) == [0, 1])
+
+        # a partial epoch takes a seeded random subset of persons
+        sample = e.getBalancedSample(6, seed=3)
+        counts = np.bincount(sample[:, 0].astype(int), minlength=5)[1:]
+        assert(sorted(counts.tolist()) == [1, 1, 2, 2])
+        assert(np.array_equal(sample, e.getBalancedSample(6, seed=3)))
+
+    with sqlite3.connect(':memory:') as conn:
+        initialize_embeddings_table(conn, table_name)
+        assert(Embeddings(conn, table_name).getBalancedSample(5).shape[0] == 0)
+
+
+def test_migrate_pickled_embeddings():
+    with sqlite3.connect(':memory:') as conn:
+        initialize_embeddings_table(conn, table_name)
+        vectors = [[0.5, 0.25, -1.0], [2.0, 0.0, 1.5]]
+        conn.executemany(f"INSERT INTO {table_name} (person_id, embedding_id, total_embeddings, embedding) VALUES (?, ?, ?, ?)",
+                         [(1, i, 2, pickle.dumps(v)) for i, v in enumerate(vectors)])
+
+        codec = EmbeddingCodec()
+        assert(migrate_pickled_embeddings(conn, table_name, codec) == 2)
+        assert(codec.dim == 3)
+        assert(Embeddings(conn, table_name, codec).getAllEmbeddings().tolist() == vectors)
+
+        # re-running is a no-op, even with a fresh codec
+        assert(migrate_pickled_embeddings(conn, table_name, EmbeddingCodec()) == 0)
+
+
+def test_sidecar_embeddings(tmp_path):
+    sidecar_path = str(tmp_path / f"{table_name}.emb")
+    with sqlite3.connect(':memory:') as conn:
+        initialize_embeddings_table(conn, table_name, sidecar = True)
+        e = Embeddings(conn, table_name, EmbeddingCodec(), sidecar_path)
+        assert(e.uses_sidecar)
+
+        e.insertEmbeddings([1, 1, 1, 2], [3, 3, 3, 1], [0, 1, 2, 0], embedding_list + [[9, 10, 11]])
+        conn.commit()
+
+        # SQLite only holds offsets into the sidecar
+        offsets = conn.execute(f"SELECT row_offset FROM {table_name} ORDER BY id").fetchall()
+        assert([o[0] for o in offsets] == [0, 1, 2, 3])
+
+        all_embeddings = e.getAllEmbeddings()
+        assert(isinstance(all_embeddings, np.memmap))
+        assert(all_embeddings.tolist() == embedding_list + [[9, 10, 11]])
+
+        last_id, embeddings = e.getEmbeddingBatch(1, 99, 1)
+        assert(embeddings.tolist() == [embedding_list[1], [9, 10, 11]])
+
+        tups = e.getPersonEmbeddingsBatch(0, 99)
+        assert([(pid, ecount) for pid, ecount, _ in tups] == [(1, 3), (2, 1)])
+        assert(tups[0][2].tolist() == embedding_list)
+
+        # vectors from an uncommitted batch are dropped on the next open
+        e.insertEmbeddings([3], [1], [0], [[5, 5, 5]])
+        conn.rollback()
+        reopened = Embeddings(conn, table_name, EmbeddingCodec(), sidecar_path)
+        assert(reopened.codec.dim == 3)
+        assert(os.path.getsize(sidecar_path) == 16 + 4 * 3 * 4)
+
+        reopened.insertEmbeddings([3], [1], [0], [[5, 5, 5]])
+        conn.commit()
+        assert(reopened.getAllEmbeddings().tolist() == embedding_list + [[9, 10, 11], [5, 5, 5]])
+
+
+def test_quantized_embeddings(tmp_path):
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(50, 8)).astype(np.float32)
+
+    for dtype, tolerance in [('float16', 1e-2), ('int8', 5e-2)]:
+        with sqlite3.connect(':memory:') as conn:
+            initialize_embeddings_table(conn, table_name, sidecar = True)
+            sidecar_path = str(tmp_path / f"{dtype}.emb")
+            e = Embeddings(conn, table_name, EmbeddingCodec(dtype), sidecar_path)
+            e.insertEmbeddings([0] * 50, [50] * 50, list(range(50)), vectors)
+            conn.commit()
+
+            # the sidecar holds 2 or 1 byte(s) per value
+            assert(os.path.getsize(sidecar_path) == 16 + 50 * 8 * e.codec.storage_dtype.itemsize)
+
+            # readers dequantize transparently, int8 needs the calibrated scale
+            scale = EmbeddingCodec.scale_from_bytes(e.codec.scale_bytes())
+            restored = Embeddings(conn, table_name, EmbeddingCodec(dtype, 8, scale), sidecar_path).getAllEmbeddings()
+            assert(restored.dtype == np.float32)
+            assert(np.abs(restored - vectors).max() < tolerance * np.abs(vectors).max())
+
+            report = quantization_report(vectors, e.codec, 4)
+            assert(report['dtype'] == dtype)
+            assert(report['mean_cosine'] > 0.99)
+            assert(0 <= report['assignment_drift'] <= 1)
+
+    # too few points for the topics: one cluster per 10 points at most, none below 2
+    assert(quantization_report(vectors[:15], EmbeddingCodec('float16'), 100)['assignment_drift'] is None)
+
+def test_int8_calibration_and_clipping():
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(100, 4)).astype(np.float32)
+
+    codec = EmbeddingCodec('int8')
+    codec.calibrate(vectors)
+    assert(np.allclose(codec.scale * 127, np.abs(vectors).max(axis=0)))
+    codec.calibrate(vectors * 10)  # immutable once set
+    assert(np.allclose(codec.scale * 127, np.abs(vectors).max(axis=0)))
+
+    # values inside the calibrated range are never clipped, outliers are counted
+    codec.to_stored(vectors)
+    assert(codec.clipped_values == 0 and codec.encoded_values == 400)
+    codec.to_stored(np.array([[100, 0, 0, 0]], dtype=np.float32))
+    assert(codec.clipped_values == 1 and codec.encoded_values == 404)
+
+def test_every_embeddings_table_gets_its_indexes():
+    with sqlite3.connect(':memory:') as conn:
+        conn.execute("CREATE TABLE legacy (id INTEGER PRIMARY KEY, person_id INTEGER, embedding_id INTEGER, total_embeddings INTEGER, embedding BLOB)")
+        conn.execute("CREATE INDEX idx_embedding_composite ON legacy(embedding_id, total_embeddings)")
+        for name in ['legacy', table_name, f"{table_name}_int8"]:
+            initialize_embeddings_table(conn, name)
+
+        indexes = {row[0]: row[1] for row in conn.execute("SELECT name, tbl_name FROM sqlite_master WHERE type = 'index'")}
+        assert 'idx_embedding_composite' not in indexes
+        for name in ['legacy', table_name, f"{table_name}_int8"]:
+            assert indexes[f"idx_{name}_composite"] == name and indexes[f"idx_{name}_person"] == name
+            plan = conn.execute(f"EXPLAIN QUERY PLAN SELECT id FROM {name} WHERE embedding_id = 0 AND total_embeddings = 2").fetchall()
+            assert f"idx_{name}_composite" in " ".join(str(row[-1]) for row in plan)
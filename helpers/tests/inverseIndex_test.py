@@ -1,7 +1,8 @@
 import pytest
 import sqlite3
-from ..inverseIndex import InverseIndex
-from ..setup import initialize_index_table
+import numpy as np
+from ..inverseIndex import InverseIndex, encode_postings, decode_postings, migrate_row_postings
+from ..setup import initialize_index_table, initialize_database_tables
 
 # Fixture to set up an in-memory database and the InverseIndex class
 @pytest.fixture
@@ -16,14 +17,10 @@ def test_add_result_vector(setup_database):
     # Add a result vector
     index.add_result_vector([1, 2, 3], person_id=42, feature_count=5)
 
-    cursor = conn.cursor()
-    cursor.execute("SELECT topic_id, person_id, feature_count FROM inverse_index")
-    results = cursor.fetchall()
-
-    assert len(results) == 3
-    assert (1, 42, 5) in results
-    assert (2, 42, 5) in results
-    assert (3, 42, 5) in results
+    for topic_id in [1, 2, 3]:
+        assert index.get_topic_postings(topic_id).tolist() == [42]
+    assert index.get_topic_postings(0).tolist() == []
+    assert index.get_feature_counts([42, 7]).tolist() == [5, 0]
 
 def test_get_all_documents_by_topics_distinct(setup_database):
     conn, index = setup_database
@@ -52,3 +49,138 @@ def test_get_all_documents_by_topics_non_distinct(setup_database):
     assert len(result) == 3
     assert 42 in result
     assert 43 in result
+
+def test_add_results(setup_database):
+    conn, index = setup_database
+    assert index.is_empty()
+
+    index.add_results([44, 42, 43], np.array([[0, 0, 0], [1, 1, 0], [0, 0, 1]], dtype=np.uint8))
+
+    assert not index.is_empty()
+    assert [index.get_topic_postings(topic_id).tolist() for topic_id in range(3)] == [[42], [42], [43]]
+    assert index.get_feature_counts([42, 43, 44]).tolist() == [2, 1, 0]
+    assert index.get_all_documents_by_topics([0, 2]) == [42, 43]
+    # one segment per topic with any postings
+    assert conn.execute("SELECT COUNT(*) FROM inverse_index").fetchone()[0] == 3
+
+@pytest.mark.parametrize("gap, width", [(1, 1), (300, 2), (70000, 4), (2**33, 8)])
+def test_postings_encoding(gap, width):
+    person_ids = np.array([5, 6, 6 + gap, 8 + gap, 8 + 2 * gap], dtype=np.int64)
+    first_person_id, blob = encode_postings(person_ids)
+    assert first_person_id == 5
+    assert blob[0] == width and len(blob) == 1 + 4 * width
+    assert decode_postings(first_person_id, blob).tolist() == person_ids.tolist()
+
+    assert decode_postings(*encode_postings([9])).tolist() == [9]
+
+def test_set_operations_across_segments(setup_database):
+    conn, index = setup_database
+    rng = np.random.default_rng(0)
+    results = (rng.random((3000, 8)) < 0.3).astype(np.uint8)
+    person_ids = np.arange(3000) * 3
+
+    # blocks written out of id order, as a resumed or incremental run can
+    for block in [slice(2000, 3000), slice(0, 1000), slice(1000, 2000)]:
+        index.add_results(person_ids[block], results[block])
+    conn.commit()
+
+    for topic_id in range(8):
+        assert np.array_equal(index.get_topic_postings(topic_id), person_ids[results[:, topic_id] == 1])
+
+    union = np.flatnonzero(results[:, [1, 4, 6]].any(axis=1))
+    assert index.get_all_documents_by_topics([1, 4, 6]) == person_ids[union].tolist()
+    matched, counts = index.count_documents_by_topics([1, 4, 6])
+    assert np.array_equal(matched, person_ids[union])
+    assert np.array_equal(counts, results[union][:, [1, 4, 6]].sum(axis=1))
+    both = np.flatnonzero(results[:, [1, 4, 6]].all(axis=1))
+    assert index.get_documents_in_all_topics([1, 4, 6]) == person_ids[both].tolist()
+
+    # cached lists are invalidated by writes to their topic
+    index.add_results([10**6], np.ones((1, 8), dtype=np.uint8))
+    assert index.get_topic_postings(1)[-1] == 10**6
+    assert index.get_feature_counts([10**6, person_ids[0]]).tolist() == [8, results[0].sum()]
+
+def test_migrate_row_postings():
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE inverse_index (id INTEGER PRIMARY KEY AUTOINCREMENT, topic_id INTEGER NOT NULL, person_id INTEGER NOT NULL, feature_count INTEGER NOT NULL)")
+    rows = [(1, 42, 2), (2, 42, 2), (2, 43, 1), (0, 44, 1), (2, 40, 1)]
+    conn.executemany("INSERT INTO inverse_index (topic_id, person_id, feature_count) VALUES (?, ?, ?)", rows)
+    conn.commit()
+
+    initialize_index_table(conn, "inverse_index")
+    assert migrate_row_postings(conn, "inverse_index") == len(rows)
+    conn.commit()
+    assert migrate_row_postings(conn, "inverse_index") == 0
+
+    index = InverseIndex(conn, "inverse_index")
+    assert [index.get_topic_postings(topic_id).tolist() for topic_id in range(3)] == [[44], [42], [40, 42, 43]]
+    assert index.get_feature_counts([40, 42, 43, 44]).tolist() == [1, 2, 1, 1]
+    assert conn.execute("SELECT name FROM sqlite_master WHERE name = 'inverse_index_rows'").fetchone() is None
+
+def test_remove_persons_and_compact(setup_database):
+    conn, index = setup_database
+    initialize_database_tables(conn)
+    conn.executemany("INSERT INTO persons (id, description) VALUES (?, ?)", [(i, '') for i in range(1, 6)])
+    index.add_results([1, 2, 3, 4, 5], np.array([[1, 1, 0], [1, 0, 0], [0, 1, 1], [1, 0, 1], [0, 1, 0]]))
+
+    # 2 is deleted, 4 is updated and indexed again with another topic
+    index.remove_persons([2, 4])
+    conn.execute("DELETE FROM persons WHERE id = 2")
+    assert index.get_topic_postings(0).tolist() == [1]
+    assert index.get_feature_counts([2, 4]).tolist() == [0, 0]
+    assert index.get_unindexed_tombstones() == [4]
+
+    index.add_results([4], np.array([[0, 1, 0]]))
+    assert index.get_unindexed_tombstones() == []
+    assert index.get_topic_postings(1).tolist() == [1, 3, 4, 5]
+    assert index.get_topic_postings(2).tolist() == [3]
+    assert index.count_documents_by_topics([0, 1])[0].tolist() == [1, 3, 4, 5]
+
+    before = {topic_id: index.get_topic_postings(topic_id).tolist() for topic_id in range(3)}
+    assert index.compact() == 3
+    assert {topic_id: index.get_topic_postings(topic_id).tolist() for topic_id in range(3)} == before
+    assert conn.execute("SELECT COUNT(*) FROM inverse_index").fetchone()[0] == 3
+    assert conn.execute("SELECT COUNT(*) FROM inverse_index_tombstones").fetchone()[0] == 0
+    assert index.compact() == 0
+
+def test_top_k_documents(setup_database):
+    conn, index = setup_database
+    rng = np.random.default_rng(0)
+    # topics from rare to common, so pruning kicks in
+    results = (rng.random((2000, 12)) < np.linspace(0.01, 0.6, 12)).astype(np.uint8)
+    index.add_results(np.arange(2000) * 3, results)
+
+    topic_ids = [0, 2, 5, 9, 11]
+    weights = np.log1p(2000 / results[:, topic_ids].sum(axis=0))
+    expected_scores = results[:, topic_ids] @ weights / np.sqrt(np.maximum(results.sum(axis=1), 1))
+    matched = np.flatnonzero(results[:, topic_ids].any(axis=1))
+    expected = matched[np.lexsort((matched, -expected_scores[matched]))]
+
+    person_ids, scores = index.top_k_documents(topic_ids)
+    assert person_ids.tolist() == (expected * 3).tolist()
+    assert np.allclose(scores, expected_scores[expected])
+    for k in [1, 10, 100]:
+        person_ids, scores = index.top_k_documents(topic_ids, k)
+        assert person_ids.tolist() == (expected[:k] * 3).tolist()
+        assert np.allclose(scores, expected_scores[expected[:k]])
+
+    # persons matching the same topics tie, and ties go to the lowest id
+    index.add_results([10000, 10001, 10002], np.tile(np.eye(12, dtype=np.uint8)[8], (3, 1)))
+    assert index.top_k_documents([8], 2)[0].tolist() == index.top_k_documents([8])[0][:2].tolist()
+    assert index.top_k_documents([], 5)[0].tolist() == []
+    assert index.top_k_documents([0], 0)[0].tolist() == []
+
+def test_top_k_documents_looks_up_only_candidates(setup_database):
+    conn, index = setup_database
+    rng = np.random.default_rng(0)
+    results = (rng.random((4000, 12)) < np.linspace(0.01, 0.6, 12)).astype(np.uint8)
+    index.add_results(np.arange(4000), results)
+    expected = index.top_k_documents([0, 1], 10)
+
+    # a fresh index counts the documents and fetches the few candidates' feature counts by id
+    statements = []
+    conn.set_trace_callback(statements.append)
+    person_ids, scores = InverseIndex(conn, "inverse_index").top_k_documents([0, 1], 10)
+    assert person_ids.tolist() == expected[0].tolist() and np.allclose(scores, expected[1])
+    assert any("COUNT(*)" in statement for statement in statements)
+    assert not any("_documents ORDER BY" in statement for statement in statements)
@@ -97,3 +97,53 @@ def test_update_and_get_table_names(setup_metadata):
     assert metadata.get_results_table_name() == "results_table_test"
     assert metadata.get_index_table_name() == "index_table_test"
 
+
+def test_embedding_format(setup_metadata):
+    conn = setup_metadata
+    m = MetaData(conn, 'test_trial')
+
+    assert(m.get_embedding_format() == 0)
+    assert(m.get_embedding_dim() == 0)
+    assert(m.get_embedding_dtype() == "")
+
+    m.update_embedding_format(1)
+    m.update_embedding_dim(384)
+    m.update_embedding_dtype('float32')
+    assert(m.get_embedding_format() == 1)
+    assert(m.get_embedding_dim() == 384)
+    assert(m.get_embedding_dtype() == 'float32')
+
+    # format can't go backwards, dimension and dtype are immutable once set
+    with pytest.raises(AssertionError):
+        m.update_embedding_format(0)
+    with pytest.raises(AssertionError):
+        m.update_embedding_dim(768)
+    with pytest.raises(AssertionError):
+        m.update_embedding_dtype('float16')
+
+
+def test_append_index(setup_metadata):
+    conn = setup_metadata
+    m = MetaData(conn, 'test_trial')
+
+    assert(m.get_append_index() == 0)
+    m.update_append_index(120)
+    assert(m.get_append_index() == 120)
+
+    # the watermark only moves forward
+    with pytest.raises(AssertionError):
+        m.update_append_index(100)
+
+
+def test_metadata_columns_added_to_old_databases():
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE metadata (id INTEGER PRIMARY KEY AUTOINCREMENT, trial_name TEXT UNIQUE NOT NULL, current_stage INTEGER DEFAULT 0)")
+    conn.execute("INSERT INTO metadata (trial_name, current_stage) VALUES ('old_trial', 3)")
+    conn.commit()
+
+    initialize_database_tables(conn)
+    m = MetaData(conn, 'old_trial')
+    assert(m.get_current_stage() == 3)
+    assert(m.get_embedding_format() == 0)
+    assert(m.get_append_index() == 0)
+    conn.close()
@@ -0,0 +1,57 @@
+from ...agents.clustering.miniBatchKMeans import MiniBatchKMeansClusteringAgent
+from ..embeddings import Embeddings
+from ..setup import initialize_embeddings_table
+import numpy as np
+import sqlite3
+import pytest
+
+def test_mini_batch_kmeans_separates_clusters():
+    rng = np.random.default_rng(0)
+    true_centers = np.array([[0, 0], [10, 0], [0, 10]], dtype=np.float32)
+    points = true_centers[rng.integers(0, 3, size=600)] + rng.normal(0, 0.5, size=(600, 2)).astype(np.float32)
+
+    with sqlite3.connect(':memory:') as conn:
+        initialize_embeddings_table(conn, 'test_embeddings')
+        embeddings = Embeddings(conn, 'test_embeddings')
+        # 300 persons with 2 embeddings each, one of them sampled per epoch
+        embeddings.insertEmbeddings([i // 2 for i in range(600)], [2] * 600, [i % 2 for i in range(600)], points)
+
+        agent = MiniBatchKMeansClusteringAgent(topic_count = 3, epochs = 4, batch_size = 50)
+        with pytest.raises(Exception):
+            agent.generate_result(points[:1])
+        agent.pass_embeddings(embeddings)
+        agent.train()
+
+    assert agent.is_finished_training()
+    assert np.sum(agent.get_center_weights()) == 4 * 300
+    learned = agent.get_centers()
+    assert np.max(np.min(np.linalg.norm(learned[:, None] - true_centers[None], axis=2), axis=0)) < 0.5
+
+    result = agent.generate_result(true_centers[:2])
+    assert result.dtype == np.uint8 and result.sum() == 2
+
+    # one call for a block of persons matches one call per person
+    offsets = np.array([0, 1, 1, 4, 600])
+    batch = agent.generate_results_batch(points, offsets)
+    assert batch.shape == (4, 3)
+    for i in range(4):
+        assert np.array_equal(batch[i], agent.generate_result(points[offsets[i]:offsets[i + 1]]))
+
+def test_mini_batch_kmeans_checkpoint():
+    rng = np.random.default_rng(1)
+    batches = [rng.normal(size=(20, 4)).astype(np.float32) for _ in range(6)]
+
+    uninterrupted = MiniBatchKMeansClusteringAgent(topic_count = 4, batch_size = 20)
+    for batch in batches:
+        uninterrupted.partial_fit(batch)
+
+    first = MiniBatchKMeansClusteringAgent(topic_count = 4, batch_size = 20)
+    for batch in batches[:3]:
+        first.partial_fit(batch)
+    resumed = MiniBatchKMeansClusteringAgent(topic_count = 4, batch_size = 20)
+    resumed.load_centers(first.get_centers(), first.get_center_weights())
+    for batch in batches[3:]:
+        resumed.partial_fit(batch)
+
+    assert np.array_equal(resumed.get_centers(), uninterrupted.get_centers())
+    assert np.array_equal(resumed.get_center_weights(), uninterrupted.get_center_weights())
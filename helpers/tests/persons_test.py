@@ -19,4 +19,41 @@ def test_persons():
         for i in range(2):
             id, desc = people[i]
             assert(id == i)
-            assert(desc == descriptions[i])
\ No newline at end of file
+            assert(desc == descriptions[i])
+def test_persons_id_range():
+    with sqlite3.connect(':memory:') as conn:
+        initialize_database_tables(conn)
+        p = Persons(conn)
+        assert(p.getIdBounds() == (0, None, None))
+
+        for i in [3, 5, 8, 9]:
+            p.insertDescription(i, f"Person {i}")
+
+        assert(p.getIdBounds() == (4, 3, 9))
+
+def test_persons_stream_descriptions():
+    with sqlite3.connect(':memory:') as conn:
+        initialize_database_tables(conn)
+        p = Persons(conn)
+        for i in [9, 3, 5, 8]:
+            p.insertDescription(i, f"Person {i}")
+
+        descriptions = p.streamDescriptions(4)
+        assert([id for id, _ in descriptions.next_batch(2)] == [5, 8])
+        assert(descriptions.next_key == 9)
+        assert(descriptions.next_batch(2) == [(9, "Person 9")])
+        assert(descriptions.next_batch(2) == [])
+
+        assert([id for id, _ in p.streamDescriptions(0, 8).next_batch(10)] == [3, 5])
+
+def test_persons_stream_unassigned_descriptions():
+    with sqlite3.connect(':memory:') as conn:
+        initialize_database_tables(conn)
+        conn.execute("CREATE TABLE results_test (id INTEGER PRIMARY KEY, person_id INTEGER, result BLOB)")
+        p = Persons(conn)
+        for i in range(6):
+            p.insertDescription(i, f"Person {i}")
+        conn.executemany("INSERT INTO results_test (person_id, result) VALUES (?, ?)", [(0, b''), (2, b''), (3, b'')])
+
+        assert([id for id, _ in p.streamUnassignedDescriptions(0, 'results_test').next_batch(10)] == [1, 4, 5])
+        assert([id for id, _ in p.streamUnassignedDescriptions(2, 'results_test').next_batch(10)] == [4, 5])
@@ -1,11 +1,18 @@
 import pytest
-from ..researchRunner import ResearchRunner
+from ..researchRunner import ResearchRunner, Stage
 from ..persons import Persons
 from ..metadata import MetaData
 from ..embeddings import Embeddings
+from ..embeddingCodec import EmbeddingCodec
 from ..centers import Centers
 from ..results import Results
-from .testAgents import MockChunkingAgent, MockEmbeddingAgent, MockClusteringAgent
+from ..shardProgress import ShardProgress
+from ..inverseIndex import InverseIndex
+from ..utils.batchController import BatchController
+from ...agents.clustering.miniBatchKMeans import MiniBatchKMeansClusteringAgent
+from ...agents.clustering.kmeans import KMeansClusteringAgent
+import numpy as np
+from .testAgents import MockChunkingAgent, MockEmbeddingAgent, MockClusteringAgent, MockListClusteringAgent, MockListKMeansClusteringAgent
 from ..setup import initialize_database_tables
 import sqlite3
 '''
@@ -68,4 +75,593 @@ def test_research_runner_pipeline(setup_database):
         assert len(result_vector) > 0  # Result vector should not be empty
 
     print("Integration test passed!")
-'''
\ No newline at end of file
+'''
+
+PERSON_COUNT = 250
+CHUNK_COUNT = sum(i % 4 + 1 for i in range(PERSON_COUNT))
+
+class _DisplayHandle:
+    display_id = 'test'
+
+@pytest.fixture
+def pipeline_runner(tmp_path, monkeypatch):
+    """Fixture with a file database of persons, mock agents and Jupyter output disabled."""
+    from .. import researchRunner, updatePrinter
+    monkeypatch.setattr(updatePrinter, 'display', lambda *args, **kwargs: _DisplayHandle())
+    monkeypatch.setattr(updatePrinter, 'update_display', lambda *args, **kwargs: None)
+    monkeypatch.setattr(researchRunner, 'display', lambda *args, **kwargs: None)
+    monkeypatch.chdir(tmp_path)
+
+    database_path = str(tmp_path / "test.db")
+    with sqlite3.connect(database_path) as conn:
+        initialize_database_tables(conn)
+        persons = Persons(conn)
+        for i in range(PERSON_COUNT):
+            persons.insertDescription(i, " ".join(["Word." * (j + 1) for j in range(i % 4 + 1)]))
+        conn.commit()
+
+    def make_runner(clustering_agent = None, embedding_agent = None, **kwargs):
+        return ResearchRunner(database_path, "test_trial", MockChunkingAgent(name="test_chunking"), embedding_agent or MockEmbeddingAgent(name="test_embedding"),
+                              clustering_agent or MockClusteringAgent(name="test_clustering", topic_count=3), **kwargs)
+
+    return database_path, make_runner
+
+def test_research_runner_ndarray_pipeline(pipeline_runner):
+    database_path, make_runner = pipeline_runner
+    runner = make_runner()
+    runner.run_research()
+
+    with sqlite3.connect(database_path) as conn:
+        metadata = MetaData(conn, "test_trial")
+        assert metadata.get_current_stage() == 5  # DONE
+        assert metadata.get_person_count() == PERSON_COUNT
+        assert metadata.get_embedding_dim() == 2
+
+        embeddings = Embeddings(conn, metadata.get_embeddings_table_name(), sidecar_path = f"{database_path}-{metadata.get_embeddings_table_name()}.emb")
+        assert embeddings.getAllEmbeddings().shape == (CHUNK_COUNT, 2)
+
+        results = Results(conn, metadata.get_results_table_name(), 3).getAllResults()
+        assert results.shape == (PERSON_COUNT, 3)
+        assert all(r.sum() > 0 for r in results)
+
+class CrashingEmbeddingAgent(MockEmbeddingAgent):
+    def __init__(self, name: str, crash_on_call: int):
+        super().__init__(name)
+        self.calls = 0
+        self.crash_on_call = crash_on_call
+
+    def embed(self, raw_text: list[str]):
+        self.calls += 1
+        if self.calls == self.crash_on_call:
+            raise RuntimeError("Simulated crash")
+        return super().embed(raw_text)
+
+@pytest.mark.parametrize("pipeline_depth", [0, 2])
+def test_generate_embeddings_resumes_after_crash(pipeline_runner, pipeline_depth):
+    database_path, make_runner = pipeline_runner
+
+    with pytest.raises(RuntimeError, match="Simulated crash"):
+        make_runner(embedding_agent = CrashingEmbeddingAgent("test_embedding", crash_on_call = 2), pipeline_depth = pipeline_depth).run_research()
+
+    with sqlite3.connect(database_path) as conn:
+        metadata = MetaData(conn, "test_trial")
+        assert metadata.get_current_stage() == 1  # GENERATING_EMBEDDINGS
+        assert metadata.get_current_index() == 100
+        stored = conn.execute(f"SELECT COUNT(DISTINCT person_id), COUNT(*) FROM {metadata.get_embeddings_table_name()}").fetchone()
+        assert stored == (100, sum(i % 4 + 1 for i in range(100)))
+
+    make_runner(pipeline_depth = pipeline_depth).run_research()
+
+    with sqlite3.connect(database_path) as conn:
+        metadata = MetaData(conn, "test_trial")
+        assert metadata.get_current_stage() == 5
+        assert metadata.get_person_count() == PERSON_COUNT
+        rows = conn.execute(f"SELECT person_id, embedding_id, total_embeddings FROM {metadata.get_embeddings_table_name()} ORDER BY person_id, embedding_id").fetchall()
+        assert rows == [(i, j, i % 4 + 1) for i in range(PERSON_COUNT) for j in range(i % 4 + 1)]
+
+@pytest.mark.parametrize("pipeline_depth", [0, 2])
+def test_sparse_person_ids_resume_after_crash(pipeline_runner, pipeline_depth):
+    database_path, make_runner = pipeline_runner
+    # only every other person id is left, so batches span id ranges twice their size
+    with sqlite3.connect(database_path) as conn:
+        conn.execute("DELETE FROM persons WHERE id % 2 != 0")
+    kept = list(range(0, PERSON_COUNT, 2))
+
+    with pytest.raises(RuntimeError, match="Simulated crash"):
+        make_runner(embedding_agent = CrashingEmbeddingAgent("test_embedding", crash_on_call = 2), pipeline_depth = pipeline_depth).run_research()
+
+    with sqlite3.connect(database_path) as conn:
+        # the checkpoint is the id after the 100th kept person
+        assert MetaData(conn, "test_trial").get_current_index() == kept[99] + 1
+
+    make_runner(pipeline_depth = pipeline_depth).run_research()
+
+    with sqlite3.connect(database_path) as conn:
+        metadata = MetaData(conn, "test_trial")
+        assert metadata.get_current_stage() == 5
+        assert metadata.get_person_count() == len(kept)
+        rows = conn.execute(f"SELECT person_id, embedding_id FROM {metadata.get_embeddings_table_name()} ORDER BY person_id, embedding_id").fetchall()
+        assert rows == [(i, j) for i in kept for j in range(i % 4 + 1)]
+        assert conn.execute(f"SELECT person_id FROM {metadata.get_results_table_name()} ORDER BY person_id").fetchall() == [(i, ) for i in kept]
+
+def test_sharded_embeddings_match_serial(pipeline_runner):
+    database_path, make_runner = pipeline_runner
+    make_runner(embedding_workers = 3).run_research()
+
+    with sqlite3.connect(database_path) as conn:
+        metadata = MetaData(conn, "test_trial")
+        assert metadata.get_current_stage() == 5
+        assert metadata.get_person_count() == PERSON_COUNT
+        assert ShardProgress(conn, "test_trial").get_unfinished_shards() == []
+        rows = conn.execute(f"SELECT person_id, embedding_id, total_embeddings FROM {metadata.get_embeddings_table_name()} ORDER BY person_id, embedding_id").fetchall()
+        assert rows == [(i, j, i % 4 + 1) for i in range(PERSON_COUNT) for j in range(i % 4 + 1)]
+        assert Results(conn, metadata.get_results_table_name(), 3).getAllResults().shape == (PERSON_COUNT, 3)
+
+def test_sharded_embeddings_resume_unfinished_shards(pipeline_runner):
+    database_path, make_runner = pipeline_runner
+
+    # each worker commits its first batch of 100 persons, then crashes on the second
+    with pytest.raises(Exception, match="Simulated crash"):
+        make_runner(embedding_agent = CrashingEmbeddingAgent("test_embedding", crash_on_call = 2), embedding_workers = 2).run_research()
+
+    with sqlite3.connect(database_path) as conn:
+        metadata = MetaData(conn, "test_trial")
+        assert metadata.get_current_stage() == 1  # GENERATING_EMBEDDINGS
+        shards = ShardProgress(conn, "test_trial").get_shards()
+        assert [shard[1:3] for shard in shards] == [(0, 125), (125, 250)]
+        # every shard holds exactly the persons below its cursor
+        stored = {row[0] for row in conn.execute(f"SELECT DISTINCT person_id FROM {metadata.get_embeddings_table_name()}")}
+        assert stored == {i for _, start_id, _, current_index in shards for i in range(start_id, current_index)}
+
+    # a serial runner keeps using the shard plan, and only redoes what's unfinished
+    make_runner().run_research()
+
+    with sqlite3.connect(database_path) as conn:
+        metadata = MetaData(conn, "test_trial")
+        assert metadata.get_current_stage() == 5
+        rows = conn.execute(f"SELECT person_id, embedding_id, total_embeddings FROM {metadata.get_embeddings_table_name()} ORDER BY person_id, embedding_id").fetchall()
+        assert rows == [(i, j, i % 4 + 1) for i in range(PERSON_COUNT) for j in range(i % 4 + 1)]
+
+class CrashingMiniBatchKMeans(MiniBatchKMeansClusteringAgent):
+    def __init__(self, crash_on_call: int, **kwargs):
+        super().__init__(**kwargs)
+        self.calls = 0
+        self.crash_on_call = crash_on_call
+
+    def partial_fit(self, batch: np.ndarray):
+        self.calls += 1
+        if self.calls == self.crash_on_call:
+            raise RuntimeError("Simulated crash")
+        super().partial_fit(batch)
+
+def test_streaming_training_resumes_mid_epoch(pipeline_runner):
+    database_path, make_runner = pipeline_runner
+    agent_args = dict(topic_count = 3, epochs = 3, batch_size = 64)
+
+    # 250 persons make 4 batches per epoch, so the 6th batch is the 2nd of epoch 1
+    with pytest.raises(RuntimeError, match="Simulated crash"):
+        make_runner(clustering_agent = CrashingMiniBatchKMeans(crash_on_call = 6, **agent_args)).run_research()
+
+    with sqlite3.connect(database_path) as conn:
+        metadata = MetaData(conn, "test_trial")
+        assert metadata.get_current_stage() == 2  # LEARNING_TOPICS
+        assert metadata.get_current_epoch() == 1
+        assert metadata.get_current_index() > 0
+
+    make_runner(clustering_agent = MiniBatchKMeansClusteringAgent(**agent_args)).run_research()
+
+    with sqlite3.connect(database_path) as conn:
+        metadata = MetaData(conn, "test_trial")
+        assert metadata.get_current_stage() == 5
+        assert metadata.get_current_epoch() == 0
+        embeddings = Embeddings(conn, metadata.get_embeddings_table_name(), sidecar_path = f"{database_path}-{metadata.get_embeddings_table_name()}.emb")
+        centers = Centers(conn, "centers_test_chunking_test_embedding_MBKMEANSx3", 3)
+
+        # the resumed run ends exactly where an uninterrupted one does
+        reference = MiniBatchKMeansClusteringAgent(**agent_args)
+        reference.pass_embeddings(embeddings)
+        reference.train()
+        assert np.array_equal(centers.get_centers(), reference.get_centers())
+        assert np.array_equal(centers.get_weights(), reference.get_center_weights())
+        assert np.sum(centers.get_weights()) == 3 * PERSON_COUNT
+
+        results = Results(conn, metadata.get_results_table_name(), 3).getAllResults()
+        assert results.shape == (PERSON_COUNT, 3)
+
+class CountingKMeans(KMeansClusteringAgent):
+    def __init__(self, topic_count: int):
+        super().__init__(topic_count)
+        self.train_calls = 0
+
+    def train(self):
+        self.train_calls += 1
+        super().train()
+
+def test_query_loads_persisted_centers(pipeline_runner):
+    database_path, make_runner = pipeline_runner
+    trained = CountingKMeans(3)
+    runner = make_runner(clustering_agent = trained)
+    runner.run_research()
+    assert trained.train_calls == 1
+
+    with sqlite3.connect(database_path) as conn:
+        centers = Centers(conn, "centers_test_chunking_test_embedding_KMEANSx3", 3).get_centers()
+        assert np.array_equal(centers, trained.get_centers())
+
+    # the same runner after run_research closed its connection
+    matches = runner.query("Word.Word. Word.")
+    assert len(matches) > 0
+
+    # a new process: nothing is retrained, and the loaded centers give the same answers
+    restarted = CountingKMeans(3)
+    assert make_runner(clustering_agent = restarted).query("Word.Word. Word.") == matches
+    assert make_runner(clustering_agent = restarted).query("Word.Word. Word.", k = 5) == matches[:5]
+    assert restarted.train_calls == 0
+    assert restarted.is_finished_training()
+
+# agents without generate_results_batch get one generate_result call per person
+@pytest.mark.parametrize("clustering_agent_class", [MockClusteringAgent, MockListClusteringAgent])
+def test_batched_results_match_per_person_results(pipeline_runner, clustering_agent_class):
+    database_path, make_runner = pipeline_runner
+    make_runner(clustering_agent = clustering_agent_class(name="test_clustering", topic_count=3)).run_research()
+
+    reference = MockClusteringAgent(name="reference", topic_count=3)
+    reference.pass_embeddings(None)
+    reference.train()
+
+    with sqlite3.connect(database_path) as conn:
+        metadata = MetaData(conn, "test_trial")
+        embeddings = Embeddings(conn, metadata.get_embeddings_table_name(), sidecar_path = f"{database_path}-{metadata.get_embeddings_table_name()}.emb")
+        expected = [reference.generate_result(person_embeddings) for _, _, person_embeddings in embeddings.getPersonEmbeddingsBatch(0, PERSON_COUNT)]
+
+        results = Results(conn, metadata.get_results_table_name(), 3).getAllResults()
+        assert results.shape == (PERSON_COUNT, 3)
+        assert np.array_equal(results, np.array(expected))
+
+def test_list_clustering_agent_trains_through_runner(pipeline_runner):
+    database_path, make_runner = pipeline_runner
+    agent = MockListKMeansClusteringAgent(name="list_kmeans", topic_count=4)
+    make_runner(clustering_agent = agent).run_research()
+    assert agent.is_finished_training()
+
+    with sqlite3.connect(database_path) as conn:
+        metadata = MetaData(conn, "test_trial")
+        assert metadata.get_current_stage() == 5
+        results = Results(conn, metadata.get_results_table_name(), 4).getAllResults()
+        # the four chunk lengths land in four different clusters
+        expected = [agent.generate_result([[len("Word.") * (j + 1), 1] for j in range(i % 4 + 1)]) for i in range(PERSON_COUNT)]
+        assert np.array_equal(results, np.array(expected))
+        assert all(r.sum() == i % 4 + 1 for i, r in enumerate(results))
+
+def _postings(conn: sqlite3.Connection, table_name: str) -> list[tuple[int, int, int]]:
+    index = InverseIndex(conn, table_name)
+    postings = [(topic_id, int(person_id)) for topic_id in range(3) for person_id in index.get_topic_postings(topic_id)]
+    feature_counts = index.get_feature_counts([person_id for _, person_id in postings]).tolist()
+    return sorted(((topic_id, person_id, feature_count) for (topic_id, person_id), feature_count in zip(postings, feature_counts)), key = lambda posting: (posting[1], posting[0]))
+
+def _expected_postings(results: np.ndarray) -> list[tuple[int, int, int]]:
+    return [(int(topic_id), person_id, int(result.sum())) for person_id, result in enumerate(results) for topic_id in np.flatnonzero(result)]
+
+class CrashingResultsAgent(MockClusteringAgent):
+    def __init__(self, crash_on_call: int, **kwargs):
+        super().__init__(**kwargs)
+        self.calls = 0
+        self.crash_on_call = crash_on_call
+
+    def generate_results_batch(self, embeddings: np.ndarray, offsets: np.ndarray) -> np.ndarray:
+        self.calls += 1
+        if self.calls == self.crash_on_call:
+            raise RuntimeError("Simulated crash")
+        return super().generate_results_batch(embeddings, offsets)
+
+def test_results_and_postings_are_one_stage(pipeline_runner, monkeypatch):
+    database_path, make_runner = pipeline_runner
+    monkeypatch.setattr(ResearchRunner, '_batch_controller', lambda self, name, initial_size, workers = 1: BatchController(name, 100, max_size = 100))
+
+    # 250 persons make 3 blocks of 100: the 1st is committed with its postings, the 2nd crashes
+    with pytest.raises(RuntimeError, match="Simulated crash"):
+        make_runner(clustering_agent = CrashingResultsAgent(crash_on_call = 2, name = "test_clustering", topic_count = 3)).run_research()
+
+    with sqlite3.connect(database_path) as conn:
+        metadata = MetaData(conn, "test_trial")
+        assert metadata.get_current_stage() == 3  # COMPUTING_RESULTS
+        assert metadata.get_current_index() == 100
+        results = Results(conn, metadata.get_results_table_name(), 3).getAllResults()
+        assert len(results) == 100
+        assert _postings(conn, metadata.get_index_table_name()) == _expected_postings(results)
+
+    make_runner().run_research()
+
+    with sqlite3.connect(database_path) as conn:
+        metadata = MetaData(conn, "test_trial")
+        assert metadata.get_current_stage() == 5  # DONE
+        results = Results(conn, metadata.get_results_table_name(), 3).getAllResults()
+        assert len(results) == PERSON_COUNT
+        assert _postings(conn, metadata.get_index_table_name()) == _expected_postings(results)
+
+@pytest.mark.parametrize("stage, current_index", [(3, 100), (4, 0), (4, 120)])
+def test_trials_stopped_between_the_old_stages_finish(pipeline_runner, stage, current_index):
+    """Older versions wrote all results (stage 3), then indexed them (stage 4) in a second pass."""
+    database_path, make_runner = pipeline_runner
+    make_runner().run_research(until = Stage.COMPUTING_RESULTS)
+
+    # recreate what an older version left behind: results up to its cursor, postings only for indexed persons
+    agent = MockClusteringAgent(name = "reference", topic_count = 3)
+    agent.pass_embeddings(None)
+    agent.train()
+    with sqlite3.connect(database_path) as conn:
+        metadata = MetaData(conn, "test_trial")
+        embeddings = Embeddings(conn, metadata.get_embeddings_table_name(), sidecar_path = f"{database_path}-{metadata.get_embeddings_table_name()}.emb")
+        person_ids, offsets, matrix = embeddings.getPersonEmbeddingsBlock(0, PERSON_COUNT)
+        expected = agent.generate_results_batch(matrix, offsets)
+
+        computed = current_index if stage == 3 else PERSON_COUNT
+        Results(conn, metadata.get_results_table_name(), 3).insertResults(person_ids[:computed], expected[:computed])
+        if stage == 4:
+            InverseIndex(conn, metadata.get_index_table_name()).add_results(person_ids[:current_index], expected[:current_index])
+            metadata.update_current_stage(4)
+        metadata.update_current_index(current_index)
+        conn.commit()
+
+    make_runner().run_research()
+
+    with sqlite3.connect(database_path) as conn:
+        metadata = MetaData(conn, "test_trial")
+        assert metadata.get_current_stage() == 5  # DONE
+        assert np.array_equal(Results(conn, metadata.get_results_table_name(), 3).getAllResults(), expected)
+        assert _postings(conn, metadata.get_index_table_name()) == _expected_postings(expected)
+
+def _add_persons(database_path: str, person_ids: range):
+    with sqlite3.connect(database_path) as conn:
+        persons = Persons(conn)
+        for i in person_ids:
+            persons.insertDescription(i, " ".join(["Word." * (j + 1) for j in range(i % 4 + 1)]))
+        conn.commit()
+
+def _reference_results(database_path: str) -> np.ndarray:
+    agent = MockClusteringAgent(name = "reference", topic_count = 3)
+    agent.pass_embeddings(None)
+    agent.train()
+    with sqlite3.connect(database_path) as conn:
+        metadata = MetaData(conn, "test_trial")
+        embeddings = Embeddings(conn, metadata.get_embeddings_table_name(), sidecar_path = f"{database_path}-{metadata.get_embeddings_table_name()}.emb")
+        _, offsets, matrix = embeddings.getPersonEmbeddingsBlock(0, 10 ** 6)
+        return agent.generate_results_batch(matrix, offsets)
+
+def test_append_persons_resumes_after_crash(pipeline_runner):
+    database_path, make_runner = pipeline_runner
+    make_runner().run_research()
+    with pytest.raises(AssertionError, match="finished"):
+        ResearchRunner(database_path, "other_trial", MockChunkingAgent(name="test_chunking"), MockEmbeddingAgent(name="test_embedding"), MockClusteringAgent(name="other", topic_count=3)).append_persons()
+
+    # 130 new persons make 2 batches: the 1st is committed with the watermark, the 2nd crashes
+    _add_persons(database_path, range(PERSON_COUNT, PERSON_COUNT + 130))
+    with pytest.raises(RuntimeError, match="Simulated crash"):
+        make_runner(embedding_agent = CrashingEmbeddingAgent("test_embedding", crash_on_call = 2)).append_persons()
+
+    with sqlite3.connect(database_path) as conn:
+        metadata = MetaData(conn, "test_trial")
+        assert metadata.get_append_index() == PERSON_COUNT + 100
+        assert metadata.get_person_count() == PERSON_COUNT + 100
+
+    assert make_runner().append_persons() == 30
+    assert make_runner().append_persons() == 0
+
+    expected = _reference_results(database_path)
+    assert len(expected) == PERSON_COUNT + 130
+    with sqlite3.connect(database_path) as conn:
+        metadata = MetaData(conn, "test_trial")
+        assert metadata.get_person_count() == PERSON_COUNT + 130
+        assert metadata.get_append_index() == PERSON_COUNT + 130
+        assert np.array_equal(Results(conn, metadata.get_results_table_name(), 3).getAllResults(), expected)
+        assert _postings(conn, metadata.get_index_table_name()) == _expected_postings(expected)
+
+class SkippingChunkingAgent(MockChunkingAgent):
+    """Makes no chunks for empty descriptions."""
+    def chunk(self, raw_text: str) -> list[str]:
+        return super().chunk(raw_text) if raw_text else []
+
+def test_append_persons_counts_only_assigned_persons(pipeline_runner):
+    database_path, make_runner = pipeline_runner
+    make_runner().run_research()
+    runner = lambda: ResearchRunner(database_path, "test_trial", SkippingChunkingAgent(name="test_chunking"), MockEmbeddingAgent(name="test_embedding"), MockClusteringAgent(name="test_clustering", topic_count=3))
+
+    _add_persons(database_path, range(PERSON_COUNT, PERSON_COUNT + 3))
+    with sqlite3.connect(database_path) as conn:
+        Persons(conn).insertDescription(PERSON_COUNT + 3, "")
+        conn.commit()
+    assert runner().append_persons() == 3
+    assert runner().delete_person(PERSON_COUNT + 3)
+
+    with sqlite3.connect(database_path) as conn:
+        metadata = MetaData(conn, "test_trial")
+        assert metadata.get_person_count() == PERSON_COUNT + 3
+        assert len(Results(conn, metadata.get_results_table_name(), 3).getAllResults()) == PERSON_COUNT + 3
+
+def test_append_chunkless_person_with_list_clustering_agent(pipeline_runner):
+    database_path, make_runner = pipeline_runner
+    runner = lambda: ResearchRunner(database_path, "test_trial", SkippingChunkingAgent(name="test_chunking"), MockEmbeddingAgent(name="test_embedding"), MockListClusteringAgent(name="test_clustering", topic_count=3))
+    runner().run_research()
+
+    # the only new person makes no chunks, so its block of results is empty
+    with sqlite3.connect(database_path) as conn:
+        Persons(conn).insertDescription(PERSON_COUNT, "")
+        conn.commit()
+    assert runner().append_persons() == 0
+
+def test_append_persons_reuses_shared_embeddings(pipeline_runner):
+    database_path, make_runner = pipeline_runner
+    other = lambda embedding_agent: ResearchRunner(database_path, "other_trial", MockChunkingAgent(name="test_chunking"), embedding_agent, MockClusteringAgent(name="other", topic_count=3))
+    make_runner().run_research()
+    other(MockEmbeddingAgent(name="test_embedding")).run_research()
+
+    _add_persons(database_path, range(PERSON_COUNT, PERSON_COUNT + 20))
+    assert make_runner().append_persons() == 20
+    # the other trial finds the new persons' embeddings in the shared table, so it never embeds
+    assert other(CrashingEmbeddingAgent("test_embedding", crash_on_call = 1)).append_persons() == 20
+
+    with sqlite3.connect(database_path) as conn:
+        metadata = MetaData(conn, "other_trial")
+        stored = conn.execute(f"SELECT COUNT(DISTINCT person_id) FROM {metadata.get_embeddings_table_name()}").fetchone()[0]
+        assert stored == PERSON_COUNT + 20
+        assert len(Results(conn, metadata.get_results_table_name(), 3).getAllResults()) == PERSON_COUNT + 20
+
+def test_delete_and_update_persons(pipeline_runner):
+    database_path, make_runner = pipeline_runner
+    other = lambda: ResearchRunner(database_path, "other_trial", MockChunkingAgent(name="test_chunking"), MockEmbeddingAgent(name="test_embedding"), MockClusteringAgent(name="other", topic_count=3))
+    make_runner().run_research()
+    other().run_research()
+
+    # person 4 has a single chunk of 5 characters (topic 2), the update gives it one of 10 (topic 1)
+    assert 4 not in make_runner().query("Word.Word.")
+    make_runner().update_person(4, "Word.Word.")
+    assert 4 in make_runner().query("Word.Word.")
+
+    assert make_runner().delete_person(8)
+    assert not make_runner().delete_person(8)
+    assert 8 not in make_runner().query("Word.") and 8 not in other().query("Word.")
+
+    # the other trial lost person 4's results with the old description and re-indexes them on its next append
+    assert 4 not in other().query("Word.Word.")
+    assert other().append_persons() == 1
+    assert 4 in other().query("Word.Word.")
+
+    expected = _reference_results(database_path)
+    for trial_name in ["test_trial", "other_trial"]:
+        with sqlite3.connect(database_path) as conn:
+            metadata = MetaData(conn, trial_name)
+            assert metadata.get_person_count() == PERSON_COUNT - 1
+            results = conn.execute(f"SELECT person_id FROM {metadata.get_results_table_name()} ORDER BY person_id").fetchall()
+            assert [person_id for person_id, in results] == [i for i in range(PERSON_COUNT) if i != 8]
+            assert conn.execute(f"SELECT COUNT(*) FROM {metadata.get_embeddings_table_name()} WHERE person_id = 8").fetchone()[0] == 0
+
+    # compaction purges person 8's posting and person 4's old one, and the tombstones with them
+    assert make_runner().compact_index() == 2
+    with sqlite3.connect(database_path) as conn:
+        metadata = MetaData(conn, "test_trial")
+        index_table_name = metadata.get_index_table_name()
+        assert conn.execute(f"SELECT COUNT(*) FROM {index_table_name}_tombstones").fetchone()[0] == 0
+        assert conn.execute(f"SELECT COUNT(DISTINCT topic_id), COUNT(*) FROM {index_table_name}").fetchone() == (3, 3)
+        stored = Results(conn, metadata.get_results_table_name(), 3).getAllResults()
+        assert np.array_equal(stored, expected)
+        # a row of zeros keeps person ids aligned with row positions
+        assert _postings(conn, index_table_name) == _expected_postings(np.insert(stored, 8, 0, axis=0))
+
+def test_delete_person_indexes_every_trial(pipeline_runner):
+    database_path, make_runner = pipeline_runner
+    other = ResearchRunner(database_path, "other_trial", MockChunkingAgent(name="test_chunking"), MockEmbeddingAgent(name="test_embedding"), MockClusteringAgent(name="other", topic_count=3))
+    make_runner().run_research()
+    other.run_research()
+
+    # the other trial's tables as an older version left them, without person_id indexes
+    with sqlite3.connect(database_path) as conn:
+        metadata = MetaData(conn, "other_trial")
+        embeddings_table_name, results_table_name = metadata.get_embeddings_table_name(), metadata.get_results_table_name()
+        conn.execute(f"DROP INDEX idx_{embeddings_table_name}_person")
+        conn.execute(f"DROP INDEX idx_{results_table_name}_person")
+
+    assert make_runner().delete_person(3)
+
+    with sqlite3.connect(database_path) as conn:
+        for table_name in [embeddings_table_name, results_table_name]:
+            plan = conn.execute(f"EXPLAIN QUERY PLAN SELECT 1 FROM {table_name} WHERE person_id = 3").fetchall()
+            assert f"idx_{table_name}_person" in " ".join(str(row[-1]) for row in plan)
+            assert conn.execute(f"SELECT COUNT(*) FROM {table_name} WHERE person_id = 3").fetchone()[0] == 0
+        assert MetaData(conn, "other_trial").get_person_count() == PERSON_COUNT - 1
+        assert MetaData(conn, "test_trial").get_person_count() == PERSON_COUNT - 1
+
+@pytest.mark.parametrize("pipeline_depth", [0, 2])
+def test_int8_scale_is_calibrated_on_a_sample(pipeline_runner, pipeline_depth):
+    database_path, make_runner = pipeline_runner
+    # the longest chunks (40 characters) are only in persons far past the first batch
+    with sqlite3.connect(database_path) as conn:
+        for i in range(150, PERSON_COUNT):
+            Persons(conn).insertDescription(i, "Word." * 8)
+        conn.commit()
+
+    make_runner(embedding_dtype = 'int8', pipeline_depth = pipeline_depth).run_research()
+
+    with sqlite3.connect(database_path) as conn:
+        metadata = MetaData(conn, "test_trial")
+        assert metadata.get_current_stage() == 5
+        scale = EmbeddingCodec.scale_from_bytes(metadata.get_embedding_scale())
+        assert np.allclose(scale * 127, [40, 1])
+
+class WriteCheckingEmbeddingAgent(MockEmbeddingAgent):
+    def __init__(self, name: str):
+        super().__init__(name)
+        self.runner = None
+        self.embedded = 0
+
+    def embed(self, raw_text: list[str]):
+        # the pipeline's writer must be the only connection holding a write transaction
+        assert self.runner is None or not self.runner.conn.in_transaction
+        self.embedded += len(raw_text)
+        return super().embed(raw_text)
+
+def test_pipelined_embedding_cache_writes_through_the_writer(pipeline_runner):
+    database_path, make_runner = pipeline_runner
+    agent = WriteCheckingEmbeddingAgent("test_embedding")
+    runner = make_runner(embedding_agent = agent, pipeline_depth = 2, embedding_cache_size = 1000)
+    agent.runner = runner
+    runner.run_research()
+
+    # descriptions are made of only four distinct chunks, so the model sees each of them once
+    assert agent.embedded == 4
+    assert runner.embedding_cache.stats()['hits'] == CHUNK_COUNT - 4
+
+    with sqlite3.connect(database_path) as conn:
+        metadata = MetaData(conn, "test_trial")
+        assert metadata.get_current_stage() == 5
+        embeddings = Embeddings(conn, metadata.get_embeddings_table_name(), sidecar_path = f"{database_path}-{metadata.get_embeddings_table_name()}.emb")
+        assert embeddings.getAllEmbeddings().shape == (CHUNK_COUNT, 2)
+        assert conn.execute("SELECT COUNT(*) FROM chunk_embedding_cache").fetchone()[0] == 4
+
+    # a second trial with the same embedding agent is served from the cache
+    agent = WriteCheckingEmbeddingAgent("test_embedding")
+    ResearchRunner(database_path, "other_trial", MockChunkingAgent(name="test_chunking"), agent,
+                   MockClusteringAgent(name="test_clustering", topic_count=2), pipeline_depth = 2, embedding_cache_size = 1000).run_research()
+    assert agent.embedded == 0
+
+def test_query_reuses_the_index_between_queries(pipeline_runner):
+    database_path, make_runner = pipeline_runner
+    runner = make_runner()
+    runner.run_research()
+    matches = runner.query("Word.Word. Word.", k = 10)
+
+    statements = []
+    runner._query_conn.set_trace_callback(statements.append)
+    assert runner.query("Word.Word. Word.", k = 10) == matches
+    # posting lists and feature counts come from the index kept since the first query
+    assert not any("indexes_" in statement for statement in statements)
+
+    # a commit from another connection (here, another runner's append) refreshes it
+    _add_persons(database_path, [PERSON_COUNT])
+    assert make_runner().append_persons() == 1
+    assert PERSON_COUNT in runner.query("Word.Word. Word.")
+
+def test_batch_controllers_count_persons_read(pipeline_runner, monkeypatch):
+    database_path, make_runner = pipeline_runner
+    # every other person has an empty description, and so no chunks
+    with sqlite3.connect(database_path) as conn:
+        for i in range(0, PERSON_COUNT, 2):
+            Persons(conn).insertDescription(i, "")
+        conn.commit()
+
+    recorded = {}
+    record, init = BatchController.record, BatchController.__init__
+    def recording(self, rows, seconds):
+        recorded[self.name].append(rows)
+        return record(self, rows, seconds)
+    def creating(self, name, *args, **kwargs):
+        recorded[name] = []
+        init(self, name, *args, **kwargs)
+    monkeypatch.setattr(BatchController, 'record', recording)
+    monkeypatch.setattr(BatchController, '__init__', creating)
+
+    ResearchRunner(database_path, "test_trial", SkippingChunkingAgent(name="test_chunking"), MockEmbeddingAgent(name="test_embedding"),
+                   MockClusteringAgent(name="test_clustering", topic_count=3), pipeline_depth = 2).run_research()
+
+    assert sum(recorded['Embedding']) == PERSON_COUNT
+    # new trials index while computing results, so the old indexing stage never builds a controller
+    assert 'Indexing' not in recorded
@@ -1,6 +1,7 @@
 import sqlite3
 import pytest
-from senior_thesis.helpers.results import Results
+from senior_thesis.helpers.results import Results, migrate_pickled_results
+import numpy as np
 import pickle
 
 
@@ -21,7 +22,7 @@ def setup_results():
     conn.commit()
 
     # Initialize the Results class
-    results = Results(conn, "results_table")
+    results = Results(conn, "results_table", topic_count=3)
     return conn, results
 
 
@@ -37,7 +38,39 @@ def test_insert_result(setup_results):
     cursor.execute("SELECT person_id, result FROM results_table")
     row = cursor.fetchone()
     assert row[0] == 1
-    assert pickle.loads(row[1]) == [1, 0, 1]
+    assert row[1] == np.packbits([1, 0, 1]).tobytes()
+
+
+# Test inserting a batch of results
+def test_insert_results(setup_results):
+    conn, results = setup_results
+
+    results.insertResults([1, 2, 3], np.array([[1, 0, 1], [0, 1, 0], [1, 1, 1]], dtype=np.uint8))
+    results.insertResults([2], np.array([[0, 0, 1]], dtype=np.uint8))
+
+    assert results.getAllResults().tolist() == [[1, 0, 1], [0, 0, 1], [1, 1, 1]]
+    assert [pid for pid, _ in results.most_similar(1, 2)] == [3, 2]
+
+    with pytest.raises(AssertionError):
+        results.insertResults([1, 2], np.array([[1, 0, 1]], dtype=np.uint8))
+
+
+# Test streaming results in person order, whatever the insertion order
+def test_stream_person_results(setup_results):
+    conn, results = setup_results
+
+    results.insertResults([8, 1, 4], np.array([[1, 0, 1], [0, 1, 0], [1, 1, 1]], dtype=np.uint8))
+    stored = results.streamPersonResults(2)
+
+    person_ids, batch = stored.next_batch(1)
+    assert person_ids.tolist() == [4]
+    assert batch.tolist() == [[1, 1, 1]]
+    assert stored.next_key == 5
+
+    person_ids, batch = stored.next_batch(5)
+    assert person_ids.tolist() == [8] and batch.tolist() == [[1, 0, 1]]
+    person_ids, batch = stored.next_batch(5)
+    assert len(person_ids) == 0 and batch.shape == (0, 3)
 
 
 # Test retrieving all results
@@ -51,7 +84,7 @@ def test_get_all_results(setup_results):
 
     # Retrieve all results
     all_results = results.getAllResults()
-    assert all_results == [[1, 0, 1], [0, 1, 0], [1, 1, 1]]
+    assert all_results.tolist() == [[1, 0, 1], [0, 1, 0], [1, 1, 1]]
 
 
 # Test fetching results in batches
@@ -65,11 +98,11 @@ def test_get_person_results_batch(setup_results):
 
     # Fetch the first batch
     batch = results.getPersonResultsBatch(start_id=1, batch_size=2)
-    assert batch == [(1, [1, 0, 1]), (2, [0, 1, 0])]
+    assert [(pid, r.tolist()) for pid, r in batch] == [(1, [1, 0, 1]), (2, [0, 1, 0])]
 
     # Fetch the remaining results
     batch = results.getPersonResultsBatch(start_id=3, batch_size=2)
-    assert batch == [(3, [1, 1, 1])]
+    assert [(pid, r.tolist()) for pid, r in batch] == [(3, [1, 1, 1])]
 
     # Fetch batch starting from a non-existent ID
     batch = results.getPersonResultsBatch(start_id=4, batch_size=2)
@@ -82,8 +115,42 @@ def test_empty_table_behavior(setup_results):
 
     # Fetch all results from an empty table
     all_results = results.getAllResults()
-    assert all_results == []
+    assert all_results.tolist() == []
 
     # Fetch a batch from an empty table
     batch = results.getPersonResultsBatch(start_id=1, batch_size=2)
     assert batch == []
+
+
+# Test similarity search over the packed bitsets
+def test_most_similar(setup_results):
+    conn, results = setup_results
+
+    results.insertResult(1, [1, 1, 0])
+    results.insertResult(2, [1, 1, 1])
+    results.insertResult(3, [0, 0, 1])
+    results.insertResult(4, [1, 1, 0])
+
+    assert results.most_similar(1, 2) == [(4, 1.0), (2, 2 / 3)]
+    assert results.most_similar(3, 3) == [(2, 1 / 3), (1, 0.0), (4, 0.0)]
+    assert results.most_similar(1, 3, metric='hamming') == [(4, 1.0), (2, pytest.approx(2 / 3)), (3, 0.0)]
+    assert results.most_similar(1, 99) == results.most_similar(1, 3)
+
+    # inserts invalidate the cached bitset matrix
+    results.insertResult(3, [1, 1, 0])
+    assert results.most_similar(1, 2) == [(3, 1.0), (4, 1.0)]
+
+    with pytest.raises(KeyError):
+        results.most_similar(5, 1)
+
+
+# Test converting pickled results to packed bitsets
+def test_migrate_pickled_results(setup_results):
+    conn, results = setup_results
+
+    conn.executemany("INSERT INTO results_table (id, person_id, result) VALUES (?, ?, ?)", 
+                     [(1, 1, pickle.dumps([1, 0, 1])), (2, 2, pickle.dumps([0, 1, 1]))])
+
+    assert migrate_pickled_results(conn, "results_table", 3) == 2
+    assert results.getAllResults().tolist() == [[1, 0, 1], [0, 1, 1]]
+    assert migrate_pickled_results(conn, "results_table", 3) == 0
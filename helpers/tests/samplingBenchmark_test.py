@@ -0,0 +1,30 @@
+from ..samplingBenchmark import sampling_benchmark
+from ..embeddings import Embeddings
+from ..setup import initialize_embeddings_table
+from ...agents.clustering.kmeans import KMeansClusteringAgent
+import numpy as np
+import sqlite3
+
+def test_sampling_benchmark():
+    rng = np.random.default_rng(0)
+    true_centers = rng.normal(0, 10, size=(4, 8)).astype(np.float32)
+    sizes = rng.integers(1, 8, size=300)
+    person_ids = np.repeat(np.arange(300), sizes)
+    points = true_centers[rng.integers(0, 4, size=len(person_ids))] + rng.normal(0, 1, size=(len(person_ids), 8)).astype(np.float32)
+
+    with sqlite3.connect(':memory:') as conn:
+        initialize_embeddings_table(conn, 'test_embeddings')
+        embeddings = Embeddings(conn, 'test_embeddings')
+        embedding_ids = np.concatenate([np.arange(size) for size in sizes])
+        embeddings.insertEmbeddings(person_ids.tolist(), sizes[person_ids].tolist(), embedding_ids.tolist(), points)
+
+        report = sampling_benchmark(embeddings, lambda sample_size: KMeansClusteringAgent(4, sample_size=sample_size), fractions=[1.0, 0.05, 0.25])
+
+    assert [row['fraction'] for row in report] == [0.05, 0.25, 1.0]
+    assert report[-1]['sample_size'] == len(points)
+    assert report[-1]['center_similarity'] > 0.999
+    for row in report:
+        assert row['train_seconds'] > 0
+        # well separated clusters are already found from a small balanced sample
+        assert row['center_similarity'] > 0.95
+        assert row['inertia'] < 2 * report[-1]['inertia']
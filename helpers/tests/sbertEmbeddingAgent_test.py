@@ -0,0 +1,79 @@
+import os
+import pickle
+import numpy as np
+import pytest
+
+pytest.importorskip('sentence_transformers')
+from ...agents.embedding.sbertEmbeddingAgent import SBERTEmbeddingAgent, detect_device
+
+## Override with a local model directory on machines without access to the Hugging Face hub
+MODEL_NAME = os.environ.get('SBERT_TEST_MODEL', 'all-MiniLM-L6-v2')
+
+SAMPLE = [
+    "Protein folding dynamics studied with molecular simulation.",
+    "Deep reinforcement learning for robotic grasping.",
+    "Medieval trade routes across the Mediterranean.",
+    "Graph neural networks for traffic forecasting.",
+    "The effect of minimum wage laws on youth employment.",
+    "Catalysts for low temperature hydrogen production.",
+    "Poetry",
+    "Bayesian inference in high dimensional hierarchical models with sparse priors and missing data.",
+]
+
+@pytest.fixture(scope='module')
+def fp32_agent():
+    try:
+        return SBERTEmbeddingAgent(MODEL_NAME, device='cpu')
+    except Exception as e:
+        pytest.skip(f"Couldn't load {MODEL_NAME}: {e}")
+
+def cosine(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    return np.sum(a * b, axis=1) / (np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1))
+
+def test_detect_device():
+    assert detect_device() in ('cuda', 'mps', 'cpu')
+
+def test_fp32_cpu_embeddings(fp32_agent):
+    embeddings = fp32_agent.embed(SAMPLE)
+
+    assert fp32_agent.name == "SBERT"
+    assert embeddings.shape == (len(SAMPLE), fp32_agent.dim)
+    assert embeddings.dtype == np.float32
+    # bucketing only reorders the work, each chunk still gets its own embedding
+    expected = fp32_agent.model.encode(SAMPLE, convert_to_numpy=True, show_progress_bar=False)
+    assert np.allclose(embeddings, expected, atol=1e-5)
+
+def test_quantized_parity(fp32_agent):
+    quantized_agent = SBERTEmbeddingAgent(MODEL_NAME, device='cpu', quantize=True, threads=2)
+
+    # quantized outputs differ numerically, so they must go to their own embeddings table
+    assert quantized_agent.name != fp32_agent.name
+
+    expected = fp32_agent.embed(SAMPLE)
+    embeddings = quantized_agent.embed(SAMPLE)
+    assert embeddings.shape == expected.shape
+    assert np.min(cosine(embeddings, expected)) > 0.98
+
+    # nearest neighbours within the sample should be preserved
+    expected_sim = expected @ expected.T
+    sim = embeddings @ embeddings.T
+    np.fill_diagonal(expected_sim, -np.inf)
+    np.fill_diagonal(sim, -np.inf)
+    assert np.mean(np.argmax(sim, axis=1) == np.argmax(expected_sim, axis=1)) >= 0.75
+
+def test_quantize_requires_cpu():
+    with pytest.raises(ValueError):
+        SBERTEmbeddingAgent(MODEL_NAME, device='cuda', quantize=True)
+
+def test_threads_are_reapplied_after_unpickling(fp32_agent):
+    torch = pytest.importorskip('torch')
+    previous = torch.get_num_threads()
+    fp32_agent.set_threads(2)
+    try:
+        # a worker process unpickles the agent into a fresh torch, whose thread count is its own
+        torch.set_num_threads(1)
+        copy = pickle.loads(pickle.dumps(fp32_agent))
+        assert copy.threads == 2 and torch.get_num_threads() == 2
+    finally:
+        fp32_agent.threads = None
+        torch.set_num_threads(previous)
@@ -0,0 +1,28 @@
+from ..shardProgress import ShardProgress
+from ..setup import initialize_database_tables
+import pytest
+import sqlite3
+
+def test_shard_progress():
+    with sqlite3.connect(':memory:') as conn:
+        initialize_database_tables(conn)
+        progress = ShardProgress(conn, 'test_trial')
+        assert progress.get_shards() == []
+
+        shards = progress.plan_shards(0, 10, 3)
+        assert shards == [(0, 0, 3, 0), (1, 3, 6, 3), (2, 6, 10, 6)]
+
+        # an existing plan is kept, whatever the new shard count
+        assert progress.plan_shards(0, 10, 5) == shards
+        # plans are per trial
+        assert ShardProgress(conn, 'other_trial').plan_shards(5, 7, 4) == [(0, 5, 6, 5), (1, 6, 7, 6)]
+
+        progress.update_shard_index(1, 5)
+        progress.update_shard_index(0, 99)  # clamped to the end of the shard
+        assert progress.get_shards() == [(0, 0, 3, 3), (1, 3, 6, 5), (2, 6, 10, 6)]
+        assert progress.get_unfinished_shards() == [(1, 3, 6, 5), (2, 6, 10, 6)]
+
+        with pytest.raises(AssertionError):
+            progress.update_shard_index(1, 4)
+        with pytest.raises(Exception):
+            progress.update_shard_index(7, 1)
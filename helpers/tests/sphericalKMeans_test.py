@@ -0,0 +1,54 @@
+from ...agents.clustering.sphericalKMeans import SphericalKMeansClusteringAgent, normalize
+from ..embeddings import Embeddings
+from ..setup import initialize_embeddings_table
+import numpy as np
+import sqlite3
+import pytest
+
+DIRECTIONS = normalize(np.array([[1, 0, 0], [0, 1, 0], [0, 0, 1]], dtype=np.float32))
+
+def make_points(rng: np.random.Generator, n: int) -> tuple[np.ndarray, np.ndarray]:
+    # clusters are directions; magnitudes vary wildly, which would mislead Euclidean k-means
+    labels = rng.integers(0, 3, size=n)
+    points = (DIRECTIONS[labels] + rng.normal(0, 0.05, size=(n, 3))) * rng.uniform(0.1, 50, size=(n, 1))
+    return points.astype(np.float32), labels
+
+def test_spherical_kmeans_learns_directions():
+    rng = np.random.default_rng(0)
+    points, labels = make_points(rng, 900)
+
+    with sqlite3.connect(':memory:') as conn:
+        initialize_embeddings_table(conn, 'test_embeddings')
+        embeddings = Embeddings(conn, 'test_embeddings')
+        embeddings.insertEmbeddings(list(range(900)), [1] * 900, [0] * 900, points)
+
+        agent = SphericalKMeansClusteringAgent(topic_count = 3)
+        with pytest.raises(Exception):
+            agent.train()
+        agent.pass_embeddings(embeddings)
+        agent.train()
+
+    centers = agent.get_centers()
+    assert np.allclose(np.linalg.norm(centers, axis=1), 1, atol=1e-5)
+    # every true direction has a learned center within a few degrees
+    assert np.min(np.max(centers @ DIRECTIONS.T, axis=0)) > 0.99
+    assert np.sum(agent.get_center_weights()) == 900
+
+    # assignment is the cosine argmax, whatever the scale of the input
+    batch = agent.generate_results_batch(points, np.arange(901))
+    expected = np.argmax(normalize(points) @ centers.T, axis=1)
+    assert np.array_equal(np.argmax(batch, axis=1), expected)
+    assert np.array_equal(agent.generate_result(points[:1] * 1000), batch[0])
+
+def test_spherical_kmeans_load_centers():
+    agent = SphericalKMeansClusteringAgent(topic_count = 3)
+    with pytest.raises(Exception):
+        agent.finish_training()
+
+    agent.load_centers(DIRECTIONS * 5)
+    agent.finish_training()
+    assert np.allclose(agent.get_centers(), DIRECTIONS)
+
+    offsets = np.array([0, 2, 3])
+    result = agent.generate_results_batch(np.array([[2, 0.1, 0], [0, 0, 3], [0, -1, 4]], dtype=np.float32), offsets)
+    assert result.tolist() == [[1, 0, 1], [0, 0, 1]]
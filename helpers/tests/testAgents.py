@@ -1,5 +1,8 @@
 import re
+import numpy as np
+from sklearn.cluster import KMeans
 from ..embeddings import Embeddings
+from ..utils.segments import segment_one_hot
 
 class MockChunkingAgent(): 
     def __init__(self, name: str): 
@@ -10,13 +13,24 @@ class MockChunkingAgent():
         return re.split(r'(?<=[.!?]) +', raw_text)
     
 class MockEmbeddingAgent:
+    ndarray_native = True
+
+    def __init__(self, name: str):
+        self.name: str = name
+
+    def embed(self, raw_text: list[str]) -> np.ndarray:
+        return np.array([[len(text), 1] for text in raw_text], dtype=np.float32).reshape(len(raw_text), 2)
+
+class MockListEmbeddingAgent:
     def __init__(self, name: str):
         self.name: str = name
 
-    def embed(self, raw_text: str) -> list[int]:
-        return [len(raw_text)] if raw_text else [0]  
+    def embed(self, raw_text: list[str]) -> list[list[float]]:
+        return [[float(len(text)), 1.0] for text in raw_text]
 
 class MockClusteringAgent:
+    ndarray_native = True
+
     def __init__(self, name: str, topic_count: int = 1):
         self.name: str = name
         self.topic_count: int = topic_count
@@ -31,10 +45,58 @@ class MockClusteringAgent:
             raise Exception("Locked! Call `pass_embeddings` first.")
         self._is_finished_training = True
 
-    def generate_result(self, person_embeddings: list[int]) -> list[int]:
+    def generate_result(self, person_embeddings: np.ndarray) -> np.ndarray:
         if not self._is_finished_training:
             raise Exception("Finish training first.")
-        return [e[0] for e in person_embeddings]  
+        result = np.zeros(self.topic_count, dtype=np.uint8)
+        result[person_embeddings[:, 0].astype(np.int64) % self.topic_count] = 1
+        return result
+
+    def generate_results_batch(self, embeddings: np.ndarray, offsets: np.ndarray) -> np.ndarray:
+        if not self._is_finished_training:
+            raise Exception("Finish training first.")
+        return segment_one_hot(embeddings[:, 0].astype(np.int64) % self.topic_count, offsets, self.topic_count)
 
     def is_finished_training(self) -> bool:
         return self._is_finished_training
+
+class MockListClusteringAgent(MockClusteringAgent):
+    ndarray_native = False
+    # predates batched results, so the ResearchRunner generates them person by person
+    generate_results_batch = None
+
+    def generate_result(self, person_embeddings: list[list[float]]) -> list[int]:
+        assert isinstance(person_embeddings, list)
+        result = [0] * self.topic_count
+        for embedding in person_embeddings:
+            result[int(embedding[0]) % self.topic_count] = 1
+        return result
+
+class MockListKMeansClusteringAgent:
+    """The list-based KMeansClusteringAgent from before the ndarray pipeline."""
+    def __init__(self, name: str, topic_count: int):
+        self.name: str = name
+        self.topic_count: int = topic_count
+        self._kmeans = KMeans(n_clusters=topic_count, random_state=42, n_init=1)
+        self._embeddings = None
+        self._is_trained = False
+
+    def pass_embeddings(self, embeddings):
+        self._embeddings = embeddings
+
+    def train(self):
+        all_embeddings = self._embeddings.getAllEmbeddings()
+        if not all_embeddings:
+            raise Exception("No embeddings found for training.")
+        self._kmeans.fit(all_embeddings)
+        self._is_trained = True
+
+    def generate_result(self, person_embeddings: list[list[float]]) -> list[int]:
+        assert isinstance(person_embeddings, list)
+        result = [0] * self.topic_count
+        for cluster in self._kmeans.predict(person_embeddings):
+            result[cluster] = 1
+        return result
+
+    def is_finished_training(self) -> bool:
+        return self._is_trained
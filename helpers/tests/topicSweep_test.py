@@ -0,0 +1,77 @@
+import pytest
+from ..topicSweep import topic_sweep
+from ..persons import Persons
+from ..metadata import MetaData
+from ..embeddings import Embeddings
+from ..centers import Centers
+from ..results import Results
+from ..inverseIndex import InverseIndex
+from ..setup import initialize_database_tables
+from ...agents.clustering.kmeans import KMeansClusteringAgent
+from .testAgents import MockChunkingAgent, MockEmbeddingAgent
+import numpy as np
+import sqlite3
+
+PERSON_COUNT = 120
+
+class _DisplayHandle:
+    display_id = 'test'
+
+@pytest.fixture
+def sweep_database(tmp_path, monkeypatch):
+    """Fixture with a file database of persons and Jupyter output disabled."""
+    from .. import researchRunner, updatePrinter
+    monkeypatch.setattr(updatePrinter, 'display', lambda *args, **kwargs: _DisplayHandle())
+    monkeypatch.setattr(updatePrinter, 'update_display', lambda *args, **kwargs: None)
+    monkeypatch.setattr(researchRunner, 'display', lambda *args, **kwargs: None)
+    monkeypatch.chdir(tmp_path)
+
+    database_path = str(tmp_path / "test.db")
+    with sqlite3.connect(database_path) as conn:
+        initialize_database_tables(conn)
+        persons = Persons(conn)
+        for i in range(PERSON_COUNT):
+            persons.insertDescription(i, " ".join(["Word." * (j + i % 5 + 1) for j in range(i % 3 + 1)]))
+        conn.commit()
+    return database_path
+
+def test_topic_sweep(sweep_database):
+    topic_counts = [2, 4, 6]
+    report = topic_sweep(sweep_database, "sweep", MockChunkingAgent(name="test_chunking"), MockEmbeddingAgent(name="test_embedding"),
+                         [KMeansClusteringAgent(k) for k in topic_counts], processes = 2)
+
+    assert [row['topic_count'] for row in report] == topic_counts
+    assert [row['trial_name'] for row in report] == [f"sweep_KMEANSx{k}" for k in topic_counts]
+    for row in report:
+        assert row['train_seconds'] > 0
+        assert row['silhouette'] is not None and -1 <= row['silhouette'] <= 1
+    # more topics never fit worse
+    inertias = [row['inertia'] for row in report]
+    assert inertias == sorted(inertias, reverse = True)
+
+    with sqlite3.connect(sweep_database) as conn:
+        # the embeddings were generated once, by the first trial
+        table_name = MetaData(conn, "sweep_KMEANSx2").get_embeddings_table_name()
+        embeddings = Embeddings(conn, table_name, sidecar_path = f"{sweep_database}-{table_name}.emb")
+        assert embeddings.getEmbeddingCount() == sum(i % 3 + 1 for i in range(PERSON_COUNT))
+
+        for k in topic_counts:
+            metadata = MetaData(conn, f"sweep_KMEANSx{k}")
+            assert metadata.get_current_stage() == 5  # DONE
+            assert metadata.get_person_count() == PERSON_COUNT
+
+            # results are what the persisted centers give
+            reference = KMeansClusteringAgent(k)
+            reference.load_centers(Centers(conn, f"centers_test_chunking_test_embedding_KMEANSx{k}", k).get_centers())
+            reference.finish_training()
+            person_ids, offsets, matrix = embeddings.getPersonEmbeddingsBlock(0, PERSON_COUNT)
+            results = Results(conn, metadata.get_results_table_name(), k).getAllResults()
+            assert np.array_equal(results, reference.generate_results_batch(matrix, offsets))
+
+            index = InverseIndex(conn, metadata.get_index_table_name())
+            assert sorted(index.get_all_documents_by_topics(list(range(k)), True)) == list(range(PERSON_COUNT))
+
+    # a finished sweep is resumed without training again
+    rerun = topic_sweep(sweep_database, "sweep", MockChunkingAgent(name="test_chunking"), MockEmbeddingAgent(name="test_embedding"),
+                        [KMeansClusteringAgent(k) for k in topic_counts], processes = 2)
+    assert all(row['train_seconds'] is None for row in rerun)
@@ -0,0 +1,66 @@
+from ...agents.clustering.treeKMeans import TreeKMeansClusteringAgent
+from ..embeddings import Embeddings
+from ..setup import initialize_embeddings_table
+import numpy as np
+import sqlite3
+import pytest
+
+def train_agent(points: np.ndarray, **kwargs) -> TreeKMeansClusteringAgent:
+    with sqlite3.connect(':memory:') as conn:
+        initialize_embeddings_table(conn, 'test_embeddings')
+        embeddings = Embeddings(conn, 'test_embeddings')
+        embeddings.insertEmbeddings(list(range(len(points))), [1] * len(points), [0] * len(points), points)
+
+        agent = TreeKMeansClusteringAgent(**kwargs)
+        agent.pass_embeddings(embeddings)
+        agent.train()
+    return agent
+
+def test_tree_kmeans_finds_nested_clusters():
+    rng = np.random.default_rng(0)
+    # 4 groups of 4 tight clusters: a 4 x 4 tree should give each cluster its own leaf
+    groups = rng.normal(0, 100, size=(4, 1, 5))
+    true_centers = (groups + rng.normal(0, 10, size=(4, 4, 5))).reshape(16, 5).astype(np.float32)
+    labels = rng.integers(0, 16, size=1600)
+    points = (true_centers[labels] + rng.normal(0, 0.5, size=(1600, 5))).astype(np.float32)
+
+    agent = train_agent(points, branching = 4, depth = 2)
+    assert agent.topic_count == 16
+    assert agent.name == "TREEKMEANSb4d2"
+    assert np.sum(agent.get_center_weights()) == 1600
+
+    leaves = np.argmax(agent.generate_results_batch(points, np.arange(1601)), axis=1)
+    # every true cluster maps to exactly one leaf, and no two clusters share one
+    mapping = {(label, leaf) for label, leaf in zip(labels.tolist(), leaves.tolist())}
+    assert len(mapping) == 16
+    assert len({leaf for _, leaf in mapping}) == 16
+
+    # persons get the union of their chunks' leaves
+    result = agent.generate_result(points[:3])
+    assert result.shape == (16,) and result.dtype == np.uint8
+    assert set(np.flatnonzero(result)) == set(leaves[:3].tolist())
+
+def test_tree_kmeans_reloads_identically():
+    rng = np.random.default_rng(1)
+    points = rng.normal(size=(500, 6)).astype(np.float32)
+    agent = train_agent(points, branching = 3, depth = 3)
+
+    loaded = TreeKMeansClusteringAgent(branching = 3, depth = 3)
+    with pytest.raises(Exception):
+        loaded.generate_result(points)
+    loaded.load_centers(agent.get_centers(), agent.get_center_weights())
+    loaded.finish_training()
+
+    offsets = np.arange(0, 501, 5)
+    assert np.array_equal(loaded.generate_results_batch(points, offsets), agent.generate_results_batch(points, offsets))
+
+def test_tree_kmeans_with_few_points():
+    # fewer distinct embeddings than leaves: spare leaves stay empty
+    points = np.array([[0, 0], [0, 0], [10, 10], [10, 11]], dtype=np.float32)
+    agent = train_agent(points, branching = 2, depth = 3)
+
+    assert np.sum(agent.get_center_weights()) == 4
+    assert np.count_nonzero(agent.get_center_weights()) == 3
+    result = agent.generate_results_batch(points, np.arange(5))
+    assert result.sum() == 4
+    assert np.array_equal(result[0], result[1])
@@ -1,4 +1,22 @@
 from ..utils.chunkDescriptionBatch import chunk_description_batch
+from ..utils.ndarrayAgents import as_ndarray_embedding_agent, as_ndarray_clustering_agent, generate_results_batch
+from ..utils.pipeline import run_pipeline
+from ..utils.lengthBuckets import length_buckets, padded_token_count
+from ..utils.batchController import BatchController, current_rss
+from ..utils.sharedEmbeddings import SharedEmbeddings
+from ..utils.keysetCursor import KeysetCursor
+from ..utils.embedShard import embed_shard
+from ..embeddings import Embeddings
+from ..setup import initialize_embeddings_table, initialize_database_tables
+from ..persons import Persons
+from .testAgents import MockEmbeddingAgent, MockListEmbeddingAgent, MockListClusteringAgent
+from ...agents.chunking.sentenceChunkingAgent import SentenceChunkingAgent
+from concurrent.futures import ProcessPoolExecutor
+import queue
+import multiprocessing
+import numpy as np
+import pytest
+import sqlite3
 
 class TestChunker: 
     name = 'Carl'
@@ -11,4 +29,195 @@ def test_chunk_description_batch():
 
     output = chunk_description_batch(TestChunker(), test_input, deterministic = True)
 
-    assert output == expected_output
\ No newline at end of file
+    assert output == expected_output
+
+def test_ndarray_agent_adapters():
+    list_embedder = MockListEmbeddingAgent('lists')
+    embedder = as_ndarray_embedding_agent(list_embedder)
+    assert(embedder.name == 'lists')
+    embeddings = embedder.embed(["hi", "there"])
+    assert(embeddings.dtype == np.float32)
+    assert(embeddings.tolist() == [[2, 1], [5, 1]])
+    # batches of persons without chunks are empty
+    assert(embedder.embed([]).shape == (0, 2))
+    assert(as_ndarray_embedding_agent(MockListEmbeddingAgent('lists')).embed([]).shape == (0, 0))
+
+    # native agents are used as is
+    native_embedder = MockEmbeddingAgent('arrays')
+    assert(as_ndarray_embedding_agent(native_embedder) is native_embedder)
+
+    clusterer = as_ndarray_clustering_agent(MockListClusteringAgent('lists', topic_count=4))
+    assert(clusterer.topic_count == 4)
+    clusterer.pass_embeddings(None)
+    clusterer.train()
+    assert(clusterer.is_finished_training())
+    assert(clusterer.generate_result(embeddings).tolist() == [0, 1, 1, 0])
+
+    # the per-person fallback keeps topic_count columns, also for a block without persons
+    assert(generate_results_batch(clusterer, embeddings, np.array([0, 1, 2])).tolist() == [[0, 0, 1, 0], [0, 1, 0, 0]])
+    assert(generate_results_batch(clusterer, embeddings[:0], np.array([0])).shape == (0, 4))
+
+
+def test_run_pipeline():
+    written = []
+    run_pipeline(range(20), [lambda x: x * 2, lambda x: x + 1, written.append], depth = 2, main_stage = 1)
+    assert(written == [x * 2 + 1 for x in range(20)])
+
+    def explode(x):
+        if x == 5:
+            raise ValueError("boom")
+        return x
+
+    with pytest.raises(ValueError, match="boom"):
+        run_pipeline(range(100), [explode, written.append], depth = 1, main_stage = 0)
+
+
+def test_chunk_description_batch_process_pool():
+    chunker = SentenceChunkingAgent()
+    batch = [(i, " ".join(f"Sentence {j} of person {i}." for j in range(i % 7 + 1))) for i in range(300)]
+
+    serial = chunk_description_batch(chunker, batch, seed = 7)
+    with ProcessPoolExecutor(2, mp_context = multiprocessing.get_context('spawn')) as pool:
+        parallel = chunk_description_batch(chunker, batch, pool = pool, seed = 7)
+        assert(parallel == serial)
+        assert(chunk_description_batch(chunker, batch, pool = pool, deterministic = True) == chunk_description_batch(chunker, batch, deterministic = True))
+
+    ids, sizes, embedding_ids, chunks = serial
+    assert(ids == [i for i in range(300) for _ in range(i % 7 + 1)])
+    assert(sizes == [i % 7 + 1 for i in range(300) for _ in range(i % 7 + 1)])
+    assert(embedding_ids == [j for i in range(300) for j in range(i % 7 + 1)])
+    # every person's chunks are a shuffle of their sentences
+    assert(sorted(chunks[-6:]) == sorted(chunker.chunk(batch[-1][1])))
+
+
+def test_length_buckets():
+    lengths = [5, 50, 6, 48, 7, 200, 5]
+    buckets = length_buckets(lengths, token_budget = 100)
+
+    # longest first, each batch within budget (except a single oversized item)
+    assert([b.tolist() for b in buckets] == [[5], [1, 3], [4, 2, 0, 6]])
+    assert(sorted(np.concatenate(buckets).tolist()) == list(range(len(lengths))))
+    assert(padded_token_count(lengths, buckets) == 200 + 2 * 50 + 4 * 7)
+
+    # bucketing pads far less than one batch of everything
+    assert(padded_token_count(lengths, buckets) < padded_token_count(lengths, [np.arange(len(lengths))]))
+    assert(length_buckets([], 100) == [])
+
+def test_batch_controller_throughput():
+    controller = BatchController('test', 100, max_size = 800)
+    assert controller.next_size() == 100
+
+    # grows while throughput keeps up, up to max_size
+    assert controller.record(100, 1.0) == 200
+    assert controller.record(200, 1.5) == 400
+    assert controller.record(400, 2.0) == 800
+    assert controller.record(800, 4.0) == 800
+    # steps back when throughput drops
+    assert controller.record(800, 80.0) == 400
+    assert controller.report()['sizes'] == [100, 200, 400, 800, 400]
+    assert controller.report()['peak_rss'] > 0
+
+def test_batch_controller_memory_budget():
+    baseline = current_rss()
+
+    # a batch that ends above the budget halves the next one
+    controller = BatchController('test', 100, memory_budget = baseline // 2)
+    assert controller.record(100, 1.0) == 50
+    assert controller.record(50, 0.1) == 25
+
+    # growth is capped by the memory each row of the last batch took: ~0.4 MB, so ~150 more rows fit
+    controller = BatchController('test', 100, memory_budget = current_rss() + 100 * 2**20)
+    batch = np.ones(40 * 2**20 // 8)
+    first = controller.record(100, 1.0)
+    assert 100 < first < 200
+
+    # the next batch added no memory, so what the first one took doesn't hold it back
+    assert controller.record(first, first / 100) > first
+    del batch
+
+def test_shared_embeddings_match_table():
+    rng = np.random.default_rng(0)
+    sizes = rng.integers(1, 6, size=80)
+    # persons inserted out of id order, like sharded generation does
+    person_order = rng.permutation(80)
+    person_ids = np.concatenate([[p] * sizes[p] for p in person_order])
+    embedding_ids = np.concatenate([np.arange(sizes[p]) for p in person_order])
+    points = rng.normal(size=(len(person_ids), 4)).astype(np.float32)
+
+    with sqlite3.connect(':memory:') as conn:
+        initialize_embeddings_table(conn, 'test_embeddings')
+        embeddings = Embeddings(conn, 'test_embeddings')
+        embeddings.insertEmbeddings(person_ids.tolist(), sizes[person_ids].tolist(), embedding_ids.tolist(), points)
+
+        shared = SharedEmbeddings.create(embeddings)
+        attached = SharedEmbeddings.attach(shared.descriptor)
+        try:
+            assert np.array_equal(attached.getAllEmbeddings(), points)
+            assert attached.getEmbeddingCount() == len(points)
+            assert np.array_equal(attached.getBalancedSample(150, seed=3), embeddings.getBalancedSample(150, seed=3))
+
+            for start_id, batch_size in [(0, 80), (10, 25), (75, 10), (100, 5)]:
+                for shared_part, table_part in zip(attached.getPersonEmbeddingsBlock(start_id, batch_size), embeddings.getPersonEmbeddingsBlock(start_id, batch_size)):
+                    assert np.array_equal(shared_part, table_part)
+
+            # epoch batches, with row positions as ids (the table's ids start at 1)
+            last_row, batch = attached.getEmbeddingBatch(0, 30, 2)
+            last_id, expected = embeddings.getEmbeddingBatch(1, 30, 2)
+            assert last_row == last_id - 1 and np.array_equal(batch, expected)
+        finally:
+            attached.close()
+            shared.close()
+            shared.unlink()
+
+def test_keyset_cursor():
+    with sqlite3.connect(':memory:') as conn:
+        conn.execute("CREATE TABLE rows (id INTEGER PRIMARY KEY, key INTEGER, value INTEGER)")
+        # keys with gaps, each with 1-3 rows
+        rows = [(key, value) for key in [2, 3, 7, 8, 20, 21, 22, 50] for value in range(key % 3 + 1)]
+        conn.executemany("INSERT INTO rows (key, value) VALUES (?, ?)", rows)
+        query = "SELECT key, value FROM rows WHERE key >= ? ORDER BY key, value"
+
+        cursor = KeysetCursor(conn, query, (0, ), 0)
+        batch = cursor.next_batch(3)
+        assert batch == [row for row in rows if row[0] in (2, 3, 7)]
+        assert cursor.next_key == 8
+
+        # writes and commits on the same connection don't disturb the open statement
+        conn.execute("CREATE TABLE other (id INTEGER)")
+        conn.commit()
+        assert [key for key, _ in cursor.next_batch(4)] == [8, 8, 8, 20, 20, 20, 21, 22, 22]
+        assert cursor.next_key == 23
+
+        # resuming from the checkpoint picks up exactly where the batches stopped
+        resumed = KeysetCursor(conn, query, (cursor.next_key, ), cursor.next_key)
+        assert resumed.next_batch(10) == cursor.next_batch(10) == [(50, 0), (50, 1), (50, 2)]
+        assert cursor.next_batch(10) == [] and cursor.next_key == 51
+
+        squares = KeysetCursor(conn, query, (21, ), 21, transform=lambda batch: [value ** 2 for _, value in batch])
+        assert squares.next_batch(1) == [0]
+        squares.close()
+
+class ThreadCappedEmbeddingAgent(MockEmbeddingAgent):
+    def __init__(self, name: str, threads: int = None):
+        super().__init__(name)
+        self.threads = threads
+
+    def set_threads(self, threads: int):
+        self.threads = threads
+
+def test_embed_shard_caps_threads(tmp_path):
+    database_path = str(tmp_path / 'shard.db')
+    with sqlite3.connect(database_path) as conn:
+        initialize_database_tables(conn)
+        for i in range(10):
+            Persons(conn).insertDescription(i, "Word. Word.Word.")
+        conn.commit()
+
+    # agents without their own cap get the worker's share of the cores, others keep theirs
+    for agent, expected in [(ThreadCappedEmbeddingAgent('capped'), 3), (ThreadCappedEmbeddingAgent('capped', threads = 1), 1)]:
+        out_queue = queue.Queue()
+        embed_shard(database_path, (0, 0, 10, 0), SentenceChunkingAgent(), agent, 4, out_queue, threads = 3)
+        messages = [out_queue.get() for _ in range(out_queue.qsize())]
+        assert [message[0] for message in messages][-1] == 'done'
+        assert sum(len(message[3]) for message in messages if message[0] == 'batch') == 20
+        assert agent.threads == expected
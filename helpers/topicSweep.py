@@ -0,0 +1,154 @@
+import sqlite3
+import multiprocessing
+import os
+import queue
+from .researchRunner import ResearchRunner, Stage, printToLog
+from .metadata import MetaData
+from .embeddings import Embeddings
+from .embeddingCodec import EmbeddingCodec
+from .centers import Centers
+from .results import Results
+from .inverseIndex import InverseIndex
+from .prototypes import ChunkingAgent, EmbeddingAgent, PersistentClusteringAgent
+from .utils.sharedEmbeddings import SharedEmbeddings
+from .utils.sweepConfig import sweep_config
+
+def topic_sweep(db_path: str, trial_name: str, chunking_agent: ChunkingAgent, embedding_agent: EmbeddingAgent, clustering_agents: list[PersistentClusteringAgent],
+                processes: int = None, embedding_dtype: str = 'float32', batch_size: int = 1000, evaluation_size: int = 10000, silhouette_size: int = 2000, **runner_options) -> list[dict]:
+    """
+    Runs one trial per clustering agent (e.g. KMeansClusteringAgent(k) for several k) over shared embeddings.
+    Each trial is named `{trial_name}_{agent.name}` and writes its own centers, results and index tables.
+
+    The embeddings are generated once and copied into shared memory once. Each agent then trains, is scored
+    and computes its results in its own spawned process, so no trial re-reads the embeddings table.
+    This process is the only writer. Trials resume from their checkpoints like any ResearchRunner trial.
+
+    Args:
+        clustering_agents (list[PersistentClusteringAgent]): Agents with distinct names that can hand over their centers.
+        processes (int): How many agents run at once. Defaults to one per CPU.
+        batch_size (int): Persons per results block.
+        evaluation_size (int): Size of the person-balanced sample every agent is scored on.
+        silhouette_size (int): Embeddings of that sample the silhouette is computed on (it is quadratic in this).
+        runner_options: Passed on to every ResearchRunner (e.g. embedding_workers).
+
+    Returns:
+        list[dict]: Per agent, its trial, topic_count, training seconds (None if trained by an earlier run),
+        inertia (mean squared distance to the assigned center) and silhouette on the evaluation sample.
+    """
+    for agent in clustering_agents:
+        if not (hasattr(agent, 'get_centers') and hasattr(agent, 'load_centers')):
+            raise Exception(f"{agent.name} can't hand over its centers, so it can't be swept.")
+    assert len({agent.name for agent in clustering_agents}) == len(clustering_agents), "Swept agents need distinct names"
+
+    runners = [ResearchRunner(db_path, f"{trial_name}_{agent.name}", chunking_agent, embedding_agent, agent, embedding_dtype, **runner_options) for agent in clustering_agents]
+
+    # the first trial generates the embeddings, the others reuse them
+    for runner in runners:
+        runner.run_research(until = Stage.LEARNING_TOPICS)
+
+    report = [{'trial_name': runner.trial_name, 'topic_count': runner.clustering_agent.topic_count, 'train_seconds': None, 'inertia': None, 'silhouette': None} for runner in runners]
+
+    conn = runners[0]._connect()
+    shared = None
+    try:
+        metadata = [MetaData(conn, runner.trial_name) for runner in runners]
+        pending = [i for i, runner in enumerate(runners) if Stage(metadata[i].get_current_stage()) in (Stage.LEARNING_TOPICS, Stage.COMPUTING_RESULTS)]
+        if pending:
+            codec = EmbeddingCodec(embedding_dtype, metadata[0].get_embedding_dim(), EmbeddingCodec.scale_from_bytes(metadata[0].get_embedding_scale()))
+            shared = SharedEmbeddings.create(Embeddings(conn, runners[0]._get_embedding_table_name(), codec, runners[0]._get_embedding_sidecar_path()))
+            printToLog(f"🧠 Sweeping {len(pending)} clustering agents over {shared.rows} shared embeddings", 0)
+            _run_sweep(conn, runners, metadata, pending, shared, processes or os.cpu_count(), batch_size, evaluation_size, silhouette_size, report)
+    finally:
+        if shared is not None:
+            shared.close()
+            shared.unlink()
+        conn.rollback()
+        conn.close()
+
+    # finishes trials a pre-fused version left in the INDEXING stage
+    for runner in runners:
+        runner.run_research()
+
+    for row in report:
+        silhouette = f"{row['silhouette']:.3f}" if row['silhouette'] is not None else 'n/a'
+        trained = f"{row['train_seconds']:.1f}s" if row['train_seconds'] is not None else 'earlier'
+        inertia = f"{row['inertia']:.4f}" if row['inertia'] is not None else 'n/a'
+        printToLog(f"📊 {row['trial_name']}: {row['topic_count']} topics, trained in {trained}, inertia {inertia}, silhouette {silhouette}", 1)
+    return report
+
+def _run_sweep(conn: sqlite3.Connection, runners: list[ResearchRunner], metadata: list[MetaData], pending: list[int], shared: SharedEmbeddings,
+               processes: int, batch_size: int, evaluation_size: int, silhouette_size: int, report: list[dict]):
+    """
+    Starts up to `processes` sweep_config workers and commits what they send: each agent's centers together with
+    its trial's stage advance, and each results block together with its postings and the cursor that skips it on resume.
+    """
+    centers = [Centers(conn, runner._get_centers_table_name(), runner.clustering_agent.topic_count) for runner in runners]
+    results = [Results(conn, runner._get_results_table_name(), runner.clustering_agent.topic_count) for runner in runners]
+    indexes = [InverseIndex(conn, runner._get_index_table_name()) for runner in runners]
+
+    def advance_stage(i: int):
+        metadata[i].update_current_stage(metadata[i].get_current_stage() + 1)
+        metadata[i].update_current_index(0)
+
+    context = multiprocessing.get_context('spawn')
+    out_queue = context.Queue(maxsize = 2 * processes)
+    workers: dict[int, multiprocessing.Process] = {}
+    pending = list(pending)
+
+    def start_next_config():
+        i = pending.pop(0)
+        agent = runners[i].clustering_agent
+        start_index = 0
+        if Stage(metadata[i].get_current_stage()) == Stage.COMPUTING_RESULTS:
+            # trained by an earlier run, the worker only computes the remaining results
+            agent.load_centers(centers[i].get_centers(), centers[i].get_weights())
+            agent.finish_training()
+            start_index = metadata[i].get_current_index()
+        worker = context.Process(target = sweep_config, args = (i, shared.descriptor, agent, start_index, batch_size, evaluation_size, silhouette_size, out_queue), daemon = True)
+        worker.start()
+        workers[i] = worker
+
+    try:
+        while pending and len(workers) < processes:
+            start_next_config()
+
+        while workers:
+            try:
+                message = out_queue.get(timeout = 1)
+            except queue.Empty:
+                # a worker killed outside of Python never reports back
+                for i, worker in workers.items():
+                    if not worker.is_alive() and worker.exitcode != 0:
+                        raise Exception(f"Sweep worker for {runners[i].trial_name} exited with code {worker.exitcode}")
+                continue
+
+            kind, i = message[0], message[1]
+            if kind == 'error':
+                raise Exception(f"Sweep of {runners[i].trial_name} failed:\n{message[2]}")
+
+            if kind == 'trained':
+                _, _, trained_centers, weights, report[i]['train_seconds'] = message
+                centers[i].update_centers(trained_centers, weights)
+                metadata[i].reset_current_epoch()
+                advance_stage(i)
+                printToLog(f"✅ {runners[i].trial_name} learned its topics in {report[i]['train_seconds']:.1f}s", 1)
+            elif kind == 'evaluated':
+                _, _, report[i]['inertia'], report[i]['silhouette'] = message
+            elif kind == 'results':
+                _, _, next_index, person_ids, block_results = message
+                results[i].insertResults(person_ids, block_results)
+                indexes[i].add_results(person_ids, block_results)
+                metadata[i].update_current_index(next_index)
+            else:
+                # results and postings are written together, so INDEXING is passed in the same commit
+                advance_stage(i)
+                advance_stage(i)
+                workers.pop(i).join()
+                printToLog(f"✅ {runners[i].trial_name} computed its results", 1)
+                if pending:
+                    start_next_config()
+            conn.commit()
+    finally:
+        for worker in workers.values():
+            worker.terminate()
+            worker.join()
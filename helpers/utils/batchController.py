@@ -0,0 +1,92 @@
+import os
+import resource
+import sys
+import threading
+
+def current_rss() -> int:
+    """
+    Resident set size of this process in bytes. Falls back to the peak RSS where /proc isn't available.
+    """
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+class BatchController:
+    """
+    Picks the size of each batch a stage processes, from the rows/sec and RSS measured on the previous ones.
+
+    Sizes grow by `growth` while throughput keeps up and step back when it drops (a simple hill climb).
+    With a `memory_budget` (bytes of RSS for the whole process), the memory each row added on the last batch
+    (RSS growth since the previous record, not since the controller was built, so caches and models loaded
+    earlier don't count against every later batch) caps the next size so it is projected to fit the budget,
+    and any batch ending above the budget halves the size. next_size and record may be called from different
+    threads (the pipelined embedding stage reads and embeds on separate ones).
+    """
+    def __init__(self, name: str, initial_size: int, min_size: int = 1, max_size: int = None, memory_budget: int = None, growth: float = 2.0):
+        assert 0 < min_size <= initial_size, "initial_size must be at least min_size"
+        assert growth > 1, "growth must be greater than 1"
+
+        self.name = name
+        self.min_size = min_size
+        self.max_size = max_size if max_size is not None else 16 * initial_size
+        self.memory_budget = memory_budget
+        self.growth = growth
+
+        self.size = min(initial_size, self.max_size)
+        self.history = [self.size]
+        self.baseline_rss = current_rss()
+        self.peak_rss = self.baseline_rss
+        self._last_rss = self.baseline_rss
+        self._best_throughput = 0.0
+        self._lock = threading.Lock()
+
+    def next_size(self) -> int:
+        with self._lock:
+            return self.size
+
+    def record(self, rows: int, seconds: float) -> int:
+        """
+        Records that the last batch processed `rows` rows in `seconds` and returns the size of the next batch.
+        """
+        rss = current_rss()
+        with self._lock:
+            self.peak_rss = max(self.peak_rss, rss)
+            batch_rss = rss - self._last_rss
+            self._last_rss = rss
+            if rows <= 0:
+                return self.size
+
+            throughput = rows / max(seconds, 1e-9)
+            size = self.size
+            if self.memory_budget is not None and rss > self.memory_budget:
+                size = self.size // 2
+            elif throughput >= 0.9 * self._best_throughput:
+                size = int(self.size * self.growth)
+            else:
+                size = int(self.size / self.growth)
+            self._best_throughput = max(self._best_throughput, throughput)
+
+            if self.memory_budget is not None and batch_rss > 0:
+                bytes_per_row = batch_rss / rows
+                size = min(size, int(max(self.memory_budget - rss, 0) / bytes_per_row))
+
+            size = max(self.min_size, min(self.max_size, size))
+            if size != self.size:
+                self.size = size
+                self.history.append(size)
+            return self.size
+
+    def report(self) -> dict:
+        """
+        The batch sizes chosen so far (in order, without repeats) and the peak RSS observed in bytes.
+        """
+        return {
+            'name': self.name,
+            'sizes': list(self.history),
+            'peak_rss': self.peak_rss,
+            'memory_budget': self.memory_budget,
+        }
@@ -1,7 +1,11 @@
 from ..prototypes import ChunkingAgent
+from concurrent.futures import Executor
 import random 
 
-def chunk_description_batch(chunking_agent: ChunkingAgent, batch: list[tuple[int, str]], deterministic = False):
+## Descriptions per task sent to a process pool; small enough to balance load, large enough to amortize pickling
+PARALLEL_SLICE_SIZE = 64
+
+def chunk_description_batch(chunking_agent: ChunkingAgent, batch: list[tuple[int, str]], deterministic = False, pool: Executor = None, seed: int = None, min_parallel_batch: int = 2 * PARALLEL_SLICE_SIZE):
         """
         Takes in a batch of tuples (id, text)
         Returns a tuple with: 
@@ -11,8 +15,33 @@ def chunk_description_batch(chunking_agent: ChunkingAgent, batch: list[tuple[int
         4) chunks | a list of chunks
         Such that for each i, chunks[i] corresponds to tuple with id ids[i] 
         and sizes[i] is # of chunks from that tuple, and embedding_ids[i] is the chunks unique id in range [0, sizes[i])
+
+        With a process `pool`, batches of at least `min_parallel_batch` descriptions are chunked in parallel 
+        when the agent declares `picklable = True`. Each description is then shuffled by its own RNG seeded 
+        from (`seed`, id), so the output is identical for any number of workers, and to a serial call with the same seed.
+        Without a seed, parallel calls draw one from `random`, so `random.seed` still makes them reproducible.
         """
+        parallel = pool is not None and getattr(chunking_agent, 'picklable', False) and len(batch) >= min_parallel_batch
+        if not parallel:
+            return _chunk_descriptions(chunking_agent, batch, deterministic, seed)
+
+        if seed is None and not deterministic:
+            seed = random.getrandbits(64)
+
+        slices = [batch[i:i + PARALLEL_SLICE_SIZE] for i in range(0, len(batch), PARALLEL_SLICE_SIZE)]
+        futures = [pool.submit(_chunk_descriptions, chunking_agent, s, deterministic, seed) for s in slices]
+
+        ids, sizes, embedding_ids, chunks = [], [], [], []
+        for future in futures:
+            s_ids, s_sizes, s_embedding_ids, s_chunks = future.result()
+            ids += s_ids
+            sizes += s_sizes
+            embedding_ids += s_embedding_ids
+            chunks += s_chunks
+
+        return (ids, sizes, embedding_ids, chunks)
 
+def _chunk_descriptions(chunking_agent: ChunkingAgent, batch: list[tuple[int, str]], deterministic: bool, seed: int):
         ids = []
         sizes = []
         embedding_ids = []
@@ -22,7 +51,10 @@ def chunk_description_batch(chunking_agent: ChunkingAgent, batch: list[tuple[int
 
             if not deterministic: 
                 # remove positional correlations
-                random.shuffle(text_chunks)
+                if seed is None:
+                    random.shuffle(text_chunks)
+                else:
+                    random.Random(f"{seed}:{id}").shuffle(text_chunks)
 
             for i, text_chunk in enumerate(text_chunks):
                 ids.append(id)
@@ -30,4 +62,4 @@ def chunk_description_batch(chunking_agent: ChunkingAgent, batch: list[tuple[int
                 embedding_ids.append(i)
                 chunks.append(text_chunk)
 
-        return (ids, sizes, embedding_ids, chunks)
\ No newline at end of file
+        return (ids, sizes, embedding_ids, chunks)
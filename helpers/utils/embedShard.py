@@ -0,0 +1,50 @@
+import sqlite3
+import time
+import traceback
+import numpy as np
+from ..persons import Persons
+from ..prototypes import ChunkingAgent, EmbeddingAgent
+from .chunkDescriptionBatch import chunk_description_batch
+from .batchController import BatchController
+
+def embed_shard(db_path: str, shard: tuple[int, int, int, int], chunking_agent: ChunkingAgent, embedding_agent: EmbeddingAgent, batch_size: int, out_queue, memory_budget: int = None, threads: int = None) -> None:
+    """
+    Worker process body of sharded embedding generation. Embeds the persons of one shard
+    (shard_id, start_id, end_id, current_index) from its cursor onwards, and only reads the database:
+    each batch is sent to `out_queue` for the single writer, which commits it with the shard's new cursor.
+    Batch sizes start at `batch_size` and adapt to this process's throughput and `memory_budget` (see BatchController).
+    Agents that can cap their threads (`set_threads`) and weren't given a cap are limited to `threads`, 
+    so the workers share the cores instead of each using all of them.
+
+    Messages are ('batch', shard_id, next_index, pids, sizes, embedding_ids, embeddings),
+    then ('done', shard_id, end_id, batch size report), or ('error', shard_id, traceback) if anything fails.
+    """
+    shard_id, _, end_id, current_index = shard
+    conn = None
+    try:
+        if threads is not None and hasattr(embedding_agent, 'set_threads') and getattr(embedding_agent, 'threads', None) is None:
+            embedding_agent.set_threads(threads)
+
+        conn = sqlite3.connect(db_path)
+        persons = Persons(conn)
+        batch_controller = BatchController(f"Embedding shard {shard_id}", batch_size, memory_budget = memory_budget)
+
+        descriptions = persons.streamDescriptions(current_index, end_id)
+        while True:
+            batch_start = time.perf_counter()
+            batch = descriptions.next_batch(batch_controller.next_size())
+            if not batch:
+                break
+            current_index = descriptions.next_key
+
+            pids, sizes, eids, chunks = chunk_description_batch(chunking_agent, batch)
+            embeddings = np.asarray(embedding_agent.embed(chunks), dtype=np.float32)
+            out_queue.put(('batch', shard_id, current_index, pids, sizes, eids, embeddings))
+            batch_controller.record(len(batch), time.perf_counter() - batch_start)
+
+        out_queue.put(('done', shard_id, end_id, batch_controller.report()))
+    except Exception:
+        out_queue.put(('error', shard_id, traceback.format_exc()))
+    finally:
+        if conn is not None:
+            conn.close()
@@ -0,0 +1,66 @@
+import sqlite3
+from typing import Callable
+
+class KeysetCursor:
+    """
+    Streams the rows of one `SELECT key, ... WHERE key >= ? ... ORDER BY key` query in batches of whole keys
+    (e.g. every embedding of a person), keeping a single statement open instead of re-issuing a query per batch.
+
+    Progress is the next key to read (last key seen + 1), not a row count, so a checkpoint of `next_key` resumes
+    exactly after the last batch whatever gaps the keys have. Reading stays valid across commits on the same connection.
+    """
+
+    def __init__(self, conn: sqlite3.Connection, query: str, params: tuple, start_key: int, transform: Callable[[list[tuple]], object] = None):
+        """
+        Args:
+            conn (sqlite3.Connection): Connection to read through.
+            query (str): A query selecting the integer key first, filtered to keys >= its first parameter and ordered by key.
+            params (tuple): Its parameters, `start_key` first.
+            start_key (int): The first key to read.
+            transform (Callable): Turns each batch of rows into what next_batch returns (rows as they are by default).
+        """
+        self.next_key = start_key
+        self.__transform = transform
+        self.__cursor = conn.cursor()
+        self.__cursor.execute(query, params)
+        self.__pending = []
+        self.__exhausted = False
+
+    def next_batch(self, key_count: int):
+        """
+        Returns the rows of the next `key_count` keys (fewer at the end; an empty batch once every row was read).
+        """
+        assert key_count > 0, "key_count must be positive"
+        rows = self.__pending
+        keys = 0
+        split = None
+
+        # read until a row of key number key_count + 1 shows up, or the rows run out
+        scanned = 0
+        while True:
+            for i in range(scanned, len(rows)):
+                if i == 0 or rows[i][0] != rows[i - 1][0]:
+                    keys += 1
+                    if keys > key_count:
+                        split = i
+                        break
+            scanned = len(rows)
+            if split is not None or self.__exhausted:
+                break
+
+            fetched = self.__cursor.fetchmany(max(key_count, 100))
+            if not fetched:
+                self.__exhausted = True
+                self.__cursor.close()
+            rows.extend(fetched)
+
+        split = len(rows) if split is None else split
+        batch, self.__pending = rows[:split], rows[split:]
+        if batch:
+            self.next_key = batch[-1][0] + 1
+        return self.__transform(batch) if self.__transform is not None else batch
+
+    def close(self):
+        if not self.__exhausted:
+            self.__cursor.close()
+            self.__exhausted = True
@@ -0,0 +1,32 @@
+import numpy as np
+
+def length_buckets(lengths: list[int], token_budget: int) -> list[np.ndarray]:
+    """
+    Groups item indices into batches of similar length, so padding every item to the batch's
+    longest one wastes little compute.
+
+    Items are sorted longest first and a batch grows while (batch size * longest length) stays within 
+    `token_budget`, so batches of short items hold more items. An item longer than the budget gets a batch of its own.
+
+    Returns:
+        list[np.ndarray]: The indices (into `lengths`) of each batch, longest batch first.
+    """
+    assert token_budget > 0, "token_budget must be positive"
+
+    order = np.argsort(-np.asarray(lengths, dtype=np.int64), kind='stable')
+    buckets = []
+    start = 0
+    while start < len(order):
+        longest = max(int(lengths[order[start]]), 1)
+        size = max(token_budget // longest, 1)
+        buckets.append(order[start:start + size])
+        start += size
+
+    return buckets
+
+def padded_token_count(lengths: list[int], buckets: list[np.ndarray]) -> int:
+    """
+    Size of the padded token grid the model computes over: batch size * longest item, summed over batches.
+    """
+    lengths = np.asarray(lengths, dtype=np.int64)
+    return int(sum(len(bucket) * lengths[bucket].max() for bucket in buckets if len(bucket) > 0))
@@ -0,0 +1,93 @@
+import numpy as np
+from ..prototypes import EmbeddingAgent, ClusteringAgent
+
+# The pipeline passes embeddings around as 2-D float32 matrices end to end. Agents written against
+# the older list-based protocol (no `ndarray_native = True`) are wrapped so they keep working.
+
+class ListEmbeddingAgentAdapter:
+    """
+    Wraps a list-based embedding agent so `embed` returns a (n, dim) float32 matrix.
+    Every other attribute is forwarded to the wrapped agent.
+    """
+    ndarray_native = True
+
+    def __init__(self, agent):
+        self.agent = agent
+        # an empty list has no dimension, so empty batches take the last one seen
+        self.dim = getattr(agent, 'dim', 0)
+
+    def __getattr__(self, attr):
+        if attr == 'agent':
+            raise AttributeError(attr)
+        return getattr(self.agent, attr)
+
+    def embed(self, raw_text: list[str]) -> np.ndarray:
+        if len(raw_text) == 0:
+            return np.empty((0, self.dim), dtype=np.float32)
+        embeddings = np.asarray(self.agent.embed(raw_text), dtype=np.float32).reshape(len(raw_text), -1)
+        self.dim = embeddings.shape[1]
+        return embeddings
+
+class ListEmbeddingsView:
+    """
+    Wraps an Embeddings object so its getters return lists of lists, as list-based clustering agents expect.
+    Every other attribute is forwarded to the wrapped object.
+    """
+    def __init__(self, embeddings):
+        self.embeddings = embeddings
+
+    def __getattr__(self, attr):
+        if attr == 'embeddings':
+            raise AttributeError(attr)
+        return getattr(self.embeddings, attr)
+
+    def getAllEmbeddings(self) -> list[list[float]]:
+        return self.embeddings.getAllEmbeddings().tolist()
+
+    def getBalancedSample(self, sample_size: int, seed: int = 0) -> list[list[float]]:
+        return self.embeddings.getBalancedSample(sample_size, seed).tolist()
+
+    def getEmbeddingBatch(self, start_row: int, batch_size: int, epoch: int) -> tuple[int, list[list[float]]]:
+        last_id, embeddings = self.embeddings.getEmbeddingBatch(start_row, batch_size, epoch)
+        return last_id, embeddings.tolist()
+
+    def getPersonEmbeddingsBatch(self, start_id: int, batch_size: int) -> list[tuple[int, int, list[list[float]]]]:
+        return [[person_id, size, embeddings.tolist()] for person_id, size, embeddings in self.embeddings.getPersonEmbeddingsBatch(start_id, batch_size)]
+
+class ListClusteringAgentAdapter:
+    """
+    Wraps a list-based clustering agent: embeddings are handed to it as lists and 
+    its result vector comes back as a uint8 array. Every other attribute is forwarded to the wrapped agent.
+    """
+    ndarray_native = True
+
+    def __init__(self, agent):
+        self.agent = agent
+
+    def __getattr__(self, attr):
+        if attr == 'agent':
+            raise AttributeError(attr)
+        return getattr(self.agent, attr)
+
+    def pass_embeddings(self, embeddings):
+        self.agent.pass_embeddings(ListEmbeddingsView(embeddings))
+
+    def generate_result(self, person_embeddings: np.ndarray) -> np.ndarray:
+        return np.asarray(self.agent.generate_result(np.asarray(person_embeddings).tolist()), dtype=np.uint8)
+
+def as_ndarray_embedding_agent(agent: EmbeddingAgent) -> EmbeddingAgent:
+    return agent if getattr(agent, 'ndarray_native', False) else ListEmbeddingAgentAdapter(agent)
+
+def as_ndarray_clustering_agent(agent: ClusteringAgent) -> ClusteringAgent:
+    return agent if getattr(agent, 'ndarray_native', False) else ListClusteringAgentAdapter(agent)
+
+def generate_results_batch(agent: ClusteringAgent, embeddings: np.ndarray, offsets: np.ndarray) -> np.ndarray:
+    """
+    Result vectors of a block of persons stacked in `embeddings` (person i owns rows offsets[i]:offsets[i + 1]),
+    in one call when the agent supports batches and one generate_result call per person otherwise.
+    """
+    if getattr(agent, 'generate_results_batch', None) is not None:
+        return agent.generate_results_batch(embeddings, offsets)
+    results = [agent.generate_result(embeddings[offsets[i]:offsets[i + 1]]) for i in range(len(offsets) - 1)]
+    # an empty block still has topic_count columns
+    return np.array(results, dtype=np.uint8).reshape(len(results), agent.topic_count)
@@ -0,0 +1,79 @@
+import queue
+import threading
+from typing import Callable, Iterable
+
+_DONE = object()
+
+def run_pipeline(source: Iterable, stages: list[Callable], depth: int = 2, main_stage: int = None) -> None:
+    """
+    Runs a producer/consumer pipeline connected by bounded queues.
+
+    `source` is iterated on its own thread and every item flows through `stages` in order, each 
+    stage receiving the previous stage's return value. Every stage runs on its own thread except 
+    `stages[main_stage]`, which runs on the calling thread (e.g. for a model or for display updates).
+    Each queue holds at most `depth` items, so a slow stage stalls the ones upstream instead of buffering unboundedly.
+
+    The first exception raised by the source or a stage stops the whole pipeline and is re-raised here.
+    """
+    stop = threading.Event()
+    errors = []
+    queues = [queue.Queue(maxsize=depth) for _ in stages]  # queues[i] feeds stages[i]
+
+    def put(q: queue.Queue, item) -> bool:
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def get(q: queue.Queue):
+        while not stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _DONE
+
+    def guarded(fn: Callable) -> Callable:
+        def run():
+            try:
+                fn()
+            except BaseException as e:
+                errors.append(e)
+                stop.set()
+        return run
+
+    def produce():
+        for item in source:
+            if not put(queues[0], item):
+                return
+        put(queues[0], _DONE)
+
+    def consume(i: int) -> Callable:
+        def run():
+            while True:
+                item = get(queues[i])
+                if item is _DONE:
+                    if i + 1 < len(stages):
+                        put(queues[i + 1], _DONE)
+                    return
+                result = stages[i](item)
+                if i + 1 < len(stages) and not put(queues[i + 1], result):
+                    return
+        return run
+
+    threads = [threading.Thread(target=guarded(produce), daemon=True)]
+    threads += [threading.Thread(target=guarded(consume(i)), daemon=True) for i in range(len(stages)) if i != main_stage]
+    for thread in threads:
+        thread.start()
+
+    if main_stage is not None:
+        guarded(consume(main_stage))()
+
+    for thread in threads:
+        thread.join()
+
+    if errors:
+        raise errors[0]
@@ -0,0 +1,17 @@
+import numpy as np
+
+def segment_ids(offsets: np.ndarray) -> np.ndarray:
+    """
+    For segment offsets [0, o_1, ..., n] of a stacked matrix, returns the segment index of each of its n rows.
+    """
+    offsets = np.asarray(offsets, dtype=np.int64)
+    return np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+
+def segment_one_hot(labels: np.ndarray, offsets: np.ndarray, topic_count: int) -> np.ndarray:
+    """
+    Turns one topic label per stacked row into a (segments, topic_count) binary uint8 matrix,
+    marking every topic any row of a segment was assigned to.
+    """
+    result = np.zeros((len(offsets) - 1, topic_count), dtype=np.uint8)
+    result[segment_ids(offsets), np.asarray(labels, dtype=np.int64)] = 1
+    return result
@@ -0,0 +1,119 @@
+from multiprocessing import shared_memory
+import numpy as np
+from ..embeddings import Embeddings
+
+class SharedEmbeddings:
+    """
+    A read-only copy of an embeddings table in one shared memory block, so several processes train on the
+    same matrix without each re-reading and decoding the table. Offers the read methods clustering agents
+    use on Embeddings (rows are in table order, so samples and epoch batches match the table's), with row
+    positions standing in for the table's ids.
+
+    Layout: the person_id, embedding_id and total_embeddings columns as int64, then the (rows, dim) float32 matrix.
+    """
+
+    def __init__(self, shm: shared_memory.SharedMemory, rows: int, dim: int, owner: bool):
+        self._shm = shm
+        self._owner = owner
+        self.rows = rows
+        self.dim = dim
+
+        columns = np.ndarray((3, rows), dtype=np.int64, buffer=shm.buf)
+        self.person_ids, self.embedding_ids, self.totals = columns
+        self.matrix = np.ndarray((rows, dim), dtype=np.float32, buffer=shm.buf, offset=columns.nbytes)
+        self._person_order = None
+
+    @classmethod
+    def create(cls, embeddings: Embeddings) -> 'SharedEmbeddings':
+        """
+        Copies every embedding of `embeddings` into a new shared memory block. The creator must unlink() it.
+        """
+        cursor = embeddings.conn.cursor()
+        cursor.execute(f"SELECT person_id, embedding_id, total_embeddings FROM {embeddings.table_name} ORDER BY id ASC")
+        columns = np.array(cursor.fetchall(), dtype=np.int64).reshape(-1, 3).T
+        matrix = embeddings.getAllEmbeddings()
+        assert len(matrix) == columns.shape[1], "Embeddings changed while being copied to shared memory"
+
+        rows, dim = matrix.shape
+        shm = shared_memory.SharedMemory(create=True, size=max(columns.nbytes + rows * dim * 4, 1))
+        shared = cls(shm, rows, dim, owner=True)
+        shared.person_ids[:], shared.embedding_ids[:], shared.totals[:] = columns
+        shared.matrix[:] = matrix
+        return shared
+
+    @classmethod
+    def attach(cls, descriptor: tuple[str, int, int]) -> 'SharedEmbeddings':
+        """
+        Maps a block created by the parent process, from its `descriptor`.
+        Children share the parent's resource tracker, so the block is still unlinked exactly once.
+        """
+        name, rows, dim = descriptor
+        return cls(shared_memory.SharedMemory(name=name), rows, dim, owner=False)
+
+    @property
+    def descriptor(self) -> tuple[str, int, int]:
+        return self._shm.name, self.rows, self.dim
+
+    def close(self):
+        # drop the views before the buffer they point into
+        self.person_ids = self.embedding_ids = self.totals = self.matrix = self._person_order = self._sorted_person_ids = None
+        self._shm.close()
+
+    def unlink(self):
+        assert self._owner, "Only the creating process may unlink shared embeddings"
+        self._shm.unlink()
+
+    def getAllEmbeddings(self) -> np.ndarray:
+        return self.matrix
+
+    def getEmbeddingCount(self) -> int:
+        return self.rows
+
+    def getEmbeddingBatch(self, start_row: int, batch_size: int, epoch: int) -> tuple[int, np.ndarray]:
+        """
+        Same as Embeddings.getEmbeddingBatch, with start_row and the returned last row being row positions.
+        """
+        selected = start_row + np.flatnonzero(self.embedding_ids[start_row:] == epoch % self.totals[start_row:])[:batch_size]
+        last_row = int(selected[-1]) if len(selected) > 0 else start_row
+        return last_row, self.matrix[selected]
+
+    def getBalancedSample(self, sample_size: int, seed: int = 0) -> np.ndarray:
+        """
+        Same sample as Embeddings.getBalancedSample on the table this was copied from.
+        """
+        assert sample_size > 0, "sample_size must be positive"
+        rng = np.random.default_rng(seed)
+
+        samples = []
+        remaining = sample_size
+        epoch = 0
+        while remaining > 0:
+            rows = np.flatnonzero(self.embedding_ids == epoch % self.totals)
+            if len(rows) == 0:
+                break
+
+            if len(rows) > remaining:
+                rows = rows[np.sort(rng.choice(len(rows), remaining, replace=False))]
+            samples.append(self.matrix[rows])
+            remaining -= len(rows)
+            epoch += 1
+
+        if len(samples) == 0:
+            return self.matrix[:0]
+        return np.concatenate(samples)
+
+    def getPersonEmbeddingsBlock(self, start_id: int, batch_size: int) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Same as Embeddings.getPersonEmbeddingsBlock: the persons with ids in [start_id, start_id + batch_size).
+        """
+        if self._person_order is None:
+            self._person_order = np.lexsort((self.embedding_ids, self.person_ids))
+            self._sorted_person_ids = self.person_ids[self._person_order]
+        sorted_person_ids = self._sorted_person_ids
+
+        first, last = np.searchsorted(sorted_person_ids, [start_id, start_id + batch_size])
+        rows = self._person_order[first:last]
+        row_person_ids = sorted_person_ids[first:last]
+
+        starts = np.flatnonzero(np.r_[True, row_person_ids[1:] != row_person_ids[:-1]]) if len(rows) > 0 else np.empty(0, dtype=np.int64)
+        return row_person_ids[starts], np.append(starts, len(rows)), self.matrix[rows]
@@ -0,0 +1,66 @@
+import time
+import traceback
+import numpy as np
+from sklearn.metrics import silhouette_score
+from ..prototypes import PersistentClusteringAgent
+from .sharedEmbeddings import SharedEmbeddings
+from .ndarrayAgents import generate_results_batch
+
+def sweep_config(config_id: int, descriptor: tuple[str, int, int], clustering_agent: PersistentClusteringAgent, start_index: int, batch_size: int, evaluation_size: int, silhouette_size: int, out_queue) -> None:
+    """
+    Worker process body of a topic-count sweep. Trains one clustering agent on the shared embedding matrix
+    (unless it arrives trained), scores it, and computes the results of every person from `start_index` onwards.
+    It never touches the database: everything is sent to `out_queue` for the single writer.
+
+    Messages are ('trained', config_id, centers, weights, train_seconds) when the agent was trained here,
+    ('evaluated', config_id, inertia, silhouette), ('results', config_id, next_index, person_ids, results) per block,
+    then ('done', config_id), or ('error', config_id, traceback) if anything fails.
+    """
+    shared = None
+    try:
+        shared = SharedEmbeddings.attach(descriptor)
+
+        if not clustering_agent.is_finished_training():
+            clustering_agent.pass_embeddings(shared)
+            start = time.perf_counter()
+            clustering_agent.train()
+            out_queue.put(('trained', config_id, clustering_agent.get_centers(), clustering_agent.get_center_weights(), time.perf_counter() - start))
+
+        evaluation = shared.getBalancedSample(min(evaluation_size, shared.getEmbeddingCount()), seed=1)
+        out_queue.put(('evaluated', config_id, *evaluate_clustering(clustering_agent, evaluation, silhouette_size)))
+
+        # blocks of `batch_size` persons, whatever gaps there are between their ids
+        person_ids = np.unique(shared.person_ids)
+        person_ids = person_ids[person_ids >= start_index]
+        for block_start in range(0, len(person_ids), batch_size):
+            block_ids = person_ids[block_start:block_start + batch_size]
+            block_person_ids, offsets, embeddings = shared.getPersonEmbeddingsBlock(int(block_ids[0]), int(block_ids[-1] - block_ids[0]) + 1)
+            out_queue.put(('results', config_id, int(block_ids[-1]) + 1, block_person_ids, generate_results_batch(clustering_agent, embeddings, offsets)))
+
+        out_queue.put(('done', config_id))
+    except Exception:
+        out_queue.put(('error', config_id, traceback.format_exc()))
+    finally:
+        if shared is not None:
+            shared.close()
+
+def evaluate_clustering(clustering_agent: PersistentClusteringAgent, sample: np.ndarray, silhouette_size: int) -> tuple[float, float]:
+    """
+    Scores a trained agent on a sample of embeddings, each assigned to a topic by the agent itself.
+
+    Returns:
+        tuple[float, float]: The mean squared distance of the sample to its topics' centers (inertia), and the
+        silhouette coefficient of a random `silhouette_size` of them (None with fewer than two topics in use).
+    """
+    if len(sample) == 0:
+        return None, None
+
+    # one segment per row turns result vectors into labels
+    labels = np.argmax(generate_results_batch(clustering_agent, sample, np.arange(len(sample) + 1)), axis=1)
+    centers = np.asarray(clustering_agent.get_centers(), dtype=np.float32)
+    inertia = float(np.mean(np.sum((sample - centers[labels]) ** 2, axis=1)))
+
+    # the silhouette takes pairwise distances, so it is scored on a subsample
+    used_topics = len(np.unique(labels))
+    silhouette = float(silhouette_score(sample, labels, sample_size=min(silhouette_size, len(sample)), random_state=0)) if 2 <= used_topics < len(sample) else None
+    return inertia, silhouette